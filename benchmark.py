@@ -0,0 +1,269 @@
+#-*- coding: utf-8 -*-
+"""
+Mede o desempenho das operações de Imagem em imagens sintéticas de vários
+tamanhos e compara com uma medição anterior.
+
+Uso:
+    python benchmark.py -t 0.1,1 -s atual.json
+    python benchmark.py -b atual.json
+"""
+import argparse
+import fnmatch
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy
+
+from core import Imagem, PADROES_CINZA, registro_filtros
+
+
+# Tamanhos padrão das imagens sintéticas, em megapixels.
+TAMANHOS = (0.1, 1, 12, 40)
+
+# Proporção largura / altura das imagens sintéticas.
+PROPORCAO = 4.0 / 3
+
+
+def gerar_pixels(megapixels, modo="RGB", semente=0):
+    """
+    Gera uma imagem sintética com gradientes suaves, bordas e ruído, para
+    que os filtros e a equalização trabalhem com dados parecidos com os de
+    uma fotografia.
+    """
+    altura = max(int(round((megapixels * 1e6 / PROPORCAO) ** 0.5)), 8)
+    largura = max(int(round(altura * PROPORCAO)), 8)
+    gerador = numpy.random.default_rng(semente)
+
+    y = numpy.linspace(0, 1, altura, dtype=numpy.float32)[:, numpy.newaxis]
+    x = numpy.linspace(0, 1, largura, dtype=numpy.float32)
+    canais = []
+    for canal in range(3 if modo == "RGB" else 1):
+        fase = gerador.uniform(0, 6.28)
+        tons = 96 + 64 * numpy.sin(6 * x + fase) * numpy.cos(4 * y - fase)
+        tons += numpy.where((x > 0.3) & (x < 0.6) & (y > 0.4), 48, 0)
+        tons += gerador.normal(0, 12, (altura, largura)).astype(numpy.float32)
+        canais.append(numpy.clip(tons, 0, 255).astype(numpy.uint8))
+    if modo == "L":
+        return canais[0]
+    return numpy.stack(canais, axis=2)
+
+
+def listar_operacoes():
+    """
+    :return: [(nome, modo_da_entrada, executar(imagem, secundaria)), ...]
+
+    Lista as operações públicas de Imagem: conversões, equalização,
+    limiarização, cada filtro registrado (core.registro_filtros) e cada
+    operador_*. As conversões para cinza partem de imagens RGB e as demais,
+    de imagens em escala de cinza.
+    """
+    operacoes = [
+        ('converter_escala_cinza:%s' % padrao, "RGB",
+         lambda imagem, _, padrao=padrao:
+             imagem.converter_escala_cinza(padrao))
+        for padrao in PADROES_CINZA
+    ]
+    operacoes += [
+        ('converter_rgb', "L", lambda imagem, _: imagem.converter_rgb()),
+        ('equalizar_imagem', "L", lambda imagem, _: imagem.equalizar_imagem()),
+        ('limiarizar', "L", lambda imagem, _: imagem.limiarizar()),
+    ]
+
+    for nome in registro_filtros.nomes():
+        operacoes.append((
+            'aplicar_filtro:%s' % nome, "L",
+            lambda imagem, _, nome=nome: imagem.aplicar_filtro(nome)
+        ))
+
+    for nome in sorted(dir(Imagem)):
+        if nome.startswith('operador_'):
+            operacoes.append((
+                nome, "L",
+                lambda imagem, secundaria, nome=nome:
+                    getattr(imagem, nome)(secundaria)
+            ))
+    return operacoes
+
+
+def medir(executar, pixels, secundaria, repeticoes, tempo_maximo):
+    """
+    :return: (melhor_tempo_em_segundos, pico_de_memoria_em_bytes)
+
+    Executa a operação sobre cópias novas da imagem. O tempo é o menor de
+    até `repeticoes` execuções (param antes se o total passar de
+    `tempo_maximo` segundos). A memória é medida em uma execução à parte,
+    com o tracemalloc, como o pico alocado além da própria imagem.
+    """
+    tempos = []
+    while len(tempos) < repeticoes and sum(tempos) < tempo_maximo:
+        imagem = Imagem.de_array(pixels)
+        inicio = time.perf_counter()
+        executar(imagem, secundaria)
+        tempos.append(time.perf_counter() - inicio)
+
+    imagem = Imagem.de_array(pixels)
+    tracemalloc.start()
+    try:
+        executar(imagem, secundaria)
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return min(tempos), pico
+
+
+def executar_benchmark(tamanhos=TAMANHOS, padrao='*', repeticoes=3,
+                       tempo_maximo=10.0, relatar=None):
+    """
+    :return: {"<operacao>@<megapixels>": {"segundos", "mp_s", "pico_mb"}}
+
+    Mede as operações cujo nome casa com o padrão (estilo glob) em cada
+    tamanho. `relatar(chave, medida)` é chamada após cada medição.
+    """
+    resultados = {}
+    operacoes = [
+        operacao for operacao in listar_operacoes()
+        if fnmatch.fnmatch(operacao[0], padrao)
+    ]
+    for megapixels in tamanhos:
+        entradas = {}
+        secundaria = None
+        for nome, modo, executar in operacoes:
+            if modo not in entradas:
+                entradas[modo] = gerar_pixels(megapixels, modo)
+            if secundaria is None and nome.startswith('operador_'):
+                secundaria = Imagem.de_array(
+                    gerar_pixels(megapixels, "L", semente=1)
+                )
+
+            pixels = entradas[modo]
+            segundos, pico = medir(
+                executar, pixels, secundaria, repeticoes, tempo_maximo
+            )
+            quantidade = pixels.shape[0] * pixels.shape[1] / 1e6
+            chave = '%s@%g' % (nome, megapixels)
+            resultados[chave] = {
+                'segundos': segundos,
+                'mp_s': quantidade / segundos if segundos else float('inf'),
+                'pico_mb': pico / 2 ** 20,
+            }
+            if relatar is not None:
+                relatar(chave, resultados[chave])
+    return resultados
+
+
+def comparar(resultados, base, tolerancia=0.1):
+    """
+    :return: [(chave, mp_s_base, mp_s_atual), ...]
+
+    Lista as medições em que a vazão caiu mais que a tolerância (fração)
+    em relação à base. Operações ausentes na base são ignoradas.
+    """
+    regressoes = []
+    for chave, medida in sorted(resultados.items()):
+        anterior = base.get(chave)
+        if anterior and medida['mp_s'] < anterior['mp_s'] * (1 - tolerancia):
+            regressoes.append((chave, anterior['mp_s'], medida['mp_s']))
+    return regressoes
+
+
+def get_ambiente():
+    """
+    Descrição da máquina, gravada junto com os resultados.
+    """
+    return {
+        'python': platform.python_version(),
+        'numpy': numpy.__version__,
+        'plataforma': platform.platform(),
+        'processadores': os.cpu_count(),
+    }
+
+
+def main(argumentos=None):
+    """
+    Ponto de entrada da linha de comando.
+    """
+    parser = argparse.ArgumentParser(
+        description=u'Mede o desempenho das operações de Imagem.'
+    )
+    parser.add_argument(
+        '-t', '--tamanhos', default=','.join('%g' % t for t in TAMANHOS),
+        help=u'Tamanhos das imagens em megapixels, separados por vírgula '
+             u'(padrão: %(default)s).'
+    )
+    parser.add_argument(
+        '-o', '--operacoes', default='*',
+        help=u'Padrão (glob) dos nomes das operações, por exemplo '
+             u'"aplicar_filtro:*".'
+    )
+    parser.add_argument(
+        '-r', '--repeticoes', type=int, default=3,
+        help=u'Execuções de cada operação; vale a mais rápida.'
+    )
+    parser.add_argument(
+        '-m', '--tempo-maximo', type=float, default=10.0,
+        help=u'Segundos a partir dos quais uma operação não é repetida.'
+    )
+    parser.add_argument(
+        '-s', '--salvar', default=None,
+        help=u'Arquivo JSON onde os resultados são gravados.'
+    )
+    parser.add_argument(
+        '-b', '--base', default=None,
+        help=u'Arquivo JSON de uma medição anterior para comparação.'
+    )
+    parser.add_argument(
+        '--tolerancia', type=float, default=0.1,
+        help=u'Queda de vazão aceita em relação à base (padrão: 0.1).'
+    )
+    argumentos = parser.parse_args(argumentos)
+
+    try:
+        tamanhos = [float(tamanho) for tamanho in argumentos.tamanhos.split(',')]
+    except ValueError:
+        parser.error(u'Tamanhos inválidos: %s' % argumentos.tamanhos)
+
+    base = None
+    if argumentos.base:
+        with open(argumentos.base) as arquivo:
+            base = json.load(arquivo)['resultados']
+
+    def relatar(chave, medida):
+        anterior = (base or {}).get(chave)
+        comparacao = ''
+        if anterior:
+            comparacao = '  %+6.1f%%' % (
+                100 * (medida['mp_s'] / anterior['mp_s'] - 1)
+            )
+        print('%-40s %9.4f s %9.2f MP/s %9.1f MB%s' % (
+            chave, medida['segundos'], medida['mp_s'], medida['pico_mb'],
+            comparacao
+        ))
+        sys.stdout.flush()
+
+    resultados = executar_benchmark(
+        tamanhos, argumentos.operacoes, argumentos.repeticoes,
+        argumentos.tempo_maximo, relatar
+    )
+
+    if argumentos.salvar:
+        with open(argumentos.salvar, 'w') as arquivo:
+            json.dump(
+                {'ambiente': get_ambiente(), 'resultados': resultados},
+                arquivo, indent=2, sort_keys=True
+            )
+
+    if base is None:
+        return 0
+    regressoes = comparar(resultados, base, argumentos.tolerancia)
+    for chave, anterior, atual in regressoes:
+        print(u'REGRESSÃO %s: %.2f -> %.2f MP/s' % (chave, anterior, atual),
+              file=sys.stderr)
+    return 1 if regressoes else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,130 @@
+#-*- coding: utf-8 -*-
+"""
+Formato intermediário sem compressão para passar imagens entre etapas.
+
+É o PGM (modo "L") ou PPM (modo "RGB") binário com tons de 0 a 255: um
+cabeçalho curto em texto seguido dos pixels uint8, linha a linha. Os
+arquivos são abertos com mmap, sem decodificação nem cópia, e podem ficar
+em /dev/shm para que processos diferentes troquem imagens pela memória.
+"""
+import os
+
+import numpy
+
+
+EXTENSOES_BRUTAS = ('.pgm', '.ppm', '.pnm')
+
+
+def criar_temporario(diretorio, sufixo='.tmp'):
+    """
+    :return: (descritor, caminho) de um arquivo novo e vazio no diretório
+
+    Como tempfile.mkstemp, mas o arquivo recebe as permissões de um open()
+    comum (0666 sem os bits da umask atual, aplicada pelo sistema) em vez
+    de 0600, de modo que o arquivo final, renomeado a partir dele, possa ser
+    lido por outros usuários quando a umask permitir.
+    """
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0)
+    while True:
+        caminho = os.path.join(
+            diretorio, '.%s%s' % (os.urandom(8).hex(), sufixo)
+        )
+        try:
+            return os.open(caminho, flags, 0o666), caminho
+        except FileExistsError:
+            continue
+
+
+def get_cabecalho(largura, altura, modo):
+    """
+    Cabeçalho do arquivo para uma imagem do modo "L" ou "RGB".
+    """
+    return b'%s\n%d %d\n255\n' % (
+        b'P5' if modo == "L" else b'P6', largura, altura
+    )
+
+
+def ler_cabecalho(arquivo):
+    """
+    :return: (largura, altura, modo, posicao_pixels) ou None
+
+    Interpreta o cabeçalho no início do arquivo. Retorna None se ele não
+    estiver no formato (por exemplo, PNM em texto ou com 16 bits).
+    """
+    inicio = arquivo.read(512)
+    campos = []
+    posicao = 0
+    while len(campos) < 4:
+        while posicao < len(inicio) and inicio[posicao:posicao + 1].isspace():
+            posicao += 1
+        if inicio[posicao:posicao + 1] == b'#':
+            posicao = inicio.find(b'\n', posicao)
+            if posicao < 0:
+                return None
+            continue
+        fim = posicao
+        while fim < len(inicio) and not inicio[fim:fim + 1].isspace():
+            fim += 1
+        if fim == posicao or fim == len(inicio):
+            return None
+        campos.append(inicio[posicao:fim])
+        posicao = fim
+
+    magico, largura, altura, maximo = campos
+    if magico not in (b'P5', b'P6') or maximo != b'255':
+        return None
+    try:
+        largura, altura = int(largura), int(altura)
+    except ValueError:
+        return None
+    # Um único espaço separa o cabeçalho dos pixels.
+    return largura, altura, "L" if magico == b'P5' else "RGB", posicao + 1
+
+
+def gravar_bruto(caminho_imagem, pixels):
+    """
+    Grava os pixels no formato. O arquivo é escrito ao lado e renomeado ao
+    final, de modo que outro processo nunca o veja pela metade.
+    """
+    pixels = numpy.ascontiguousarray(pixels, dtype=numpy.uint8)
+    modo = "L" if pixels.ndim == 2 else "RGB"
+    diretorio = os.path.dirname(os.path.abspath(caminho_imagem))
+    descritor, temporario = criar_temporario(diretorio)
+    try:
+        with os.fdopen(descritor, 'wb') as arquivo:
+            arquivo.write(get_cabecalho(pixels.shape[1], pixels.shape[0], modo))
+            arquivo.write(pixels.data)
+        os.replace(temporario, caminho_imagem)
+    except BaseException:
+        os.unlink(temporario)
+        raise
+
+
+def mapear_bruto(caminho_imagem, modo_arquivo='c'):
+    """
+    Retorna os pixels do arquivo como um numpy.memmap, ou None se o arquivo
+    não estiver no formato. Levanta ValueError se o arquivo for menor que o
+    indicado no cabeçalho.
+
+    No modo_arquivo "c" (padrão) as alterações ficam só na memória do
+    processo e o arquivo não muda; em "r+" elas são gravadas no arquivo.
+    """
+    with open(caminho_imagem, 'rb') as arquivo:
+        cabecalho = ler_cabecalho(arquivo)
+    if cabecalho is None:
+        return None
+
+    largura, altura, modo, posicao = cabecalho
+    forma = (altura, largura) if modo == "L" else (altura, largura, 3)
+    esperado = posicao + int(numpy.prod(forma))
+    tamanho = os.path.getsize(caminho_imagem)
+    if tamanho < esperado:
+        raise ValueError(
+            u'Arquivo truncado: %s tem %d bytes, mas o cabeçalho (%dx%d, %s) '
+            u'indica %d' % (caminho_imagem, tamanho, largura, altura, modo,
+                            esperado)
+        )
+    return numpy.memmap(
+        caminho_imagem, dtype=numpy.uint8, mode=modo_arquivo,
+        offset=posicao, shape=forma
+    )
@@ -0,0 +1,154 @@
+#-*- coding: utf-8 -*-
+from collections import OrderedDict
+import hashlib
+import os
+
+import numpy
+
+from bruto import criar_temporario
+
+
+def gerar_chave(*partes):
+    """
+    Resume as partes (arrays ou valores com repr estável) em uma chave
+    hexadecimal. Arrays entram pela forma, pelo tipo e pelo conteúdo.
+    """
+    resumo = hashlib.blake2b(digest_size=20)
+    for parte in partes:
+        if isinstance(parte, numpy.ndarray):
+            resumo.update(repr((parte.shape, parte.dtype.str)).encode('utf-8'))
+            resumo.update(numpy.ascontiguousarray(parte).data)
+        else:
+            resumo.update(repr(parte).encode('utf-8'))
+        resumo.update(b'\0')
+    return resumo.hexdigest()
+
+
+class CacheResultados(object):
+    """
+    Cache dos pixels resultantes de operações, em dois níveis.
+
+    O primeiro nível fica na memória e descarta os resultados usados há
+    mais tempo quando passa de `limite_memoria` bytes. O segundo, opcional,
+    guarda arquivos .npy em `diretorio` e remove os acessados há mais tempo
+    quando passa de `limite_disco` bytes. O diretório pode ser compartilhado
+    entre processos.
+    """
+
+    def __init__(self, limite_memoria=256 * 2 ** 20, diretorio=None,
+                 limite_disco=4 * 2 ** 30):
+        """
+        Inicialização da classe.
+        """
+        self.limite_memoria = limite_memoria
+        self.diretorio = diretorio
+        self.limite_disco = limite_disco
+        self._memoria = OrderedDict()
+        self._bytes_memoria = 0
+        self.acertos = 0
+        self.falhas = 0
+        if diretorio is not None and not os.path.isdir(diretorio):
+            os.makedirs(diretorio)
+
+    def _get_caminho(self, chave):
+        """
+        Arquivo do resultado no disco.
+        """
+        return os.path.join(self.diretorio, chave + '.npy')
+
+    def _guardar_memoria(self, chave, pixels):
+        """
+        Guarda o resultado na memória, descartando os usados há mais tempo.
+        """
+        if pixels.nbytes > self.limite_memoria:
+            return
+        anterior = self._memoria.pop(chave, None)
+        if anterior is not None:
+            self._bytes_memoria -= anterior.nbytes
+        self._memoria[chave] = pixels
+        self._bytes_memoria += pixels.nbytes
+        while self._bytes_memoria > self.limite_memoria:
+            _, descartado = self._memoria.popitem(last=False)
+            self._bytes_memoria -= descartado.nbytes
+
+    def _guardar_disco(self, chave, pixels):
+        """
+        Grava o resultado no disco (de forma atômica) e aplica o limite.
+        """
+        descritor, temporario = criar_temporario(self.diretorio)
+        try:
+            with os.fdopen(descritor, 'wb') as arquivo:
+                numpy.save(arquivo, pixels)
+            os.replace(temporario, self._get_caminho(chave))
+        except BaseException:
+            os.unlink(temporario)
+            raise
+        self._aplicar_limite_disco()
+
+    def _aplicar_limite_disco(self):
+        """
+        Remove os arquivos acessados há mais tempo até caber no limite.
+        """
+        arquivos = []
+        total = 0
+        for entrada in os.scandir(self.diretorio):
+            if entrada.name.endswith('.npy'):
+                estado = entrada.stat()
+                arquivos.append((estado.st_mtime, estado.st_size, entrada.path))
+                total += estado.st_size
+
+        for _, tamanho, caminho in sorted(arquivos):
+            if total <= self.limite_disco:
+                break
+            try:
+                os.unlink(caminho)
+            except OSError:
+                # Já removido por outro processo.
+                pass
+            total -= tamanho
+
+    def obter(self, chave):
+        """
+        Retorna uma cópia dos pixels guardados com a chave ou None.
+        """
+        pixels = self._memoria.get(chave)
+        if pixels is not None:
+            self._memoria.move_to_end(chave)
+        elif self.diretorio is not None:
+            caminho = self._get_caminho(chave)
+            try:
+                pixels = numpy.load(caminho)
+                os.utime(caminho)
+            except (OSError, ValueError):
+                pixels = None
+            if pixels is not None:
+                self._guardar_memoria(chave, pixels)
+
+        if pixels is None:
+            self.falhas += 1
+            return None
+        self.acertos += 1
+        return pixels.copy()
+
+    def guardar(self, chave, pixels):
+        """
+        Guarda uma cópia dos pixels com a chave.
+        """
+        pixels = numpy.array(pixels, copy=True)
+        self._guardar_memoria(chave, pixels)
+        if self.diretorio is not None:
+            self._guardar_disco(chave, pixels)
+
+    def limpar(self):
+        """
+        Descarta os resultados da memória (os do disco são mantidos).
+        """
+        self._memoria.clear()
+        self._bytes_memoria = 0
+
+    @property
+    def tamanho_bytes(self):
+        """
+        Memória ocupada pelos resultados.
+        """
+        return self._bytes_memoria
@@ -1,205 +1,1653 @@
 #-*- coding: utf-8 -*-
-from collections import defaultdict
-from decimal import Decimal
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import wraps
+import inspect
+from multiprocessing import shared_memory
 from PIL import Image
-import operator
+import numpy
+
+from bruto import EXTENSOES_BRUTAS, gravar_bruto, mapear_bruto
+from cache import gerar_chave
+from instrumentacao import instrumentacao
+
+
+def _janelas(canal, altura_janela, largura_janela=None):
+    """
+    Retorna uma visão (sem cópia) com todas as janelas do canal.
+
+    O resultado tem a forma (linhas, colunas, altura_janela, largura_janela)
+    e contém apenas as posições em que a janela cabe inteira na imagem.
+    """
+    largura_janela = largura_janela or altura_janela
+    return numpy.lib.stride_tricks.sliding_window_view(
+        canal, (altura_janela, largura_janela)
+    )
+
+
+# Lado a partir do qual matrizes não separáveis são aplicadas via FFT.
+LIMITE_FFT = 11
+
+# Lado a partir do qual até as matrizes separáveis passam a usar a FFT.
+LIMITE_FFT_SEPARAVEL = 63
+
+
+def _separar(matriz):
+    """
+    :return: (coluna, linha) tais que matriz = outer(coluna, linha), ou None
+
+    Verifica se a matriz é separável (posto 1). O fator é extraído a partir
+    do maior elemento, de forma que matrizes inteiras como Sobel e Prewitt
+    são separadas sem erro de arredondamento.
+    """
+    i, j = numpy.unravel_index(numpy.abs(matriz).argmax(), matriz.shape)
+    if matriz[i, j] == 0:
+        return None
+    coluna = matriz[:, j]
+    linha = matriz[i, :] / matriz[i, j]
+    if not numpy.allclose(numpy.outer(coluna, linha), matriz):
+        return None
+    return coluna, linha
+
+
+def _correlacionar_direto(canal, matriz, saida, parcela):
+    """
+    Correlação acumulando em `saida` uma fatia deslocada do canal por
+    coeficiente não nulo da matriz. `parcela` é um buffer de rascunho com a
+    mesma forma de `saida`.
+    """
+    altura, largura = saida.shape
+    saida.fill(0)
+    for i, j in zip(*numpy.nonzero(matriz)):
+        numpy.multiply(
+            canal[i:i + altura, j:j + largura], matriz[i, j], out=parcela
+        )
+        saida += parcela
+    return saida
+
+
+def _correlacionar_fft(canal, matriz):
+    """
+    Correlação no domínio da frequência, com custo independente do tamanho
+    da matriz.
+    """
+    altura_matriz, largura_matriz = matriz.shape
+    altura, largura = canal.shape
+    forma = (altura + altura_matriz - 1, largura + largura_matriz - 1)
+
+    espectro = numpy.fft.rfft2(canal, forma)
+    espectro *= numpy.fft.rfft2(matriz[::-1, ::-1], forma)
+    return numpy.fft.irfft2(espectro, forma)[
+        altura_matriz - 1:altura, largura_matriz - 1:largura
+    ]
+
+
+def _correlacionar(canal, matriz, rascunhos=None, separavel=True):
+    """
+    Aplica a correlação da matriz (de qualquer tamanho) sobre o canal.
+
+    Com `separavel`, a matriz é testada e, se for separável, aplicada em
+    duas passadas 1-D; matrizes grandes são aplicadas via FFT. Retorna um
+    array float com a região em que a matriz cabe inteira; nos caminhos
+    diretos ele é um buffer de `rascunhos`, válido até a próxima
+    correlação.
+
+    O resultado é arredondado em 9 casas decimais, removendo o ruído
+    numérico que depende da ordem das somas: assim o truncamento feito
+    pelos filtros dá o mesmo tom em todos os caminhos e nas contas exatas.
+    """
+    resultado = _correlacionar_caminho(canal, matriz, rascunhos, separavel)
+    return numpy.around(resultado, 9, out=resultado)
+
+
+def _correlacionar_caminho(canal, matriz, rascunhos=None, separavel=True):
+    """
+    Escolhe e executa o caminho da correlação (ver _correlacionar).
+    """
+    if rascunhos is None:
+        rascunhos = Rascunhos()
+    matriz = numpy.asarray(matriz, dtype=numpy.float64)
+    altura_matriz, largura_matriz = matriz.shape
+    altura = canal.shape[0] - altura_matriz + 1
+    largura = canal.shape[1] - largura_matriz + 1
+    lado = max(matriz.shape)
+
+    fatores = _separar(matriz) if separavel and lado > 1 else None
+    if fatores is not None and lado < LIMITE_FFT_SEPARAVEL:
+        coluna, linha = fatores
+        forma = (altura, canal.shape[1])
+        intermediario = _correlacionar_direto(
+            canal, coluna[:, numpy.newaxis],
+            rascunhos.obter('correlacao_separavel', forma),
+            rascunhos.obter('correlacao_parcela', forma)
+        )
+        forma = (altura, largura)
+        return _correlacionar_direto(
+            intermediario, linha[numpy.newaxis, :],
+            rascunhos.obter('correlacao', forma),
+            rascunhos.obter('correlacao_parcela', forma)
+        )
+    if lado >= LIMITE_FFT:
+        return _correlacionar_fft(canal, matriz)
+    forma = (altura, largura)
+    return _correlacionar_direto(
+        canal, matriz,
+        rascunhos.obter('correlacao', forma),
+        rascunhos.obter('correlacao_parcela', forma)
+    )
+
+
+def _histogramas_deslizantes(canal, raio, rascunhos=None):
+    """
+    Gera, linha a linha, os histogramas de 256 tons de todas as janelas
+    (2 * raio + 1) x (2 * raio + 1) que cabem inteiras na imagem.
+
+    Segue a ideia de Perreault e Hébert: um histograma por coluna é mantido
+    ao longo das linhas (uma inclusão e uma remoção por coluna a cada
+    linha) e o histograma de cada janela é a diferença de duas somas
+    acumuladas desses histogramas. O custo por pixel não depende do raio.
+    Cada item gerado tem a forma (colunas, 256) e é sobrescrito pelo
+    seguinte.
+    """
+    if rascunhos is None:
+        rascunhos = Rascunhos()
+    tamanho = 2 * raio + 1
+    altura, largura = canal.shape
+    indices = numpy.arange(largura)
+
+    # A soma acumulada pode estourar o uint16, mas a diferença entre duas
+    # somas continua correta enquanto a janela tiver menos de 2 ** 16 pixels.
+    tipo = numpy.uint16 if tamanho ** 2 < 2 ** 16 else numpy.int64
+
+    por_coluna = rascunhos.obter('histograma_colunas', (largura, 256), tipo)
+    por_coluna.fill(0)
+    for y in range(tamanho - 1):
+        por_coluna[indices, canal[y]] += 1
+
+    acumulado = rascunhos.obter(
+        'histograma_acumulado', (largura + 1, 256), tipo
+    )
+    acumulado[0] = 0
+    janelas = rascunhos.obter(
+        'histograma_janelas', (largura - tamanho + 1, 256), tipo
+    )
+    for y in range(tamanho - 1, altura):
+        por_coluna[indices, canal[y]] += 1
+        numpy.cumsum(por_coluna, axis=0, out=acumulado[1:])
+        yield numpy.subtract(
+            acumulado[tamanho:], acumulado[:-tamanho], out=janelas
+        )
+        por_coluna[indices, canal[y - tamanho + 1]] -= 1
+
+
+def _somas_janelas(canal, raio, rascunhos=None, quadrados=False,
+                   nome='somas_janelas'):
+    """
+    Soma dos tons (ou dos quadrados dos tons) de cada janela
+    (2 * raio + 1) x (2 * raio + 1) que cabe inteira na imagem.
+
+    As somas acumuladas nas duas direções formam a imagem integral: cada
+    soma é a diferença de duas acumuladas, com custo por pixel constante em
+    relação ao raio. O resultado (int64) fica no buffer de rascunho `nome`.
+    """
+    if rascunhos is None:
+        rascunhos = Rascunhos()
+    tamanho = 2 * raio + 1
+    altura, largura = canal.shape
+    linhas = altura - tamanho + 1
+    colunas = largura - tamanho + 1
+
+    valores = canal
+    if quadrados:
+        valores = rascunhos.obter('quadrados', canal.shape, numpy.int64)
+        numpy.multiply(canal, canal, out=valores, dtype=numpy.int64)
+
+    acumulado = rascunhos.obter(
+        'acumulado_linhas', (altura + 1, largura), numpy.int64
+    )
+    acumulado[0] = 0
+    numpy.cumsum(valores, axis=0, dtype=numpy.int64, out=acumulado[1:])
+    verticais = rascunhos.obter(
+        'somas_verticais', (linhas, largura), numpy.int64
+    )
+    numpy.subtract(acumulado[tamanho:], acumulado[:-tamanho], out=verticais)
+
+    acumulado = rascunhos.obter(
+        'acumulado_colunas', (linhas, largura + 1), numpy.int64
+    )
+    acumulado[:, 0] = 0
+    numpy.cumsum(verticais, axis=1, out=acumulado[:, 1:])
+    somas = rascunhos.obter(nome, (linhas, colunas), numpy.int64)
+    return numpy.subtract(
+        acumulado[:, tamanho:], acumulado[:, :-tamanho], out=somas
+    )
+
+
+def _extremos_deslizantes(valores, tamanho, funcao, neutro, eixo):
+    """
+    Mínimo ou máximo (`funcao` = numpy.minimum ou numpy.maximum) de cada
+    janela de `tamanho` posições ao longo do eixo, pelo algoritmo de van
+    Herk e Gil-Werman.
+
+    O eixo é dividido em blocos de `tamanho` posições e, em cada bloco, são
+    calculados os extremos acumulados da esquerda para a direita (g) e da
+    direita para a esquerda (h). Cada janela cobre o final de um bloco e o
+    início do seguinte, de modo que seu extremo é funcao(h[i], g[i +
+    tamanho - 1]): três comparações por pixel, seja qual for o tamanho.
+    `neutro` preenche o último bloco incompleto.
+    """
+    valores = numpy.moveaxis(valores, eixo, -1)
+    quantidade = valores.shape[-1]
+    blocos = -(-quantidade // tamanho)
+
+    preenchidos = numpy.full(
+        valores.shape[:-1] + (blocos, tamanho), neutro, dtype=valores.dtype
+    )
+    preenchidos.reshape(valores.shape[:-1] + (-1,))[..., :quantidade] = valores
+    g = funcao.accumulate(preenchidos, axis=-1)
+    h = funcao.accumulate(preenchidos[..., ::-1], axis=-1)[..., ::-1]
+
+    forma = valores.shape[:-1] + (-1,)
+    resultado = funcao(
+        h.reshape(forma)[..., :quantidade - tamanho + 1],
+        g.reshape(forma)[..., tamanho - 1:quantidade]
+    )
+    return numpy.moveaxis(resultado, -1, eixo)
+
+
+# Normas aceitas na magnitude do gradiente.
+NORMAS_GRADIENTE = ('l1', 'l2')
+
+# tan(22,5°): fronteira entre os setores horizontal, diagonal e vertical
+# quando a direção do gradiente é quantizada em 4 setores.
+TANGENTE_SETOR = 0.41421356
+
+
+def _separar_inteira(matriz):
+    """
+    :return: (coluna, linha) de inteiros tais que matriz = outer(coluna,
+    linha), ou None
+
+    Como _separar, mas mantém os fatores inteiros (a linha é dividida pelo
+    seu máximo divisor comum), para que a correlação seja feita em int16.
+    """
+    linhas = [linha for linha in matriz if linha.any()]
+    if not linhas:
+        return None
+    linha = linhas[0] // numpy.gcd.reduce(numpy.abs(linhas[0]))
+    j = numpy.flatnonzero(linha)[0]
+    coluna = matriz[:, j] // linha[j]
+    if not numpy.array_equal(numpy.outer(coluna, linha), matriz):
+        return None
+    return coluna, linha
+
+
+def _acumular(saida, termos, parcela):
+    """
+    Grava em `saida` a soma de coeficiente * termo, no tipo de `saida`.
+    Coeficientes 1 e -1 viram somas e subtrações diretas; os demais usam o
+    buffer `parcela`.
+    """
+    tipo = saida.dtype
+    for indice, (coeficiente, termo) in enumerate(termos):
+        if indice == 0:
+            numpy.multiply(termo, coeficiente, out=saida, dtype=tipo)
+        elif coeficiente == 1:
+            numpy.add(saida, termo, out=saida, dtype=tipo)
+        elif coeficiente == -1:
+            numpy.subtract(saida, termo, out=saida, dtype=tipo)
+        else:
+            numpy.multiply(termo, coeficiente, out=parcela, dtype=tipo)
+            numpy.add(saida, parcela, out=saida)
+
+
+def _correlacionar_inteiro(canal, matriz, saida, rascunhos, nome):
+    """
+    Correlação do canal (uint8) com uma matriz de inteiros pequenos,
+    calculada em int16 na região em que a matriz cabe inteira. Matrizes
+    separáveis, como as de Sobel e Prewitt, são aplicadas em uma passada
+    nas colunas e outra nas linhas.
+    """
+    matriz = numpy.asarray(matriz, dtype=numpy.int64)
+    altura, largura = saida.shape
+    parcela = rascunhos.obter(nome + '_parcela', saida.shape, numpy.int16)
+    separada = _separar_inteira(matriz)
+    if separada is None:
+        _acumular(saida, [
+            (int(matriz[i, j]), canal[i:i + altura, j:j + largura])
+            for i, j in zip(*numpy.nonzero(matriz))
+        ], parcela)
+        return saida
+
+    coluna, linha = separada
+    verticais = rascunhos.obter(
+        nome + '_verticais', (altura, canal.shape[1]), numpy.int16
+    )
+    _acumular(verticais, [
+        (int(coeficiente), canal[i:i + altura])
+        for i, coeficiente in enumerate(coluna) if coeficiente
+    ], rascunhos.obter(nome + '_linhas', verticais.shape, numpy.int16))
+    _acumular(saida, [
+        (int(coeficiente), verticais[:, j:j + largura])
+        for j, coeficiente in enumerate(linha) if coeficiente
+    ], parcela)
+    return saida
+
+
+def _gradiente(canal, matriz_x, matriz_y, norma='l2', direcoes=None,
+               rotacao=0, rascunhos=None):
+    """
+    :return: (magnitude, orientacao)
+
+    Calcula Gx e Gy a partir do próprio canal, uma única vez cada, e deles a
+    magnitude do gradiente: |Gx| + |Gy| (int16) na norma "l1" ou
+    sqrt(Gx² + Gy²) (float32) na "l2". Os resultados cobrem a região em que
+    as matrizes cabem inteiras e ficam em buffers de rascunho.
+
+    Com `direcoes`, a orientacao (uint8) é a direção do gradiente em
+    `direcoes` setores iguais de 180 graus, contados no sentido anti-horário
+    a partir da horizontal: com 4 setores, 0 = 0°, 1 = 45°, 2 = 90° e
+    3 = 135°, como na supressão de não máximos do Canny. `rotacao` é o
+    ângulo, em graus, do eixo medido pela matriz_x (45 nas matrizes
+    diagonais de Roberts). Sem `direcoes`, a orientacao é None.
+    """
+    if norma not in NORMAS_GRADIENTE:
+        raise ValueError(
+            u'Norma inválida: %s (use %s)'
+            % (norma, ', '.join(NORMAS_GRADIENTE))
+        )
+    if rascunhos is None:
+        rascunhos = Rascunhos()
+    tamanho = len(matriz_x)
+    forma = (canal.shape[0] - tamanho + 1, canal.shape[1] - tamanho + 1)
+
+    gx = _correlacionar_inteiro(
+        canal, matriz_x,
+        rascunhos.obter('gradiente_x', forma, numpy.int16),
+        rascunhos, 'gradiente'
+    )
+    gy = _correlacionar_inteiro(
+        canal, matriz_y,
+        rascunhos.obter('gradiente_y', forma, numpy.int16),
+        rascunhos, 'gradiente'
+    )
+
+    orientacao = None
+    if direcoes == 4:
+        # Cada pixel recebe um código de 3 bits: Gx e Gy com o mesmo sinal
+        # (4), gradiente quase vertical (2) e quase horizontal (1), que é
+        # convertido no setor por uma tabela.
+        codigo = rascunhos.obter('gradiente_codigo', forma, numpy.uint8)
+        numpy.greater_equal(
+            numpy.bitwise_xor(gx, gy, out=rascunhos.obter(
+                'gradiente_sinal', forma, numpy.int16
+            )), 0, out=codigo
+        )
+    elif direcoes:
+        angulo = rascunhos.obter('gradiente_angulo', forma, numpy.float32)
+        numpy.arctan2(gy, gx, out=angulo, dtype=numpy.float32)
+        angulo *= direcoes / numpy.pi
+        angulo += rotacao * direcoes / 180.0
+        numpy.rint(angulo, out=angulo)
+        numpy.mod(angulo, direcoes, out=angulo)
+        orientacao = rascunhos.obter('orientacao', forma, numpy.uint8)
+        orientacao[...] = angulo
+
+    numpy.abs(gx, out=gx)
+    numpy.abs(gy, out=gy)
+    if direcoes == 4:
+        limite = rascunhos.obter('gradiente_limite', forma, numpy.float32)
+        setor = rascunhos.obter('gradiente_setor', forma, numpy.uint8)
+        for menor, maior in ((gx, gy), (gy, gx)):
+            numpy.multiply(maior, TANGENTE_SETOR, out=limite,
+                           dtype=numpy.float32)
+            numpy.less_equal(menor, limite, out=setor)
+            numpy.add(codigo, codigo, out=codigo)
+            codigo += setor
+        # Setores antes da rotação: horizontal 0, vertical 2 e, nas
+        # diagonais, 1 com o mesmo sinal e 3 com sinais opostos. A rotação
+        # de Roberts (45°) soma um setor.
+        deslocamento = int(round(rotacao / 45.0))
+        tabela = (
+            numpy.array([3, 0, 2, 0, 1, 0, 2, 0]) + deslocamento
+        ) % 4
+        orientacao = rascunhos.obter('orientacao', forma, numpy.uint8)
+        numpy.take(tabela.astype(numpy.uint8), codigo, out=orientacao)
+
+    if norma == 'l1':
+        magnitude = rascunhos.obter('magnitude', forma, numpy.int16)
+        numpy.add(gx, gy, out=magnitude)
+    else:
+        # Mais rápido que numpy.hypot; os quadrados são exatos em float32.
+        magnitude = rascunhos.obter('magnitude', forma, numpy.float32)
+        quadrados = rascunhos.obter(
+            'gradiente_quadrados', forma, numpy.float32
+        )
+        numpy.multiply(gx, gx, out=magnitude, dtype=numpy.float32)
+        numpy.multiply(gy, gy, out=quadrados, dtype=numpy.float32)
+        magnitude += quadrados
+        numpy.sqrt(magnitude, out=magnitude)
+    return magnitude, orientacao
+
+
+def _soma_saturada(a, b, saida):
+    """
+    a + b limitado a 255.
+    """
+    numpy.add(a, b, out=saida)
+    numpy.putmask(saida, saida < b, 255)
+
+
+def _subtracao_saturada(a, b, saida):
+    """
+    a - b limitado a 0.
+    """
+    negativos = a < b
+    numpy.subtract(a, b, out=saida)
+    numpy.putmask(saida, negativos, 0)
+
+
+def _diferenca_absoluta(a, b, saida):
+    """
+    |a - b|.
+    """
+    maiores = numpy.maximum(a, b)
+    numpy.minimum(a, b, out=saida)
+    numpy.subtract(maiores, saida, out=saida)
+
+
+def _multiplicacao(a, b, saida):
+    """
+    a * b / 255, arredondado.
+    """
+    produto = a.astype(numpy.uint16)
+    produto *= b
+    produto += 127
+    numpy.floor_divide(produto, 255, out=saida, casting='unsafe')
+
+
+def _mistura(a, b, saida, alfa=0.5):
+    """
+    (1 - alfa) * a + alfa * b, em ponto fixo com 8 bits de fração. O alfa
+    deve estar entre 0 e 1.
+    """
+    if not 0 <= alfa <= 1:
+        raise ValueError(u'Alfa fora do intervalo [0, 1]: %s' % alfa)
+    peso = int(round(alfa * 256))
+    mistura = a.astype(numpy.uint16)
+    mistura *= 256 - peso
+    mistura += b.astype(numpy.uint16) * peso
+    mistura += 128
+    numpy.right_shift(mistura, 8, out=saida, casting='unsafe')
+
+
+# Operações binárias de Imagem.operar. Cada uma recebe dois planos uint8 de
+# mesma forma e grava o resultado em `saida`, que pode ser o próprio `a`.
+OPERACOES = {
+    'and': lambda a, b, saida: numpy.bitwise_and(a, b, out=saida),
+    'or': lambda a, b, saida: numpy.bitwise_or(a, b, out=saida),
+    'xor': lambda a, b, saida: numpy.bitwise_xor(a, b, out=saida),
+    'soma': _soma_saturada,
+    'subtracao': _subtracao_saturada,
+    'diferenca': _diferenca_absoluta,
+    'multiplicacao': _multiplicacao,
+    'mistura': _mistura,
+    'minimo': lambda a, b, saida: numpy.minimum(a, b, out=saida),
+    'maximo': lambda a, b, saida: numpy.maximum(a, b, out=saida),
+}
+
+# Posição da imagem secundária em Imagem.operar, como fração (em metades) da
+# diferença de tamanho entre as duas imagens.
+ALINHAMENTOS = {
+    'superior_esquerdo': 0,
+    'centro': 1,
+    'inferior_direito': 2,
+}
+
+
+# Padrões de conversão para cinza: pesos (r, g, b) em ponto fixo, bits do
+# deslocamento final e parcela somada antes dele para arredondar. O
+# "classico" são os pesos históricos 0.3, 0.59 e 0.11 com truncamento:
+# (30 * r + 59 * g + 11 * b) // 100, com a divisão trocada por uma
+# multiplicação e um deslocamento exatos para tons de 8 bits.
+PESOS_CINZA = {
+    'classico': (157290, 309337, 57673, 19, 0),
+    'bt601': (19595, 38470, 7471, 16, 2 ** 15),
+    'bt709': (13933, 46871, 4732, 16, 2 ** 15),
+    'media': (21845, 21845, 21845, 16, 2 ** 15),
+}
+# "luminosidade" é (maior + menor) / 2 dos três canais, arredondado.
+PADROES_CINZA = tuple(sorted(PESOS_CINZA)) + ('luminosidade',)
+PADRAO_CINZA = 'classico'
+
+
+def _escala_cinza(rgb, saida, padrao=PADRAO_CINZA, rascunhos=None):
+    """
+    Grava em `saida` os tons de cinza do array (..., 3) `rgb` conforme o
+    padrão (ver PESOS_CINZA), usando apenas inteiros de 32 bits.
+    """
+    if padrao not in PADROES_CINZA:
+        raise ValueError(u'Padrão de cinza inválido: %s' % padrao)
+    if rascunhos is None:
+        rascunhos = Rascunhos()
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    acumulado = rascunhos.obter('cinza_acumulado', saida.shape, numpy.uint32)
+
+    if padrao == 'luminosidade':
+        extremo = rascunhos.obter('cinza_extremo', saida.shape, numpy.uint8)
+        numpy.maximum(numpy.maximum(r, g, out=extremo), b, out=extremo)
+        numpy.add(extremo, 1, out=acumulado, dtype=numpy.uint32)
+        numpy.minimum(numpy.minimum(r, g, out=extremo), b, out=extremo)
+        acumulado += extremo
+        acumulado >>= 1
+        saida[...] = acumulado
+        return
+
+    peso_r, peso_g, peso_b, deslocamento, arredondamento = PESOS_CINZA[padrao]
+    parcela = rascunhos.obter('cinza_parcela', saida.shape, numpy.uint32)
+    numpy.multiply(r, numpy.uint32(peso_r), out=acumulado)
+    acumulado += numpy.multiply(g, numpy.uint32(peso_g), out=parcela)
+    acumulado += numpy.multiply(b, numpy.uint32(peso_b), out=parcela)
+    if arredondamento:
+        acumulado += numpy.uint32(arredondamento)
+    acumulado >>= deslocamento
+    saida[...] = acumulado
+
+
+def _get_modo(pixels):
+    """
+    Modo de um array de pixels: "L" para (altura, largura) ou "RGB".
+    """
+    return "L" if pixels.ndim == 2 else "RGB"
+
+
+def _adiavel(metodo):
+    """
+    Decora operações de Imagem que, no modo preguiçoso, são apenas
+    registradas e executadas depois por Imagem.computar.
+    """
+    @wraps(metodo)
+    def registrar_ou_executar(imagem, *args, **kwargs):
+        if imagem.preguicosa and not imagem._computando:
+            imagem._pendentes.append((metodo.__name__, args, kwargs))
+            return None
+        return metodo(imagem, *args, **kwargs)
+    return registrar_ou_executar
+
+
+# Nome da medição de cada método, quando difere do nome do método, e
+# parâmetro (posição, nome) que completa o nome da medição.
+NOMES_MEDICAO = {
+    '__init__': 'carregar',
+    '_computar_pontuais': 'pontuais',
+    '_gravar_arquivo': 'salvar',
+    '_contar_canais': 'contar_tons',
+}
+DETALHES_MEDICAO = {
+    'aplicar_filtro': (0, 'nome_filtro'),
+    'aplicar_logico': (0, 'operador'),
+    'operar': (1, 'operacao'),
+}
+
+
+def _instrumentado(metodo):
+    """
+    Decora operações de Imagem medidas pela instrumentação (ver
+    instrumentacao.py) enquanto ela está ativa.
+    """
+    nome = NOMES_MEDICAO.get(metodo.__name__, metodo.__name__)
+
+    @wraps(metodo)
+    def medir_e_executar(imagem, *args, **kwargs):
+        if not instrumentacao.ativa:
+            return metodo(imagem, *args, **kwargs)
+
+        operacao = nome
+        if metodo.__name__ in DETALHES_MEDICAO:
+            posicao, parametro = DETALHES_MEDICAO[metodo.__name__]
+            if len(args) > posicao:
+                operacao += ':%s' % args[posicao]
+            elif parametro in kwargs:
+                operacao += ':%s' % kwargs[parametro]
+        elif metodo.__name__ == '_computar_pontuais':
+            operacao += ':' + '+'.join(item[0] for item in args[0])
+
+        with instrumentacao.medir(operacao, lambda: imagem.quantidade_pixels):
+            return metodo(imagem, *args, **kwargs)
+    return medir_e_executar
+
+
+def _memorizavel(metodo):
+    """
+    Decora operações de Imagem cujo resultado depende apenas dos pixels e
+    dos parâmetros: se a imagem tiver um cache (Imagem.cache), o resultado
+    é procurado nele antes de executar a operação e guardado depois. Os
+    filtros pontuais não passam pelo cache.
+    """
+    @wraps(metodo)
+    def consultar_ou_executar(imagem, *args, **kwargs):
+        # Uma tabela de 256 tons custa menos que o resumo dos pixels.
+        if (imagem.cache is None or
+                metodo.__name__ == 'aplicar_filtro' and
+                eh_pontual(metodo.__name__, args, kwargs)):
+            return metodo(imagem, *args, **kwargs)
+
+        chave = imagem._get_chave_cache(metodo.__name__, args, kwargs)
+        pixels = imagem.cache.obter(chave)
+        if pixels is not None:
+            imagem.pixels = pixels
+            return None
+        resultado = metodo(imagem, *args, **kwargs)
+        imagem.cache.guardar(chave, imagem.pixels)
+        return resultado
+    return consultar_ou_executar
+
+
+# Operações de Imagem que dependem apenas do tom de cada pixel e que,
+# portanto, podem ser compostas em uma única tabela no modo preguiçoso. Os
+# filtros registrados como pontuais também são (ver eh_pontual).
+OPERACOES_PONTUAIS = (
+    'converter_escala_cinza', 'equalizar_imagem', 'limiarizar',
+    'aplicar_tabela',
+)
+
+
+def eh_pontual(nome, args, kwargs):
+    """
+    Indica se a chamada do método `nome` de Imagem depende apenas do tom de
+    cada pixel: as operações de OPERACOES_PONTUAIS e as aplicações de
+    filtros registrados como pontuais.
+    """
+    if nome == 'aplicar_filtro':
+        try:
+            descricao, _ = registro_filtros.vincular(args, kwargs)
+        except TypeError:
+            # Argumentos inválidos: o erro é levantado pela própria chamada.
+            return False
+        return descricao is not None and descricao.pontual
+    return nome in OPERACOES_PONTUAIS
+
+# Quantidade aproximada de bytes processados por bloco nas operações
+# pontuais fundidas; um bloco desse tamanho cabe na cache.
+TAMANHO_BLOCO = 2 ** 20
+
+
+class OperacaoCancelada(Exception):
+    """
+    Levantada dentro de uma operação quando Imagem.cancelar é chamada.
+    Os pixels da imagem não são alterados.
+    """
+
+
+class Rascunhos(object):
+    """
+    Buffers de rascunho de uma imagem, reaproveitados entre as operações.
+
+    Cada buffer é um array plano identificado por um nome; ele só é
+    realocado quando a operação pede mais espaço ou outro tipo de dado.
+    """
+
+    def __init__(self):
+        """
+        Inicialização da classe.
+        """
+        self._buffers = {}
+
+    def obter(self, nome, forma, tipo=numpy.float64):
+        """
+        Retorna uma visão com a forma pedida do buffer `nome`. O conteúdo não
+        é inicializado.
+        """
+        tipo = numpy.dtype(tipo)
+        tamanho = int(numpy.prod(forma))
+        buffer = self._buffers.get(nome)
+        if buffer is None or buffer.dtype != tipo or buffer.size < tamanho:
+            buffer = numpy.empty(tamanho, dtype=tipo)
+            self._buffers[nome] = buffer
+        return buffer[:tamanho].reshape(forma)
+
+    def liberar(self):
+        """
+        Descarta todos os buffers.
+        """
+        self._buffers.clear()
+
+    @property
+    def tamanho_bytes(self):
+        """
+        Memória ocupada pelos buffers.
+        """
+        return sum(buffer.nbytes for buffer in self._buffers.values())
+
+
+def _processar_faixa(nome_entrada, nome_saida, forma, inicio, fim, margem,
+                     nome_filtro, args, kwargs):
+    """
+    Aplica o filtro em uma faixa de linhas [inicio, fim) da imagem que está
+    na memória compartilhada, lendo também `margem` linhas de cada lado, e
+    grava somente as linhas da faixa na saída. Sem `nome_saida`, as linhas
+    são gravadas sobre a própria entrada.
+    """
+    entrada = shared_memory.SharedMemory(name=nome_entrada)
+    saida = entrada
+    if nome_saida is not None:
+        saida = shared_memory.SharedMemory(name=nome_saida)
+    try:
+        canal = numpy.ndarray(forma, dtype=numpy.uint8, buffer=entrada.buf)
+        canal_saida = numpy.ndarray(forma, dtype=numpy.uint8, buffer=saida.buf)
+
+        inicio_halo = max(inicio - margem, 0)
+        fim_halo = min(fim + margem, forma[0])
+        faixa = Imagem.de_array(canal[inicio_halo:fim_halo])
+        faixa.aplicar_filtro(nome_filtro, *args, **kwargs)
+
+        canal_saida[inicio:fim] = faixa.get_canal_cinza()[
+            inicio - inicio_halo:fim - inicio_halo
+        ]
+    finally:
+        entrada.close()
+        if saida is not entrada:
+            saida.close()
+
+
+def _executar_em_faixas(canal, margem, processos, nome_filtro, args, kwargs,
+                        progredir=None, no_lugar=False):
+    """
+    Divide o canal em faixas horizontais e aplica o filtro em paralelo, uma
+    faixa por tarefa, usando memória compartilhada para a entrada e a saída.
+
+    Cada faixa é lida com `margem` linhas extras (o raio do filtro) acima e
+    abaixo, de modo que o resultado montado é igual ao da imagem inteira.
+    Com `no_lugar` e sem margem, nenhuma faixa lê as linhas das outras e o
+    resultado é gravado sobre a entrada, sem memória para a saída.
+    `progredir(linhas_feitas, total)` é chamada a cada faixa concluída.
+    """
+    altura = canal.shape[0]
+    altura_faixa = max(-(-altura // processos), 2 * margem + 1)
+
+    entrada = shared_memory.SharedMemory(create=True, size=canal.nbytes)
+    saida = entrada
+    if not (no_lugar and margem == 0):
+        saida = shared_memory.SharedMemory(create=True, size=canal.nbytes)
+    nome_saida = None if saida is entrada else saida.name
+    try:
+        numpy.ndarray(canal.shape, dtype=numpy.uint8, buffer=entrada.buf)[:] = canal
+        with ProcessPoolExecutor(max_workers=processos) as executor:
+            tarefas = {
+                executor.submit(
+                    _processar_faixa, entrada.name, nome_saida, canal.shape,
+                    inicio, min(inicio + altura_faixa, altura), margem,
+                    nome_filtro, args, kwargs
+                ): min(altura_faixa, altura - inicio)
+                for inicio in range(0, altura, altura_faixa)
+            }
+            feitas = 0
+            try:
+                for tarefa in as_completed(tarefas):
+                    tarefa.result()
+                    feitas += tarefas[tarefa]
+                    if progredir is not None:
+                        progredir(feitas, altura)
+            except BaseException:
+                for tarefa in tarefas:
+                    tarefa.cancel()
+                raise
+        return numpy.ndarray(
+            canal.shape, dtype=numpy.uint8, buffer=saida.buf
+        ).copy()
+    finally:
+        entrada.close()
+        entrada.unlink()
+        if saida is not entrada:
+            saida.close()
+            saida.unlink()
 
 
 class Imagem(object):
     """
     Abstração de uma Imagem.
+
+    Os pixels ficam em um array contíguo do numpy do tipo uint8, com a forma
+    (altura, largura) no modo "L" (escala de cinza) ou (altura, largura, 3)
+    no modo "RGB".
+
+    No modo preguiçoso (preguicosa=True) as operações são apenas registradas
+    e só são executadas em `computar` ou `salvar`. Nesse momento as
+    operações pontuais consecutivas são fundidas em uma única passada.
+
+    As operações longas informam o andamento a `ao_progredir(feitas, total)`
+    e podem ser interrompidas de outra thread com `cancelar`. Quando a
+    instrumentação está ativa (ver instrumentacao.py), cada operação tem
+    seu tempo e sua memória medidos.
+
+    Arquivos PGM/PPM binários (ver bruto.py) são mapeados na memória em
+    vez de decodificados; as alterações nos pixels não afetam o arquivo.
+
+    Com um `cache` (cache.CacheResultados), os filtros, a equalização e os
+    operadores reaproveitam resultados já calculados para os mesmos pixels
+    e parâmetros.
     """
 
-    def __init__(self, caminho_imagem, *args, **kwargs):
+    @_instrumentado
+    def __init__(self, caminho_imagem, modo=None, preguicosa=False,
+                 *args, **kwargs):
         """
         Inicialização da classe.
+
+        Imagens que já estão em escala de cinza são carregadas no modo "L";
+        as demais são convertidas para "RGB", a menos que o modo seja
+        informado.
         """
         self.caminho_imagem = caminho_imagem
-        self.imagem = Image.open(caminho_imagem).convert("RGB")
-        self.pixels = self.imagem.load()
-        self.filtros = [
-            Filtros(imagem=self),
-            PassaAlta(imagem=self),
-            Mediana(imagem=self),
-            Moda(imagem=self),
-            Robert(imagem=self),
-            Sobel(imagem=self),
-            Prewitt(imagem=self)
-        ]
+        pixels = None
+        if caminho_imagem.lower().endswith(EXTENSOES_BRUTAS):
+            pixels = mapear_bruto(caminho_imagem)
+            if pixels is not None and modo not in (None, _get_modo(pixels)):
+                pixels = None
+
+        if pixels is None:
+            imagem = Image.open(caminho_imagem)
+            if modo is None:
+                modo = "L" if imagem.mode in ("1", "L") else "RGB"
+            pixels = numpy.array(imagem.convert(modo), dtype=numpy.uint8)
+        self._iniciar(pixels)
+        self.preguicosa = preguicosa
+        super(Imagem, self).__init__(*args, **kwargs)
 
-        try:
-            self.imagem.width, self.imagem.height = self.imagem.size
-        except AttributeError:
-            pass
+    @classmethod
+    def de_array(cls, pixels, caminho_imagem=None):
+        """
+        Cria uma imagem a partir de um array (altura, largura) ou
+        (altura, largura, 3), sem passar pelo disco.
+        """
+        imagem = cls.__new__(cls)
+        imagem.caminho_imagem = caminho_imagem
+        imagem._iniciar(numpy.array(pixels, dtype=numpy.uint8))
+        return imagem
 
-        self.quantidade_pixels = (
-            Decimal(self.imagem.height * self.imagem.width)
-        )
-        super(Imagem, self).__init__(*args, **kwargs)
+    def _iniciar(self, pixels):
+        """
+        Define os pixels. Os filtros são instanciados no primeiro uso.
+        """
+        self.pixels = pixels
+        self.rascunhos = Rascunhos()
+        self.preguicosa = False
+        self._pendentes = []
+        self._computando = False
+        self.ao_progredir = None
+        self.cancelada = False
+        self.cache = None
+        self._filtros = {}
+
+    def cancelar(self):
+        """
+        Pede a interrupção da operação em andamento, que levanta
+        OperacaoCancelada no próximo ponto de verificação.
+        """
+        self.cancelada = True
 
-    def _get_xy(self, x_inicio=0, y_inicio=0, x_final=None, y_final=None):
+    def _progredir(self, feitas, total):
         """
-        Retorna um generator das coordenadas (x, y) da imagem.
+        Ponto de verificação das operações longas: informa o andamento e
+        interrompe a operação se ela tiver sido cancelada.
         """
-        x_final = x_final or self.imagem.width
-        y_final = y_final or self.imagem.height
+        if self.cancelada:
+            self.cancelada = False
+            raise OperacaoCancelada()
+        if self.ao_progredir is not None:
+            self.ao_progredir(feitas, total)
+
+    @property
+    def pixels(self):
+        """
+        Array dos pixels da imagem.
+        """
+        return self._pixels
 
-        for x in range(x_inicio, x_final):
-            for y in range(y_inicio, y_final):
-                yield (x, y)
+    @pixels.setter
+    def pixels(self, pixels):
+        """
+        Substitui os pixels, descartando os histogramas já calculados.
+        """
+        self._pixels = pixels
+        self._contagens = None
 
-    def _get_yx(self, x_inicio=0, y_inicio=0, x_final=None, y_final=None):
+    def _descartar_contagens(self):
         """
-        Retorna um generator das coordenadas (x, y) da imagem.
+        Descarta os histogramas já calculados. Deve ser chamada por quem
+        alterar o array de pixels no lugar, sem atribuir um novo.
         """
-        x_final = x_final or self.imagem.width
-        y_final = y_final or self.imagem.height
+        self._contagens = None
 
-        for y in range(y_inicio, y_final):
-            for x in range(x_inicio, x_final):
-                yield (x, y)
+    @property
+    def largura(self):
+        """
+        Largura da imagem em pixels.
+        """
+        return self.pixels.shape[1]
 
-    def _get_probabilidades(self, histograma):
+    @property
+    def altura(self):
         """
-        Retorna as probabilidades para cada nível de cinza do histograma da
-        imagem original.
+        Altura da imagem em pixels.
         """
-        probabilidades = defaultdict(lambda: 0)
-        for tom_cinza, quantidade in histograma.iteritems():
-            probabilidades[tom_cinza] = quantidade / self.quantidade_pixels
-        return probabilidades
+        return self.pixels.shape[0]
 
-    def _get_novos_tons_cinza(self, probabilidades):
+    @property
+    def modo(self):
+        """
+        Modo da imagem: "L" para escala de cinza ou "RGB".
         """
-        :return: Um dicionário do tipo: {tom_cinza: novo_tom_cinza}
+        return _get_modo(self.pixels)
 
-        Retorna os novos tons de cinza que devem ser aplicados.
+    @property
+    def quantidade_pixels(self):
         """
-        g = defaultdict(lambda: 0)
-        probabilidade_acumulada = 0
-        for tom_cinza, probabilidade in probabilidades.items():
-            probabilidade_acumulada += probabilidade
-            novo_tom_cinza = probabilidade_acumulada * 255
-            g[tom_cinza] = int(Decimal(novo_tom_cinza).quantize(0))
-        return g
+        Quantidade total de pixels da imagem.
+        """
+        return self.altura * self.largura
+
+    @staticmethod
+    def _get_tabela_equalizacao(contagens):
+        """
+        :return: Um array uint8 do tipo: tabela[tom_cinza] = novo_tom_cinza
+
+        Calcula os novos tons de cinza a partir da distribuição acumulada,
+        arredondando round(255 * acumulado / total) apenas com inteiros.
+        """
+        acumulado = numpy.cumsum(contagens, dtype=numpy.int64)
+        total = int(acumulado[-1])
+        return ((510 * acumulado + total) // (2 * total)).astype(numpy.uint8)
 
     def salvar(self, novo_caminho_imagem=None):
         """
-        Salva a imagem.
+        Salva a imagem. Nas extensões .pgm, .ppm e .pnm os pixels são
+        gravados diretamente, sem passar pelo PIL (ver bruto.py).
+        """
+        self.computar()
+        self._gravar_arquivo(novo_caminho_imagem or self.caminho_imagem)
+
+    @_instrumentado
+    def _gravar_arquivo(self, caminho_imagem):
+        """
+        Codifica e grava os pixels no arquivo.
+        """
+        if caminho_imagem.lower().endswith(EXTENSOES_BRUTAS):
+            gravar_bruto(caminho_imagem, self.pixels)
+        else:
+            Image.fromarray(self.pixels).save(caminho_imagem)
+
+    def get_reduzida(self, escala):
+        """
+        Retorna uma cópia da imagem reduzida pela escala (entre 0 e 1),
+        usada como prévia rápida das operações.
         """
-        caminho_imagem = novo_caminho_imagem or self.caminho_imagem
-        self.imagem.save(caminho_imagem)
+        self.computar()
+        if escala >= 1:
+            return Imagem.de_array(self.pixels, self.caminho_imagem)
 
-    def converter_escala_cinza(self):
+        tamanho = (
+            max(int(round(self.largura * escala)), 1),
+            max(int(round(self.altura * escala)), 1)
+        )
+        reduzida = Image.fromarray(self.pixels).resize(tamanho, Image.BOX)
+        return Imagem.de_array(numpy.asarray(reduzida), self.caminho_imagem)
+
+    def computar(self):
         """
-        Converte uma imagem para escala de cinza.
+        Executa as operações pendentes do modo preguiçoso.
+
+        Sequências de operações pontuais (ver eh_pontual) são executadas
+        juntas por _computar_pontuais; as demais, uma a uma. Se uma delas
+        falhar (por exemplo, com OperacaoCancelada), as anteriores ficam
+        aplicadas e ela e as seguintes continuam pendentes, de modo que
+        `computar` pode ser chamada de novo.
         """
-        for x, y in self._get_xy():
-            pixel = self.pixels[x, y]
-            r, g, b = self.pixels[x, y]
-            tom_cinza = int(0.3 * r + 0.59 * g + 0.11 * b)
-            self.pixels[x, y] = (tom_cinza, tom_cinza, tom_cinza)
+        pendentes, self._pendentes = self._pendentes, []
+        self._computando = True
+        inicio = 0
+        try:
+            while inicio < len(pendentes):
+                fim = inicio
+                while (fim < len(pendentes) and
+                       eh_pontual(*pendentes[fim])):
+                    fim += 1
+
+                if fim > inicio:
+                    self._computar_pontuais(pendentes[inicio:fim])
+                    inicio = fim
+                else:
+                    nome, args, kwargs = pendentes[inicio]
+                    getattr(self, nome)(*args, **kwargs)
+                    inicio += 1
+        except BaseException:
+            self._pendentes = pendentes[inicio:] + self._pendentes
+            raise
+        finally:
+            self._computando = False
         return self.pixels
 
-    def get_histograma(self):
+    @_instrumentado
+    def _computar_pontuais(self, operacoes):
         """
-        :return: {tom_cinza: quantidade_pixels, ...}
+        Compõe as operações pontuais em uma única tabela de 256 tons.
 
-        Retorna o histograma da imagem.
+        O histograma necessário para a equalização é derivado do histograma
+        de entrada e da tabela acumulada até ali, sem reler a imagem. A
+        conversão para cinza e a tabela final são aplicadas juntas, bloco a
+        bloco, reaproveitando um único buffer de rascunho.
         """
-        histograma = defaultdict(lambda: 0)
-        for x, y in self._get_xy():
-            r, g, b = self.pixels[x, y]
-            histograma[r] += 1
-        return histograma
+        # Depois da primeira operação a imagem já está no modo "L" e as
+        # demais conversões para cinza não têm efeito.
+        converter = (
+            self.modo == "RGB" and operacoes[0][0] == 'converter_escala_cinza'
+        )
+        if converter:
+            _, args, kwargs = operacoes[0]
+            padrao = dict(zip(('padrao',), args), **kwargs).get(
+                'padrao', PADRAO_CINZA
+            )
+        operacoes = [
+            operacao for operacao in operacoes
+            if operacao[0] != 'converter_escala_cinza'
+        ]
+        if converter and any(
+            nome == 'equalizar_imagem' for nome, _, _ in operacoes
+        ):
+            # A equalização precisa do histograma dos tons de cinza.
+            self.converter_escala_cinza(padrao)
+            converter = False
+
+        tabela = numpy.arange(256, dtype=numpy.uint8)
+        contagens = None
+        for nome, args, kwargs in operacoes:
+            if nome == 'equalizar_imagem':
+                if contagens is None:
+                    contagens = self.get_contagens()
+                contagens_atuais = numpy.bincount(
+                    tabela, weights=contagens, minlength=256
+                )
+                nova_tabela = self._get_tabela_equalizacao(contagens_atuais)
+            elif nome == 'limiarizar':
+                nova_tabela = self._get_tabela_limiar(*args, **kwargs)
+            elif nome == 'aplicar_filtro':
+                descricao, parametros = registro_filtros.vincular(args, kwargs)
+                nova_tabela = descricao.classe.get_tabela(
+                    descricao.nome, **parametros
+                )
+            else:
+                nova_tabela = self._get_tabela(*args, **kwargs)
+            tabela = nova_tabela[tabela]
+
+        if not converter:
+            canal = self.get_canal_cinza()
+            if self.modo == "RGB":
+                canal = canal.copy()
+            numpy.take(tabela, canal, out=canal)
+            self._gravar_canal_cinza(canal)
+            return
+
+        tons_cinza = numpy.empty((self.altura, self.largura), dtype=numpy.uint8)
+        linhas = max(TAMANHO_BLOCO // (3 * self.largura), 1)
+        rascunho = self.rascunhos.obter(
+            'bloco_cinza', (linhas, self.largura), numpy.uint8
+        )
+        for inicio in range(0, self.altura, linhas):
+            bloco = self.pixels[inicio:inicio + linhas]
+            parcial = rascunho[:len(bloco)]
+            _escala_cinza(bloco, parcial, padrao, self.rascunhos)
+            numpy.take(tabela, parcial, out=tons_cinza[inicio:inicio + linhas])
+            self._progredir(inicio + len(bloco), self.altura)
+        self._gravar_canal_cinza(tons_cinza)
+
+    def get_canal_cinza(self):
+        """
+        Retorna o plano de tons de cinza lido pelos filtros e operadores.
+
+        No modo "RGB" é usado o primeiro canal, sem cópia.
+        """
+        if self.modo == "L":
+            return self.pixels
+        return self.pixels[..., 0]
+
+    def _gravar_canal_cinza(self, tons_cinza):
+        """
+        Substitui os pixels pelo plano de tons de cinza, no modo "L".
+        """
+        self.pixels = numpy.ascontiguousarray(tons_cinza, dtype=numpy.uint8)
+
+    @_adiavel
+    @_instrumentado
+    def converter_escala_cinza(self, padrao=PADRAO_CINZA, no_lugar=False):
+        """
+        Converte uma imagem para escala de cinza (modo "L") conforme o padrão
+        ("classico", "bt601", "bt709", "media" ou "luminosidade").
+
+        A conversão é feita por blocos de linhas. Com `no_lugar`, os tons
+        são gravados no próprio buffer dos pixels RGB, que depois é
+        reduzido, sem alocar outra imagem; use apenas se nenhum outro
+        objeto guardar referências ao array de pixels.
+        """
+        if self.modo == "L":
+            return self.pixels
+        pixels = self.pixels
+        altura, largura = self.altura, self.largura
+        no_lugar = (
+            no_lugar and pixels.flags.owndata and pixels.flags.c_contiguous
+            and pixels.flags.writeable
+        )
+        if no_lugar:
+            # A linha y do resultado ocupa bytes anteriores aos da linha y
+            # de entrada, então cada bloco só sobrescreve linhas já lidas.
+            tons_cinza = pixels.reshape(-1)[:altura * largura].reshape(
+                altura, largura
+            )
+        else:
+            tons_cinza = numpy.empty((altura, largura), dtype=numpy.uint8)
+
+        linhas = max(TAMANHO_BLOCO // (3 * largura), 1)
+        rascunho = self.rascunhos.obter(
+            'bloco_cinza', (linhas, largura), numpy.uint8
+        )
+        for inicio in range(0, altura, linhas):
+            bloco = pixels[inicio:inicio + linhas]
+            parcial = rascunho[:len(bloco)]
+            _escala_cinza(bloco, parcial, padrao, self.rascunhos)
+            tons_cinza[inicio:inicio + len(bloco)] = parcial
+            # No lugar, a conversão não pode ser interrompida no meio sem
+            # estragar os pixels RGB.
+            if not no_lugar:
+                self._progredir(inicio + len(bloco), altura)
+
+        if no_lugar:
+            del tons_cinza, bloco
+            self.pixels = None
+            try:
+                # Devolve a memória excedente sem copiar os tons.
+                pixels.resize((altura, largura))
+            except ValueError:
+                pixels = pixels.reshape(-1)[:altura * largura].reshape(
+                    altura, largura
+                )
+            self.pixels = pixels
+        else:
+            self.pixels = tons_cinza
+        return self.pixels
+
+    @_adiavel
+    @_instrumentado
+    def converter_rgb(self):
+        """
+        Expande uma imagem em escala de cinza para o modo "RGB".
+        """
+        if self.modo == "RGB":
+            return self.pixels
+        self.pixels = numpy.repeat(self.pixels[..., numpy.newaxis], 3, axis=2)
+        return self.pixels
+
+    @_instrumentado
+    def _contar_canais(self):
+        """
+        Conta os tons de todos os canais em uma única passada, bloco a
+        bloco. No modo "RGB" cada canal é deslocado em 256 posições para
+        que uma só contagem cubra os três.
+        """
+        canais = 1 if self.modo == "L" else 3
+        contagens = numpy.zeros(256 * canais, dtype=numpy.int64)
+        linhas = max(TAMANHO_BLOCO // (canais * self.largura), 1)
+        if canais > 1:
+            deslocamentos = numpy.arange(
+                0, 256 * canais, 256, dtype=numpy.uint16
+            )
+            rascunho = self.rascunhos.obter(
+                'indices_histograma', (linhas, self.largura, canais),
+                numpy.uint16
+            )
+        for inicio in range(0, self.altura, linhas):
+            bloco = self.pixels[inicio:inicio + linhas]
+            if canais > 1:
+                parcial = rascunho[:len(bloco)]
+                numpy.add(bloco, deslocamentos, out=parcial)
+                bloco = parcial
+            contagens += numpy.bincount(
+                bloco.ravel(), minlength=256 * canais
+            )
+        contagens = contagens.reshape(canais, 256)
+        contagens.flags.writeable = False
+        return contagens
+
+    def get_contagens_canais(self):
+        """
+        :return: Array (canais, 256): contagens[canal, tom] = quantidade
 
+        Um canal no modo "L" e três (R, G, B) no modo "RGB". O resultado é
+        guardado e reaproveitado até os pixels mudarem.
+        """
+        if self._contagens is None:
+            self._contagens = self._contar_canais()
+        return self._contagens
+
+    def get_contagens(self):
+        """
+        :return: Array com 256 posições: contagens[tom_cinza] = quantidade
+
+        Contagem dos tons do plano de cinza (ver get_canal_cinza).
+        """
+        return self.get_contagens_canais()[0]
+
+    def get_histograma(self, canal=0):
+        """
+        :return: {tom: quantidade_pixels, ...}
+
+        Retorna o histograma de um canal da imagem (no modo "RGB", 0 a 2).
+        """
+        self.computar()
+        contagens = self.get_contagens_canais()[canal]
+        tons = numpy.flatnonzero(contagens)
+        return dict(zip(tons.tolist(), contagens[tons].tolist()))
+
+    @_adiavel
+    @_instrumentado
+    @_memorizavel
     def equalizar_imagem(self):
         """
         Equaliza a imagem em escala de cinza.
         """
-        histograma = self.get_histograma()
-        probabilidades = self._get_probabilidades(histograma)
-        novos_tons = self._get_novos_tons_cinza(probabilidades)
+        tabela = self._get_tabela_equalizacao(self.get_contagens())
+        self._gravar_canal_cinza(tabela[self.get_canal_cinza()])
 
-        for x, y in self._get_xy():
-            r, g, b = self.pixels[x, y]
-            tom_cinza = novos_tons[r]
-            self.pixels[x, y] = (tom_cinza, tom_cinza, tom_cinza)
+    def _get_tabela_limiar(self, limiar=128):
+        """
+        Tabela que leva os tons a partir do limiar para 255 e os demais a 0.
+        """
+        return numpy.where(numpy.arange(256) >= limiar, 255, 0).astype(
+            numpy.uint8
+        )
+
+    @_adiavel
+    @_instrumentado
+    def limiarizar(self, limiar=128):
+        """
+        Binariza a imagem em escala de cinza.
+        """
+        self.aplicar_tabela(self._get_tabela_limiar(limiar))
+
+    def _get_tabela(self, tabela):
+        """
+        Converte a tabela informada em um array uint8 de 256 posições.
+        """
+        return numpy.asarray(tabela, dtype=numpy.uint8).reshape(256)
+
+    @_adiavel
+    @_instrumentado
+    def aplicar_tabela(self, tabela):
+        """
+        Substitui cada tom de cinza t por tabela[t] (256 posições).
+        """
+        tabela = self._get_tabela(tabela)
+        self._gravar_canal_cinza(tabela[self.get_canal_cinza()])
+
+    def _get_chave_cache(self, nome, args, kwargs):
+        """
+        Chave do resultado de uma operação no cache: os pixels, o nome e os
+        parâmetros (imagens entram pelos seus pixels). Nos filtros, os
+        parâmetros são os vinculados à assinatura do filtro, de modo que
+        chamadas equivalentes tenham a mesma chave, e as matrizes aplicadas
+        também entram na chave. O número de processos não altera o
+        resultado e é ignorado.
+        """
+        kwargs = dict(kwargs)
+        kwargs.pop('processos', None)
+        partes = [self.pixels, nome]
+        if nome == 'aplicar_filtro':
+            descricao, parametros = registro_filtros.vincular(args, kwargs)
+            if descricao is not None:
+                partes.append(descricao.nome)
+                partes.extend(descricao.classe.get_matrizes(
+                    descricao.nome, **parametros
+                ))
+                args, kwargs = (), parametros
+        parametros = list(args)
+        for nome_parametro in sorted(kwargs):
+            parametros.extend((nome_parametro, kwargs[nome_parametro]))
+        for valor in parametros:
+            if isinstance(valor, Imagem):
+                valor = valor.pixels
+            partes.append(valor)
+        return gerar_chave(*partes)
+
+    def _get_filtro(self, nome_filtro):
+        """
+        Retorna a instância da classe que aplica o filtro registrado com o
+        nome, criando-a no primeiro uso, ou None se ele não existir.
+        """
+        descricao = registro_filtros.obter(nome_filtro)
+        if descricao is None:
+            return None
+        filtro = self._filtros.get(descricao.classe)
+        if filtro is None:
+            filtro = self._filtros[descricao.classe] = descricao.classe(
+                imagem=self
+            )
+        return filtro
 
-    def aplicar_filtro(self, nome_filtro, *args, **kwargs):
+    @_adiavel
+    @_instrumentado
+    @_memorizavel
+    def aplicar_filtro(self, nome_filtro, *args, processos=None, **kwargs):
         """
         Aplica um filtro na imagem.
+
+        Com `processos` maior que 1, a imagem é dividida em faixas
+        horizontais processadas em paralelo (ver _executar_em_faixas).
+        """
+        descricao = registro_filtros.obter(nome_filtro)
+        if descricao is None:
+            return
+        if processos and processos > 1:
+            margem = descricao.get_margem(*args, **kwargs)
+            self._gravar_canal_cinza(_executar_em_faixas(
+                self.get_canal_cinza(), margem, processos,
+                nome_filtro, args, kwargs, self._progredir,
+                descricao.no_lugar
+            ))
+        else:
+            getattr(self._get_filtro(nome_filtro), nome_filtro)(*args, **kwargs)
+
+    @_instrumentado
+    def get_gradiente(self, operador='sobel', norma='l2', direcoes=4):
         """
-        for filtro in self.filtros:
-            if hasattr(filtro, nome_filtro):
-                getattr(filtro, nome_filtro)(*args, **kwargs)
-                break
+        :return: (magnitude, orientacao)
 
+        Gradiente do plano de cinza, para limiarizações como a do Canny: a
+        magnitude sem limite (int16 na norma "l1", float32 na "l2") e a
+        direção quantizada em `direcoes` setores (uint8, ver _gradiente),
+        ou None sem `direcoes`. Os dois arrays têm o tamanho da imagem, com
+        zero nas bordas.
+        """
+        self.computar()
+        tipo = numpy.int16 if norma == 'l1' else numpy.float32
+        magnitude = numpy.zeros((self.altura, self.largura), dtype=tipo)
+        orientacao = None
+        if direcoes:
+            orientacao = numpy.zeros(magnitude.shape, dtype=numpy.uint8)
+
+        resultado = self._get_filtro('gradiente').calcular(
+            operador, norma, direcoes
+        )
+        if resultado is not None:
+            parcial, orientacao_parcial, deslocamento = resultado
+            altura, largura = parcial.shape
+            regiao = (
+                slice(deslocamento, deslocamento + altura),
+                slice(deslocamento, deslocamento + largura)
+            )
+            magnitude[regiao] = parcial
+            if orientacao is not None:
+                orientacao[regiao] = orientacao_parcial
+        return magnitude, orientacao
+
+    @_adiavel
+    @_instrumentado
+    @_memorizavel
     def aplicar_logico(self, operador, *args, **kwargs):
         """
-        Aplica um filtro na imagem.
+        Aplica um operador lógico ou aritmético na imagem.
         """
         if hasattr(self, operador):
             getattr(self, operador)(*args, **kwargs)
 
+    def _get_sobreposicao(self, imagem_secundaria, deslocamento, alinhamento):
+        """
+        :return: (regiao_principal, regiao_secundaria) como pares de slices
 
-    def operador_and(self, imagem_secundaria):
+        Posiciona a imagem secundária sobre a principal conforme o
+        alinhamento ("superior_esquerdo", "centro" ou "inferior_direito") e
+        o deslocamento (x, y) e calcula a região em que as duas se sobrepõem.
+        """
+        if alinhamento not in ALINHAMENTOS:
+            raise ValueError(u'Alinhamento inválido: %s' % alinhamento)
+
+        fator = ALINHAMENTOS[alinhamento]
+        x = (self.largura - imagem_secundaria.largura) * fator // 2
+        y = (self.altura - imagem_secundaria.altura) * fator // 2
+        x += deslocamento[0]
+        y += deslocamento[1]
+
+        x_inicio, y_inicio = max(x, 0), max(y, 0)
+        x_final = min(x + imagem_secundaria.largura, self.largura)
+        y_final = min(y + imagem_secundaria.altura, self.altura)
+        if x_final <= x_inicio or y_final <= y_inicio:
+            return None
+
+        return (
+            (slice(y_inicio, y_final), slice(x_inicio, x_final)),
+            (slice(y_inicio - y, y_final - y), slice(x_inicio - x, x_final - x))
+        )
 
-        x_final=self.imagem.width
-        y_final=self.imagem.height
+    @_adiavel
+    @_instrumentado
+    def operar(self, imagem_secundaria, operacao, deslocamento=(0, 0),
+               alinhamento="superior_esquerdo", **kwargs):
+        """
+        Aplica uma operação binária (ver OPERACOES) entre os tons de cinza
+        das duas imagens, de uma só vez, na região em que elas se sobrepõem.
+        O restante da imagem não é alterado e o resultado fica no modo "L".
+        """
+        if operacao not in OPERACOES:
+            raise ValueError(u'Operação inválida: %s' % operacao)
 
-        x_final_2 = imagem_secundaria.imagem.width
-        y_final_2 = imagem_secundaria.imagem.height
+        tons_cinza = self.get_canal_cinza()
+        if self.modo == "RGB":
+            tons_cinza = tons_cinza.copy()
 
-        generator = self._get_xy(
-            x_final=x_final,
-            y_final=y_final,
+        regioes = self._get_sobreposicao(
+            imagem_secundaria, deslocamento, alinhamento
         )
+        if regioes is not None:
+            regiao, regiao_secundaria = regioes
+            OPERACOES[operacao](
+                tons_cinza[regiao],
+                imagem_secundaria.get_canal_cinza()[regiao_secundaria],
+                tons_cinza[regiao],
+                **kwargs
+            )
+        self._gravar_canal_cinza(tons_cinza)
+
+    def operador_and(self, imagem_secundaria, **kwargs):
+        self.operar(imagem_secundaria, 'and', **kwargs)
+
+    def operador_xor(self, imagem_secundaria, **kwargs):
+        self.operar(imagem_secundaria, 'xor', **kwargs)
+
+    def operador_or(self, imagem_secundaria, **kwargs):
+        self.operar(imagem_secundaria, 'or', **kwargs)
+
+    @_adiavel
+    @_instrumentado
+    def operador_not(self, imagem_secundaria=None):
+        """
+        Inverte os bits dos tons de cinza (a imagem secundária é ignorada).
+        """
+        self._gravar_canal_cinza(numpy.invert(self.get_canal_cinza()))
 
-        for x, y in generator:
+    def operador_soma(self, imagem_secundaria, **kwargs):
+        self.operar(imagem_secundaria, 'soma', **kwargs)
 
-            if x < x_final_2 and y < y_final_2:
-                pixel_resultante = self.pixels[x, y][0] & imagem_secundaria.pixels[x, y][0]
-                self.pixels[x, y] = (pixel_resultante, pixel_resultante, pixel_resultante)
+    def operador_subtracao(self, imagem_secundaria, **kwargs):
+        self.operar(imagem_secundaria, 'subtracao', **kwargs)
 
-    def operador_xor(self, imagem_secundaria):
+    def operador_diferenca(self, imagem_secundaria, **kwargs):
+        self.operar(imagem_secundaria, 'diferenca', **kwargs)
 
-        x_final=self.imagem.width
-        y_final=self.imagem.height
+    def operador_multiplicacao(self, imagem_secundaria, **kwargs):
+        self.operar(imagem_secundaria, 'multiplicacao', **kwargs)
+
+    def operador_mistura(self, imagem_secundaria, alfa=0.5, **kwargs):
+        self.operar(imagem_secundaria, 'mistura', alfa=alfa, **kwargs)
+
+    def operador_minimo(self, imagem_secundaria, **kwargs):
+        self.operar(imagem_secundaria, 'minimo', **kwargs)
+
+    def operador_maximo(self, imagem_secundaria, **kwargs):
+        self.operar(imagem_secundaria, 'maximo', **kwargs)
+
+
+class DescricaoFiltro(object):
+    """
+    Descrição de um filtro registrado: o método que o aplica, a classe que
+    o define, que informa, para os parâmetros de uma chamada, a vizinhança
+    usada (get_margem, na divisão em faixas) e as matrizes aplicadas
+    (get_matrizes, no cache), e as características usadas para decidir como
+    executá-lo.
+    """
+
+    def __init__(self, nome, classe, pontual=False, separavel=False,
+                 no_lugar=False):
+        """
+        Inicialização da classe.
+
+        :param nome: nome do filtro e do método da classe que o aplica
+        :param classe: subclasse de Filtros que define o método
+        :param pontual: cada pixel do resultado depende só do mesmo pixel; a
+            classe informa a tabela de 256 tons do filtro (get_tabela), que
+            é fundida com as demais operações pontuais no modo preguiçoso, e
+            o resultado não passa pelo cache
+        :param separavel: as matrizes do filtro são tentadas como uma
+            passada nas colunas e outra nas linhas (ver _correlacionar)
+        :param no_lugar: o resultado é gravado sobre os próprios pixels de
+            entrada, sem buffer de saída, inclusive no processamento em
+            faixas
+        """
+        self.nome = nome
+        self.classe = classe
+        self.pontual = pontual
+        self.separavel = separavel
+        self.no_lugar = no_lugar
+        self._assinatura = inspect.signature(getattr(classe, nome))
+
+    def vincular(self, *args, **kwargs):
+        """
+        Associa os argumentos de uma chamada do filtro aos nomes dos
+        parâmetros, completando com os valores padrão: chamadas equivalentes,
+        com argumentos posicionais ou nomeados, resultam no mesmo dicionário.
+        """
+        vinculados = self._assinatura.bind(None, *args, **kwargs)
+        vinculados.apply_defaults()
+        parametros = dict(vinculados.arguments)
+        del parametros[next(iter(self._assinatura.parameters))]
+        return parametros
+
+    def get_margem(self, *args, **kwargs):
+        """
+        Retorna quantas linhas vizinhas de cada lado influenciam um pixel,
+        para os argumentos informados.
+        """
+        parametros = self.vincular(*args, **kwargs)
+        return self.classe.get_margem(self.nome, **parametros)
+
+    @property
+    def raio(self):
+        """
+        Raio da vizinhança com os parâmetros padrão.
+        """
+        return self.get_margem()
+
+    def __repr__(self):
+        return 'DescricaoFiltro(%r, %s)' % (self.nome, self.classe.__name__)
+
+
+class RegistroFiltros(object):
+    """
+    Filtros disponíveis em Imagem.aplicar_filtro, indexados pelo nome.
+    """
+
+    def __init__(self):
+        """
+        Inicialização da classe.
+        """
+        self._descricoes = {}
+
+    def registrar(self, descricao):
+        """
+        Registra um filtro. Nomes repetidos são recusados.
+        """
+        anterior = self._descricoes.get(descricao.nome)
+        if anterior is not None:
+            raise ValueError(u'Filtro %r já registrado por %s' % (
+                descricao.nome, anterior.classe.__name__
+            ))
+        self._descricoes[descricao.nome] = descricao
+
+    def obter(self, nome_filtro):
+        """
+        Retorna a descrição do filtro, ou None se ele não existir.
+        """
+        return self._descricoes.get(nome_filtro)
+
+    def vincular(self, args, kwargs):
+        """
+        :return: (descricao, parametros), ou (None, None) se o filtro não
+            existir
 
-        x_final_2 = imagem_secundaria.imagem.width
-        y_final_2 = imagem_secundaria.imagem.height
+        Interpreta os argumentos de uma chamada de Imagem.aplicar_filtro: o
+        nome do filtro, posicional ou nomeado, e os parâmetros do filtro
+        vinculados por DescricaoFiltro.vincular. `processos` é ignorado.
+        """
+        kwargs = dict(kwargs)
+        kwargs.pop('processos', None)
+        if args:
+            nome_filtro, args = args[0], args[1:]
+        else:
+            nome_filtro = kwargs.pop('nome_filtro')
+        descricao = self.obter(nome_filtro)
+        if descricao is None:
+            return None, None
+        return descricao, descricao.vincular(*args, **kwargs)
+
+    def nomes(self):
+        """
+        Nomes dos filtros, em ordem alfabética.
+        """
+        return sorted(self._descricoes)
 
-        generator = self._get_xy(
-            x_final=x_final,
-            y_final=y_final,
-        )
+    def __contains__(self, nome_filtro):
+        return nome_filtro in self._descricoes
 
-        for x, y in generator:
+    def __iter__(self):
+        return iter(self._descricoes.values())
 
-            if x < x_final_2 and y < y_final_2:
-                pixel_resultante = self.pixels[x, y][0] ^ imagem_secundaria.pixels[x, y][0]
-                self.pixels[x, y] = (pixel_resultante, pixel_resultante, pixel_resultante)
 
-    def operador_or(self, imagem_secundaria):
+# Registro usado por Imagem.aplicar_filtro.
+registro_filtros = RegistroFiltros()
 
-        x_final=self.imagem.width
-        y_final=self.imagem.height
 
-        x_final_2 = imagem_secundaria.imagem.width
-        y_final_2 = imagem_secundaria.imagem.height
+def descrever_filtro(**caracteristicas):
+    """
+    Marca um método de uma subclasse de Filtros como filtro, com as
+    características aceitas por DescricaoFiltro. O registro é feito por
+    registrar_filtros, aplicado à classe.
+    """
+    def marcar(metodo):
+        metodo.caracteristicas_filtro = caracteristicas
+        return metodo
+    return marcar
 
-        generator = self._get_xy(
-            x_final=x_final,
-            y_final=y_final,
-        )
 
-        for x, y in generator:
+def registrar_filtros(classe):
+    """
+    Decorador de classe: registra os métodos marcados com descrever_filtro
+    definidos na própria classe (os herdados já foram registrados).
+    """
+    for nome, metodo in vars(classe).items():
+        caracteristicas = getattr(metodo, 'caracteristicas_filtro', None)
+        if caracteristicas is not None:
+            registro_filtros.registrar(
+                DescricaoFiltro(nome, classe, **caracteristicas)
+            )
+    return classe
 
-            if x < x_final_2 and y < y_final_2:
-                pixel_resultante = self.pixels[x, y][0] | imagem_secundaria.pixels[x, y][0]
-                self.pixels[x, y] = (pixel_resultante, pixel_resultante, pixel_resultante)
 
+@registrar_filtros
 class Filtros(object):
     """
     Filtros que podem ser aplicados na imagem.
@@ -231,32 +1679,126 @@ class Filtros(object):
         """
         self.imagem = imagem
 
-    def correlacao(self, rotacionar_matriz_180=False):
+    @classmethod
+    def get_margem(cls, nome_filtro, **kwargs):
         """
-        Aplica o filtro de correlação.
+        Retorna quantas linhas vizinhas de cada lado influenciam um pixel.
         """
-        # Limita a aplicação da técnica para pontos que possuem vizinhos.
-        qtd_linhas_espaco = len(self.matriz_filtro) - 2
-        generator = self.imagem._get_xy(
-            x_inicio=qtd_linhas_espaco,
-            y_inicio=qtd_linhas_espaco,
-            x_final=self.imagem.imagem.width - qtd_linhas_espaco,
-            y_final=self.imagem.imagem.height - qtd_linhas_espaco,
+        return max(numpy.shape(cls.matriz_filtro)) // 2
+
+    @staticmethod
+    def _orientar(matriz):
+        """
+        Converte uma matriz do filtro para a ordem (linha, coluna) da
+        correlação. Como na versão original, matriz[i][j] multiplica o
+        vizinho deslocado i colunas (x) e j linhas (y): a janela aplicada é
+        a transposta da matriz escrita.
+        """
+        return numpy.asarray(matriz, dtype=numpy.float64).T
+
+    @classmethod
+    def get_matrizes(cls, nome_filtro, **kwargs):
+        """
+        Retorna as matrizes efetivamente aplicadas pelo filtro, na ordem
+        (linha, coluna).
+        """
+        matriz = cls._orientar(cls.matriz_filtro)
+        if nome_filtro == 'convolucao':
+            # Como na versão original, a "rotação" inverte só o índice j
+            # (as linhas).
+            matriz = matriz[::-1]
+        return [matriz]
+
+    def _get_canal(self):
+        """
+        Retorna o canal lido pelos filtros (a imagem em escala de cinza).
+        """
+        return self.imagem.get_canal_cinza()
+
+    def _gravar(self, resultado, deslocamento):
+        """
+        Grava o resultado de uma operação de vizinhança na imagem.
+
+        O resultado cobre apenas os pontos que possuem vizinhos; as bordas
+        da imagem permanecem inalteradas. A imagem passa para o modo "L".
+        """
+        self._converter_cinza()
+        if resultado.dtype != numpy.uint8:
+            numpy.clip(resultado, 0, 255, out=resultado)
+        altura, largura = resultado.shape
+        self.imagem.pixels[
+            deslocamento:deslocamento + altura,
+            deslocamento:deslocamento + largura
+        ] = resultado
+        self.imagem._descartar_contagens()
+
+    def _converter_cinza(self):
+        """
+        Passa a imagem para o modo "L", o dos resultados dos filtros. Usado
+        também quando a imagem é menor que a janela e fica inalterada, para
+        que o modo do resultado não dependa do tamanho da imagem.
+        """
+        if self.imagem.modo == "RGB":
+            self.imagem._gravar_canal_cinza(self.imagem.get_canal_cinza())
+
+    def _correlacionar(self, nome_filtro, canal, matriz, etapa=0, etapas=1):
+        """
+        Correlação usando os buffers de rascunho da imagem, calculada por
+        blocos de linhas para que o andamento seja informado e a operação
+        possa ser cancelada. A correlação é a etapa `etapa` (a partir de 0)
+        das `etapas` do filtro. O caminho separável só é tentado nos filtros
+        registrados como separáveis.
+        """
+        separavel = registro_filtros.obter(nome_filtro).separavel
+        rascunhos = self.imagem.rascunhos
+        altura_matriz, largura_matriz = matriz.shape
+        altura = canal.shape[0] - altura_matriz + 1
+        resultado = rascunhos.obter(
+            'correlacao_blocos',
+            (altura, canal.shape[1] - largura_matriz + 1)
         )
+        linhas = max(TAMANHO_BLOCO // (8 * canal.shape[1]), altura_matriz)
+        for inicio in range(0, altura, linhas):
+            fim = min(inicio + linhas, altura)
+            resultado[inicio:fim] = _correlacionar(
+                canal[inicio:fim + altura_matriz - 1], matriz, rascunhos,
+                separavel
+            )
+            self.imagem._progredir(etapa * altura + fim, etapas * altura)
+        return resultado
 
-        j = (0, 1, 2)
-        if rotacionar_matriz_180:
-            j = (2, 1, 0)
+    def _expandir(self, resultado, canal, deslocamento):
+        """
+        Retorna uma cópia do canal (como float, em um buffer de rascunho)
+        com o resultado gravado na região interna, mantendo os pixels
+        originais nas bordas.
+        """
+        auxiliar = self.imagem.rascunhos.obter('auxiliar', canal.shape)
+        auxiliar[...] = canal
+        altura, largura = resultado.shape
+        auxiliar[
+            deslocamento:deslocamento + altura,
+            deslocamento:deslocamento + largura
+        ] = resultado
+        return auxiliar
+
+    @descrever_filtro()
+    def correlacao(self, rotacionar_matriz_180=False):
+        """
+        Aplica o filtro de correlação.
+        """
+        canal = self._get_canal()
+        nome_filtro = 'convolucao' if rotacionar_matriz_180 else 'correlacao'
+        matriz, = self.get_matrizes(nome_filtro)
+        if min(canal.shape) < len(matriz):
+            self._converter_cinza()
+            return
 
-        for x, y in generator:
-            soma = 0
-            for i in range(0, 3):
-                soma += self.imagem.pixels[x-1+i, y-1][0] * self.matriz_filtro[i][j[0]]
-                soma += self.imagem.pixels[x-1+i, y][0] * self.matriz_filtro[i][j[1]]
-                soma += self.imagem.pixels[x-1+i, y+1][0] * self.matriz_filtro[i][j[2]]
-            soma = int(soma)
-            self.imagem.pixels[x, y] = (soma, soma, soma)
+        # Limita a aplicação da técnica para pontos que possuem vizinhos.
+        resultado = self._correlacionar(nome_filtro, canal, matriz)
+        self._gravar(numpy.trunc(resultado, out=resultado), len(matriz) // 2)
 
+    @descrever_filtro()
     def convolucao(self):
         """
         Aplica o filtro de convolução.
@@ -264,6 +1806,7 @@ class Filtros(object):
         self.correlacao(rotacionar_matriz_180=True)
 
 
+@registrar_filtros
 class PassaAlta(Filtros):
 
     matriz_filtro = [
@@ -285,211 +1828,132 @@ class PassaAlta(Filtros):
     #     [1.0, 1.0, 1.0]
     # ]
 
+    @classmethod
+    def get_margem(cls, nome_filtro, **kwargs):
+        """
+        O filtro é aplicado duas vezes, dobrando a vizinhança.
+        """
+        return 2 * super(PassaAlta, cls).get_margem(nome_filtro, **kwargs)
+
+    @descrever_filtro()
     def passa_alta(self):
         """
         Aplica filtros de passa_alta
         """
-        # Limita a aplicação da técnica para pontos que possuem vizinhos.
-        qtd_linhas_espaco = len(self.matriz_filtro) - 2
-
-        x_final=self.imagem.imagem.width - qtd_linhas_espaco
-        y_final=self.imagem.imagem.height - qtd_linhas_espaco
-
-        generator = self.imagem._get_xy(
-            x_inicio=qtd_linhas_espaco,
-            y_inicio=qtd_linhas_espaco,
-            x_final=x_final,
-            y_final=y_final,
-        )
-
-        j = (0, 1, 2)
-        matriz_aux = {x:{y:(0,0,0) for y in range(y_final + 1)} for x in range(x_final + 1)}
-
-        for x, y in generator:
-            soma = 0
-            for i in range(0, 3):
-                soma += self.imagem.pixels[x-1+i, y-1][0] * self.matriz_filtro[i][j[0]]
-                soma += self.imagem.pixels[x-1+i, y][0] * self.matriz_filtro[i][j[1]]
-                soma += self.imagem.pixels[x-1+i, y+1][0] * self.matriz_filtro[i][j[2]]
-
-            # Para valores negativos considerar sempre 0 ou somar 255.
-            soma = int(soma)
-            if soma < 0:
-                soma = 0
-
-            matriz_aux[x][y] = (soma, soma, soma)
-            # self.imagem.pixels[x, y] = (soma, soma, soma)
-
-        for x in range(x_final + 1):
-            matriz_aux[x][y_final] = self.imagem.pixels[x, y_final]
-            matriz_aux[x][0] = self.imagem.pixels[x, 0]
-
-        for y in range(y_final + 1):
-            matriz_aux[x_final][y] = self.imagem.pixels[x_final, y]
-            matriz_aux[0][y] = self.imagem.pixels[0, y]
-
-
-        generator = self.imagem._get_yx(
-            x_inicio=qtd_linhas_espaco,
-            y_inicio=qtd_linhas_espaco,
-            x_final=self.imagem.imagem.width - qtd_linhas_espaco,
-            y_final=self.imagem.imagem.height - qtd_linhas_espaco,
+        canal = self._get_canal()
+        matriz, = self.get_matrizes('passa_alta')
+        if min(canal.shape) < len(matriz):
+            self._converter_cinza()
+            return
+        deslocamento = len(matriz) // 2
+
+        # Para valores negativos considerar sempre 0 ou somar 255.
+        resultado = self._correlacionar('passa_alta', canal, matriz, 0, 2)
+        numpy.maximum(numpy.trunc(resultado, out=resultado), 0, out=resultado)
+        auxiliar = self._expandir(resultado, canal, deslocamento)
+
+        resultado = self._correlacionar(
+            'passa_alta', auxiliar, matriz, 1, 2
         )
-
-        for x, y in generator:
-            soma = 0
-            for i in range(0, 3):
-                try:
-                    soma += matriz_aux[x-1+i][y-1][0] * self.matriz_filtro[i][j[0]]
-                    soma += matriz_aux[x-1+i][y][0] * self.matriz_filtro[i][j[1]]
-                    soma += matriz_aux[x-1+i][y+1][0] * self.matriz_filtro[i][j[2]]
-                except:
-                    from IPython import embed; embed()
-
-            # Para valores negativos considerar sempre 0 ou somar 255.
-            soma = int(soma)
-            if soma < 0:
-                soma = 0
-
-            self.imagem.pixels[x, y] = (soma, soma, soma)
+        numpy.maximum(numpy.trunc(resultado, out=resultado), 0, out=resultado)
+        self._gravar(resultado, deslocamento)
 
 
 #http://www.dpi.inpe.br/~carlos/Academicos/Cursos/Pdi/pdi_filtros.htm
+@registrar_filtros
 class Moda(Filtros):
 
-    def moda(self):
+    # Janelas com até esta quantidade de pixels são contadas diretamente;
+    # acima disso o histograma deslizante é mais rápido.
+    limite_contagem = 169
+
+    def _moda_contando(self, canal, raio):
         """
-        Aplica filtros de passa_alta
+        Calcula a moda contando os tons de cada janela.
         """
+        tamanho = 2 * raio + 1
+        janelas = _janelas(canal, tamanho)
+        linhas, colunas = janelas.shape[:2]
 
-        # Limita a aplicação da técnica para pontos que possuem vizinhos.
-        # qtd_linhas_espaco = len(self.matriz_filtro) - 2
-        qtd_linhas_espaco = 2
-        x_final=self.imagem.imagem.width - qtd_linhas_espaco
-        y_final=self.imagem.imagem.height - qtd_linhas_espaco
-
-        generator = self.imagem._get_xy(
-            x_inicio=qtd_linhas_espaco,
-            y_inicio=qtd_linhas_espaco,
-            x_final=x_final,
-            y_final=y_final,
-        )
-
-        # j = (0, 1, 2)
-        j = (0, 1, 2, 3, 4)
-        matriz_aux = {x:{y:(0,0,0) for y in range(y_final + 1)} for x in range(x_final + 1)}
-
-        for x, y in generator:
-            pixels = []
-            for i in range(0, 5):
-
-                pixels.append(self.imagem.pixels[x-2+i, y-2][0])
-                pixels.append(self.imagem.pixels[x-2+i, y-1][0])
-                pixels.append(self.imagem.pixels[x-2+i, y][0])
-                pixels.append(self.imagem.pixels[x-2+i, y+1][0])
-                pixels.append(self.imagem.pixels[x-2+i, y+2][0])
-
-            pixels.sort()
+        # Cada janela da linha ganha sua própria faixa de 256 posições, de
+        # forma que um único bincount conta todas as janelas da linha.
+        faixas = (numpy.arange(colunas) * 256)[:, numpy.newaxis]
 
-            incidencias = {}
-            for pix in pixels:
-                if pix in incidencias:
-                    incidencias[pix] += 1
-                else:
-                    incidencias[pix] = 1
-
-            incidencias = sorted(
-                incidencias.items(),
-                key=lambda x: x[1], reverse=True
-            )
-            pixel_moda = incidencias[0][0]
-            matriz_aux[x][y] = (pixel_moda, pixel_moda, pixel_moda)
-
-
-        for x in range(x_final + 1):
-            matriz_aux[x][y_final] = self.imagem.pixels[x, y_final]
-            matriz_aux[x][0] = self.imagem.pixels[x, 0]
-
-        for y in range(y_final + 1):
-            matriz_aux[x_final][y] = self.imagem.pixels[x_final, y]
-            matriz_aux[0][y] = self.imagem.pixels[0, y]
-
-
-        generator = self.imagem._get_xy(
-            x_inicio=qtd_linhas_espaco,
-            y_inicio=qtd_linhas_espaco,
-            x_final=x_final,
-            y_final=y_final,
+        resultado = self.imagem.rascunhos.obter(
+            'resultado', (linhas, colunas), numpy.uint8
         )
-
-        for x, y in generator:
-            self.imagem.pixels[x, y] = matriz_aux[x][y]
-
-    def moda7(self):
+        for y in range(linhas):
+            tons = janelas[y].reshape(colunas, -1) + faixas
+            incidencias = numpy.bincount(
+                tons.ravel(), minlength=colunas * 256
+            ).reshape(colunas, 256)
+            resultado[y] = incidencias.argmax(axis=1)
+            self.imagem._progredir(y + 1, linhas)
+        return resultado
+
+    def _moda_histograma(self, canal, raio):
         """
-        Aplica filtros de passa_alta
+        Calcula a moda a partir dos histogramas deslizantes, com custo por
+        pixel constante em relação ao raio.
         """
+        tamanho = 2 * raio + 1
+        linhas = canal.shape[0] - tamanho + 1
+        colunas = canal.shape[1] - tamanho + 1
 
-        # Limita a aplicação da técnica para pontos que possuem vizinhos.
-        # qtd_linhas_espaco = len(self.matriz_filtro) - 2
-        qtd_linhas_espaco = 7
-        x_final=self.imagem.imagem.width - qtd_linhas_espaco/2
-        y_final=self.imagem.imagem.height - qtd_linhas_espaco/2
-
-        generator = self.imagem._get_xy(
-            x_inicio=qtd_linhas_espaco,
-            y_inicio=qtd_linhas_espaco,
-            x_final=x_final,
-            y_final=y_final,
+        resultado = self.imagem.rascunhos.obter(
+            'resultado', (linhas, colunas), numpy.uint8
         )
+        histogramas = _histogramas_deslizantes(
+            canal, raio, self.imagem.rascunhos
+        )
+        for y, histograma in enumerate(histogramas):
+            resultado[y] = histograma.argmax(axis=1)
+            self.imagem._progredir(y + 1, linhas)
+        return resultado
 
-        # j = (0, 1, 2)
-        # j = (0, 1, 2, 3, 4, 5, 6)
-        matriz_aux = {x:{y:(0,0,0) for y in range(y_final + 1)} for x in range(x_final + 1)}
-
-        for x, y in generator:
-            pixels = []
-            for i in range(0, qtd_linhas_espaco):
-                for j in range(0, qtd_linhas_espaco):
-                    pixels.append(self.imagem.pixels[x-qtd_linhas_espaco+i, y-qtd_linhas_espaco+j][0])
-
-            pixels.sort()
-
-            incidencias = {}
-            for pix in pixels:
-                if pix in incidencias:
-                    incidencias[pix] += 1
-                else:
-                    incidencias[pix] = 1
-
-            incidencias = sorted(
-                incidencias.items(),
-                key=lambda x: x[1], reverse=True
-            )
-            pixel_moda = incidencias[0][0]
-            matriz_aux[x][y] = (pixel_moda, pixel_moda, pixel_moda)
-
-
-        for x in range(x_final + 1):
-            matriz_aux[x][y_final] = self.imagem.pixels[x, y_final]
-            matriz_aux[x][0] = self.imagem.pixels[x, 0]
-
-        for y in range(y_final + 1):
-            matriz_aux[x_final][y] = self.imagem.pixels[x_final, y]
-            matriz_aux[0][y] = self.imagem.pixels[0, y]
-
+    @classmethod
+    def get_margem(cls, nome_filtro, raio=None, **kwargs):
+        """
+        Retorna o raio da janela.
+        """
+        if raio is not None:
+            return raio
+        return 3 if nome_filtro == 'moda7' else 2
 
-        generator = self.imagem._get_xy(
-            x_inicio=qtd_linhas_espaco,
-            y_inicio=qtd_linhas_espaco,
-            x_final=x_final,
-            y_final=y_final,
-        )
+    @classmethod
+    def get_matrizes(cls, nome_filtro, **kwargs):
+        """
+        A moda não usa matrizes.
+        """
+        return []
 
-        for x, y in generator:
-            self.imagem.pixels[x, y] = matriz_aux[x][y]
+    @descrever_filtro()
+    def moda(self, raio=2):
+        """
+        Substitui cada pixel pelo tom mais frequente da vizinhança
+        (2 * raio + 1) x (2 * raio + 1). Em caso de empate, vence o menor tom.
+        """
+        canal = self._get_canal()
+        tamanho = 2 * raio + 1
+        if min(canal.shape) < tamanho:
+            self._converter_cinza()
+            return
+
+        if tamanho ** 2 <= self.limite_contagem:
+            resultado = self._moda_contando(canal, raio)
+        else:
+            resultado = self._moda_histograma(canal, raio)
+        self._gravar(resultado, raio)
+
+    @descrever_filtro()
+    def moda7(self):
+        """
+        Aplica o filtro da moda com janela 7x7.
+        """
+        self.moda(raio=3)
 
 
+@registrar_filtros
 class Mediana(Filtros):
 
     matriz_filtro = [
@@ -498,116 +1962,109 @@ class Mediana(Filtros):
         [-0.5, -0.5, -0.5]
     ]
 
-    def mediana(self):
+    # Janelas com até esta quantidade de pixels são ordenadas diretamente;
+    # acima disso o histograma deslizante é mais rápido.
+    limite_ordenacao = 169
+
+    def _mediana_ordenando(self, canal, raio):
         """
-        Aplica filtros de passa_alta
+        Calcula a mediana ordenando parcialmente cada janela.
         """
+        tamanho = 2 * raio + 1
+        janelas = _janelas(canal, tamanho)
+        linhas, colunas = janelas.shape[:2]
+        meio = tamanho ** 2 // 2
 
-        # Limita a aplicação da técnica para pontos que possuem vizinhos.
-        # qtd_linhas_espaco = len(self.matriz_filtro) - 2
-        qtd_linhas_espaco = 2
-
-        x_final=self.imagem.imagem.width - qtd_linhas_espaco
-        y_final=self.imagem.imagem.height - qtd_linhas_espaco
-
-        generator = self.imagem._get_xy(
-            x_inicio=qtd_linhas_espaco,
-            y_inicio=qtd_linhas_espaco,
-            x_final=x_final,
-            y_final=y_final,
-        )
-
-        # j = (0, 1, 2)
-        j = (0, 1, 2, 3, 4)
-        matriz_aux = {x:{y:(0,0,0) for y in range(y_final + 1)} for x in range(x_final + 1)}
-
-        for x, y in generator:
-            soma = []
-            for i in range(0, 5):
-
-                soma.append(self.imagem.pixels[x-2+i, y-2][0])
-                soma.append(self.imagem.pixels[x-2+i, y-1][0])
-                soma.append(self.imagem.pixels[x-2+i, y][0])
-                soma.append(self.imagem.pixels[x-2+i, y+1][0])
-                soma.append(self.imagem.pixels[x-2+i, y+2][0])
-
-            soma.sort()
-            mediana = soma[13]
-            matriz_aux[x][y] = (mediana, mediana, mediana)
-
-
-        for x in range(x_final + 1):
-            matriz_aux[x][y_final] = self.imagem.pixels[x, y_final]
-            matriz_aux[x][0] = self.imagem.pixels[x, 0]
-
-        for y in range(y_final + 1):
-            matriz_aux[x_final][y] = self.imagem.pixels[x_final, y]
-            matriz_aux[0][y] = self.imagem.pixels[0, y]
-
-
-        generator = self.imagem._get_xy(
-            x_inicio=qtd_linhas_espaco,
-            y_inicio=qtd_linhas_espaco,
-            x_final=x_final,
-            y_final=y_final,
+        resultado = self.imagem.rascunhos.obter(
+            'resultado', (linhas, colunas), numpy.uint8
         )
+        for y in range(linhas):
+            tons = janelas[y].reshape(colunas, -1)
+            resultado[y] = numpy.partition(tons, meio, axis=1)[:, meio]
+            self.imagem._progredir(y + 1, linhas)
+        return resultado
 
-        for x, y in generator:
-            self.imagem.pixels[x, y] = matriz_aux[x][y]
-
-    def mediana7(self):
+    def _mediana_histograma(self, canal, raio):
         """
-        Aplica filtros de passa_alta
+        Calcula a mediana a partir dos histogramas deslizantes, com custo
+        por pixel constante em relação ao raio.
         """
+        tamanho = 2 * raio + 1
+        meio = tamanho ** 2 // 2
+        linhas = canal.shape[0] - tamanho + 1
+        colunas = canal.shape[1] - tamanho + 1
 
-        # Limita a aplicação da técnica para pontos que possuem vizinhos.
-        # qtd_linhas_espaco = len(self.matriz_filtro) - 2
-        qtd_linhas_espaco = 7
-
-        x_final=self.imagem.imagem.width - qtd_linhas_espaco/2
-        y_final=self.imagem.imagem.height - qtd_linhas_espaco/2
+        indices = numpy.arange(colunas)
 
-        generator = self.imagem._get_xy(
-            x_inicio=qtd_linhas_espaco,
-            y_inicio=qtd_linhas_espaco,
-            x_final=x_final,
-            y_final=y_final,
+        # A busca é feita em dois níveis: primeiro entre 16 faixas de 16 tons
+        # e depois apenas dentro da faixa que contém a mediana.
+        resultado = self.imagem.rascunhos.obter(
+            'resultado', (linhas, colunas), numpy.uint8
         )
+        histogramas = _histogramas_deslizantes(
+            canal, raio, self.imagem.rascunhos
+        )
+        for y, histograma in enumerate(histogramas):
+            finos = histograma.reshape(colunas, 16, 16)
+            acumulado = numpy.cumsum(
+                finos.sum(axis=2, dtype=numpy.int32), axis=1
+            )
+            faixa = (acumulado <= meio).sum(axis=1)
+            anteriores = numpy.where(
+                faixa > 0, acumulado[indices, faixa - 1], 0
+            )
+            acumulado = numpy.cumsum(
+                finos[indices, faixa], axis=1, dtype=numpy.int32
+            )
+            acumulado += anteriores[:, numpy.newaxis]
+            resultado[y] = faixa * 16 + (acumulado <= meio).sum(axis=1)
+            self.imagem._progredir(y + 1, linhas)
+        return resultado
 
-        matriz_aux = {x:{y:(0,0,0) for y in range(y_final + 1)} for x in range(x_final + 1)}
-
-        for x, y in generator:
-            soma = []
-            for i in range(0, qtd_linhas_espaco):
-                for j in range(0, qtd_linhas_espaco):
-                    soma.append(self.imagem.pixels[x-qtd_linhas_espaco+i, y-qtd_linhas_espaco+j][0])
-
-
-            soma.sort()
-            mediana = soma[qtd_linhas_espaco**2/2]
-            matriz_aux[x][y] = (mediana, mediana, mediana)
-
-
-        for x in range(x_final + 1):
-            matriz_aux[x][y_final] = self.imagem.pixels[x, y_final]
-            matriz_aux[x][0] = self.imagem.pixels[x, 0]
-
-        for y in range(y_final + 1):
-            matriz_aux[x_final][y] = self.imagem.pixels[x_final, y]
-            matriz_aux[0][y] = self.imagem.pixels[0, y]
-
+    @classmethod
+    def get_margem(cls, nome_filtro, raio=None, **kwargs):
+        """
+        Retorna o raio da janela.
+        """
+        if raio is not None:
+            return raio
+        return 3 if nome_filtro == 'mediana7' else 2
 
-        generator = self.imagem._get_xy(
-            x_inicio=qtd_linhas_espaco,
-            y_inicio=qtd_linhas_espaco,
-            x_final=x_final,
-            y_final=y_final,
-        )
+    @classmethod
+    def get_matrizes(cls, nome_filtro, **kwargs):
+        """
+        A mediana não usa matrizes.
+        """
+        return []
 
-        for x, y in generator:
-            self.imagem.pixels[x, y] = matriz_aux[x][y]
+    @descrever_filtro()
+    def mediana(self, raio=2):
+        """
+        Aplica o filtro da mediana com janela (2 * raio + 1) x (2 * raio + 1).
+        A versão original tomava o tom seguinte ao central (índice 13 de 25);
+        aqui é a mediana de fato.
+        """
+        canal = self._get_canal()
+        tamanho = 2 * raio + 1
+        if min(canal.shape) < tamanho:
+            self._converter_cinza()
+            return
+
+        if tamanho ** 2 <= self.limite_ordenacao:
+            resultado = self._mediana_ordenando(canal, raio)
+        else:
+            resultado = self._mediana_histograma(canal, raio)
+        self._gravar(resultado, raio)
+
+    @descrever_filtro()
+    def mediana7(self):
+        """
+        Aplica o filtro da mediana com janela 7x7.
+        """
+        self.mediana(raio=3)
 
 
+@registrar_filtros
 class Robert(Filtros):
 
     # matriz_y = [
@@ -632,67 +2089,51 @@ class Robert(Filtros):
         [-1, 0],
     ]
 
-    def correlacao(self, rotacionar_matriz_180=False):
+    @classmethod
+    def get_margem(cls, nome_filtro, **kwargs):
         """
-        Aplica o filtro de correlação.
+        A matriz y é aplicada sobre o resultado da matriz x.
         """
+        return len(cls.matriz_x) // 2 + len(cls.matriz_y) // 2
 
-        qtd_linhas_espaco = len(self.matriz_x) - 1
-
-        x_final=self.imagem.imagem.width - qtd_linhas_espaco
-        y_final=self.imagem.imagem.height - qtd_linhas_espaco
-
-        generator = self.imagem._get_xy(
-            x_inicio=qtd_linhas_espaco,
-            y_inicio=qtd_linhas_espaco,
-            x_final=self.imagem.imagem.width - qtd_linhas_espaco,
-            y_final=self.imagem.imagem.height - qtd_linhas_espaco,
-        )
-
-        matriz_aux = {x:{y:(0,0,0) for y in range(y_final + 1)} for x in range(x_final + 1)}
-
-        j = (0, 1, 2)
-        # if rotacionar_matriz_180:
-        #     j = (2, 1, 0)
-
-        for x, y in generator:
-            soma = 0
-            for i in range(0, 2):
-                soma += self.imagem.pixels[x-1+i, y-1][0] * self.matriz_x[i][j[0]]
-                soma += self.imagem.pixels[x-1+i, y][0] * self.matriz_x[i][j[1]]
-                # soma += self.imagem.pixels[x-1+i, y+1][0] * self.matriz_x[i][j[2]]
-            if soma > 25:
-                soma *= 2
-            matriz_aux[x][y] = (soma, soma, soma)
-
-        for x in range(x_final + 1):
-            matriz_aux[x][y_final] = self.imagem.pixels[x, y_final]
-            matriz_aux[x][0] = self.imagem.pixels[x, 0]
-
-        for y in range(y_final + 1):
-            matriz_aux[x_final][y] = self.imagem.pixels[x_final, y]
-            matriz_aux[0][y] = self.imagem.pixels[0, y]
-
-
-        generator = self.imagem._get_yx(
-            x_inicio=qtd_linhas_espaco,
-            y_inicio=qtd_linhas_espaco,
-            x_final=self.imagem.imagem.width - qtd_linhas_espaco,
-            y_final=self.imagem.imagem.height - qtd_linhas_espaco,
-        )
-
-        j = (0, 1, 2)
-        for x, y in generator:
-            soma = 0
-            for i in range(0, 2):
-                soma += matriz_aux[x-1+i][y-1][0] * self.matriz_y[i][j[0]]
-                soma += matriz_aux[x-1+i][y][0] * self.matriz_y[i][j[1]]
-                # soma += matriz_aux[x-1+i][y+1][0] * self.matriz_y[i][j[2]]
-            if soma > 25:
-                soma *= 2
-            self.imagem.pixels[x, y] = (soma, soma, soma)
+    @classmethod
+    def get_matrizes(cls, nome_filtro, **kwargs):
+        """
+        Retorna as matrizes x e y, na ordem (linha, coluna).
+        """
+        return [cls._orientar(cls.matriz_x), cls._orientar(cls.matriz_y)]
 
+    def _realcar(self, soma):
+        """
+        Reforça as respostas acima do limiar.
+        """
+        soma[soma > 25] *= 2
+        return soma
 
+    def correlacao(self, rotacionar_matriz_180=False):
+        """
+        Aplica o filtro de correlação.
+        """
+        canal = self._get_canal()
+        matriz_x, matriz_y = self.get_matrizes('robert_convolucao')
+        if min(canal.shape) < len(matriz_x):
+            self._converter_cinza()
+            return
+        deslocamento = len(matriz_x) // 2
+
+        resultado = self._realcar(self._correlacionar(
+            'robert_convolucao', canal, matriz_x, 0, 2
+        ))
+        auxiliar = self._expandir(resultado, canal, deslocamento)
+
+        resultado = self._realcar(self._correlacionar(
+            'robert_convolucao', auxiliar, matriz_y, 1, 2
+        ))
+        # Como na versão original, a última linha e a última coluna, que
+        # não possuem vizinhos abaixo e à direita, permanecem inalteradas.
+        self._gravar(resultado[:-1, :-1], deslocamento)
+
+    @descrever_filtro()
     def robert_convolucao(self):
         """
         Aplica o filtro de convolução.
@@ -700,8 +2141,12 @@ class Robert(Filtros):
         self.correlacao(rotacionar_matriz_180=True)
 
 
+@registrar_filtros
 class Sobel(Filtros):
 
+    # Filtro registrado da classe, aplicado por correlacao.
+    filtro_bordas = 'sobel_convolucao'
+
     matriz_x = [
         [1, 0, -1],
         [2, 0, -2],
@@ -714,72 +2159,53 @@ class Sobel(Filtros):
         [-1, -2, -1]
     ]
 
-    def correlacao(self, rotacionar_matriz_180=False):
+    @classmethod
+    def get_margem(cls, nome_filtro, **kwargs):
         """
-        Aplica o filtro de correlação.
+        A matriz y é aplicada sobre o resultado da matriz x.
         """
+        return len(cls.matriz_x) // 2 + len(cls.matriz_y) // 2
 
-        qtd_linhas_espaco = len(self.matriz_x) - 2
-
-        x_final=self.imagem.imagem.width - qtd_linhas_espaco
-        y_final=self.imagem.imagem.height - qtd_linhas_espaco
+    @classmethod
+    def get_matrizes(cls, nome_filtro, **kwargs):
+        """
+        Retorna as matrizes x e y, na ordem (linha, coluna).
+        """
+        return [cls._orientar(cls.matriz_x), cls._orientar(cls.matriz_y)]
 
-        generator = self.imagem._get_xy(
-            x_inicio=qtd_linhas_espaco,
-            y_inicio=qtd_linhas_espaco,
-            x_final=self.imagem.imagem.width - qtd_linhas_espaco,
-            y_final=self.imagem.imagem.height - qtd_linhas_espaco,
+    def correlacao(self, rotacionar_matriz_180=False):
+        """
+        Aplica o filtro de correlação.
+        """
+        canal = self._get_canal()
+        matriz_x, matriz_y = self.get_matrizes(self.filtro_bordas)
+        if min(canal.shape) < len(matriz_x):
+            self._converter_cinza()
+            return
+        deslocamento = len(matriz_x) // 2
+
+        resultado = self._correlacionar(
+            self.filtro_bordas, canal, matriz_x, 0, 2
         )
+        auxiliar = self._expandir(resultado, canal, deslocamento)
 
-        matriz_aux = {x:{y:(0,0,0) for y in range(y_final + 1)} for x in range(x_final + 1)}
-
-        j = (0, 1, 2)
-        # if rotacionar_matriz_180:
-        #     j = (2, 1, 0)
-
-        from IPython import embed; embed()
-        for x, y in generator:
-            soma = 0
-            for i in range(0, 3):
-                soma += self.imagem.pixels[x-1+i, y-1][0] * self.matriz_x[i][j[0]]
-                soma += self.imagem.pixels[x-1+i, y][0] * self.matriz_x[i][j[1]]
-                soma += self.imagem.pixels[x-1+i, y+1][0] * self.matriz_x[i][j[2]]
-            matriz_aux[x][y] = (soma, soma, soma)
-
-        for x in range(x_final + 1):
-            matriz_aux[x][y_final] = self.imagem.pixels[x, y_final]
-            matriz_aux[x][0] = self.imagem.pixels[x, 0]
-
-        for y in range(y_final + 1):
-            matriz_aux[x_final][y] = self.imagem.pixels[x_final, y]
-            matriz_aux[0][y] = self.imagem.pixels[0, y]
-
-
-        generator = self.imagem._get_yx(
-            x_inicio=qtd_linhas_espaco,
-            y_inicio=qtd_linhas_espaco,
-            x_final=self.imagem.imagem.width - qtd_linhas_espaco,
-            y_final=self.imagem.imagem.height - qtd_linhas_espaco,
+        resultado = self._correlacionar(
+            self.filtro_bordas, auxiliar, matriz_y, 1, 2
         )
+        self._gravar(resultado, deslocamento)
 
-        j = (0, 1, 2)
-        from IPython import embed; embed()
-        for x, y in generator:
-            soma = 0
-            for i in range(0, 3):
-                soma += matriz_aux[x-1+i][y-1][0] * self.matriz_y[i][j[0]]
-                soma += matriz_aux[x-1+i][y][0] * self.matriz_y[i][j[1]]
-                soma += matriz_aux[x-1+i][y+1][0] * self.matriz_y[i][j[2]]
-            self.imagem.pixels[x, y] = (soma, soma, soma)
-
-
+    @descrever_filtro(separavel=True)
     def sobel_convolucao(self):
         """
         Aplica o filtro de convolução.
         """
         self.correlacao(rotacionar_matriz_180=True)
 
-class Prewitt(Filtros):
+
+@registrar_filtros
+class Prewitt(Sobel):
+
+    filtro_bordas = 'prewitt_convolucao'
 
     matriz_x = [
         [1, 0, -1],
@@ -793,67 +2219,288 @@ class Prewitt(Filtros):
         [-1, -1, -1]
     ]
 
-    def correlacao(self, rotacionar_matriz_180=False):
+    @descrever_filtro(separavel=True)
+    def prewitt_convolucao(self):
         """
-        Aplica o filtro de correlação.
+        Aplica o filtro de convolução.
+        """
+        self.correlacao(rotacionar_matriz_180=True)
+
+
+@registrar_filtros
+class Gradiente(Filtros):
+    """
+    Magnitude e direção do gradiente, com Gx e Gy calculados do canal
+    original em uma única passada (ver _gradiente). Diferente dos filtros
+    de Sobel, Prewitt e Roberts acima, que aplicam a matriz y sobre o
+    resultado da matriz x.
+    """
+
+    # Matrizes da derivada em x (para a direita) e em y (para cima) e o
+    # ângulo, em graus, do eixo medido pela matriz x. As de Roberts medem
+    # as duas diagonais.
+    operadores = {
+        'sobel': (
+            [[-1, 0, 1], [-2, 0, 2], [-1, 0, 1]],
+            [[1, 2, 1], [0, 0, 0], [-1, -2, -1]],
+            0
+        ),
+        'prewitt': (
+            [[-1, 0, 1], [-1, 0, 1], [-1, 0, 1]],
+            [[1, 1, 1], [0, 0, 0], [-1, -1, -1]],
+            0
+        ),
+        'robert': ([[0, 1], [-1, 0]], [[1, 0], [0, -1]], 45),
+    }
+
+    @classmethod
+    def _get_operador(cls, operador):
         """
+        Retorna (matriz_x, matriz_y, rotacao) do operador.
+        """
+        if operador not in cls.operadores:
+            raise ValueError(
+                u'Operador de gradiente inválido: %s (use %s)'
+                % (operador, ', '.join(sorted(cls.operadores)))
+            )
+        return cls.operadores[operador]
+
+    @classmethod
+    def get_margem(cls, nome_filtro, operador='sobel', **kwargs):
+        """
+        Retorna o raio das matrizes do operador.
+        """
+        return len(cls._get_operador(operador)[0]) // 2
 
-        qtd_linhas_espaco = len(self.matriz_x) - 2
+    @classmethod
+    def get_matrizes(cls, nome_filtro, operador='sobel', **kwargs):
+        """
+        Retorna as matrizes x e y do operador.
+        """
+        matriz_x, matriz_y, _ = cls._get_operador(operador)
+        return [numpy.asarray(matriz_x), numpy.asarray(matriz_y)]
 
-        x_final=self.imagem.imagem.width - qtd_linhas_espaco
-        y_final=self.imagem.imagem.height - qtd_linhas_espaco
+    def calcular(self, operador='sobel', norma='l2', direcoes=None):
+        """
+        :return: (magnitude, orientacao, deslocamento) ou None
 
-        generator = self.imagem._get_xy(
-            x_inicio=qtd_linhas_espaco,
-            y_inicio=qtd_linhas_espaco,
-            x_final=self.imagem.imagem.width - qtd_linhas_espaco,
-            y_final=self.imagem.imagem.height - qtd_linhas_espaco,
+        Resultado de _gradiente sobre o plano de cinza, nos buffers de
+        rascunho. `deslocamento` é a posição do primeiro resultado na
+        imagem. Retorna None se a imagem for menor que as matrizes.
+        """
+        matriz_x, matriz_y, rotacao = self._get_operador(operador)
+        canal = self._get_canal()
+        if min(canal.shape) < len(matriz_x):
+            return None
+        magnitude, orientacao = _gradiente(
+            canal, matriz_x, matriz_y, norma, direcoes, rotacao,
+            self.imagem.rascunhos
         )
+        self.imagem._progredir(1, 1)
+        return magnitude, orientacao, len(matriz_x) // 2
+
+    @descrever_filtro()
+    def gradiente(self, operador='sobel', norma='l2', escala=1.0):
+        """
+        Substitui cada pixel pela magnitude do gradiente multiplicada pela
+        escala, limitada a 255.
+        """
+        resultado = self.calcular(operador, norma)
+        if resultado is None:
+            self._converter_cinza()
+            return
+        magnitude, _, deslocamento = resultado
+        if escala != 1:
+            magnitude = numpy.multiply(
+                magnitude, escala, dtype=numpy.float32
+            )
+        if magnitude.dtype.kind == 'f':
+            numpy.rint(magnitude, out=magnitude)
+        self._gravar(magnitude, deslocamento)
 
-        matriz_aux = {x:{y:(0,0,0) for y in range(y_final + 1)} for x in range(x_final + 1)}
 
-        j = (0, 1, 2)
-        # if rotacionar_matriz_180:
-        #     j = (2, 1, 0)
+OPERADORES_GRADIENTE = tuple(sorted(Gradiente.operadores))
 
-        from IPython import embed; embed()
-        for x, y in generator:
-            soma = 0
-            for i in range(0, 3):
-                soma += self.imagem.pixels[x-1+i, y-1][0] * self.matriz_x[i][j[0]]
-                soma += self.imagem.pixels[x-1+i, y][0] * self.matriz_x[i][j[1]]
-                soma += self.imagem.pixels[x-1+i, y+1][0] * self.matriz_x[i][j[2]]
-            matriz_aux[x][y] = (soma, soma, soma)
 
-        for x in range(x_final + 1):
-            matriz_aux[x][y_final] = self.imagem.pixels[x, y_final]
-            matriz_aux[x][0] = self.imagem.pixels[x, 0]
+@registrar_filtros
+class EstatisticasLocais(Filtros):
+    """
+    Estatísticas da vizinhança (2 * raio + 1) x (2 * raio + 1) de cada
+    pixel. O custo por pixel não depende do raio, o que permite janelas
+    grandes (por exemplo, raio 50 para estimar o fundo da imagem).
+    """
 
-        for y in range(y_final + 1):
-            matriz_aux[x_final][y] = self.imagem.pixels[x_final, y]
-            matriz_aux[0][y] = self.imagem.pixels[0, y]
+    @classmethod
+    def get_margem(cls, nome_filtro, raio=2, **kwargs):
+        """
+        Retorna o raio da janela.
+        """
+        return raio
 
+    @classmethod
+    def get_matrizes(cls, nome_filtro, **kwargs):
+        """
+        As estatísticas locais não usam matrizes.
+        """
+        return []
 
-        generator = self.imagem._get_yx(
-            x_inicio=qtd_linhas_espaco,
-            y_inicio=qtd_linhas_espaco,
-            x_final=self.imagem.imagem.width - qtd_linhas_espaco,
-            y_final=self.imagem.imagem.height - qtd_linhas_espaco,
+    def _aplicar(self, calcular, raio):
+        """
+        Grava na imagem o resultado de calcular(canal, raio).
+        """
+        canal = self._get_canal()
+        if min(canal.shape) < 2 * raio + 1:
+            self._converter_cinza()
+            return
+        resultado = calcular(canal, raio)
+        self.imagem._progredir(1, 1)
+        self._gravar(resultado, raio)
+
+    def _get_somas(self, canal, raio):
+        """
+        Soma dos tons e soma dos quadrados dos tons de cada janela.
+        """
+        rascunhos = self.imagem.rascunhos
+        somas = _somas_janelas(canal, raio, rascunhos)
+        self.imagem._progredir(1, 2)
+        quadrados = _somas_janelas(
+            canal, raio, rascunhos, quadrados=True, nome='somas_quadrados'
         )
+        return somas, quadrados
 
-        j = (0, 1, 2)
-        from IPython import embed; embed()
-        for x, y in generator:
-            soma = 0
-            for i in range(0, 3):
-                soma += matriz_aux[x-1+i][y-1][0] * self.matriz_y[i][j[0]]
-                soma += matriz_aux[x-1+i][y][0] * self.matriz_y[i][j[1]]
-                soma += matriz_aux[x-1+i][y+1][0] * self.matriz_y[i][j[2]]
-            self.imagem.pixels[x, y] = (soma, soma, soma)
+    def _variancia(self, canal, raio):
+        """
+        Variância dos tons de cada janela (float64).
+        """
+        somas, quadrados = self._get_somas(canal, raio)
+        quantidade = (2 * raio + 1) ** 2
+        # quantidade * soma(x²) - soma(x)² é exato nos inteiros.
+        numpy.multiply(quadrados, quantidade, out=quadrados)
+        quadrados -= somas * somas
+        variancia = self.imagem.rascunhos.obter('variancia', somas.shape)
+        return numpy.divide(quadrados, quantidade ** 2, out=variancia)
+
+    def _media(self, canal, raio):
+        """
+        Média dos tons de cada janela, arredondada.
+        """
+        somas = _somas_janelas(canal, raio, self.imagem.rascunhos)
+        quantidade = (2 * raio + 1) ** 2
+        somas *= 2
+        somas += quantidade
+        somas //= 2 * quantidade
+        return somas
+
+    def _extremo(self, canal, raio, funcao, neutro):
+        """
+        Mínimo ou máximo de cada janela, separado em linhas e colunas.
+        """
+        tamanho = 2 * raio + 1
+        parcial = _extremos_deslizantes(canal, tamanho, funcao, neutro, 1)
+        self.imagem._progredir(1, 2)
+        return _extremos_deslizantes(parcial, tamanho, funcao, neutro, 0)
 
+    @descrever_filtro(separavel=True)
+    def media_janela(self, raio=2):
+        """
+        Substitui cada pixel pela média simples da vizinhança.
+        """
+        self._aplicar(self._media, raio)
 
-    def prewitt_convolucao(self):
+    @descrever_filtro()
+    def variancia(self, raio=2):
         """
-        Aplica o filtro de convolução.
+        Substitui cada pixel pela variância da vizinhança, limitada a 255.
         """
-        self.correlacao(rotacionar_matriz_180=True)
+        self._aplicar(
+            lambda canal, raio: numpy.rint(self._variancia(canal, raio)),
+            raio
+        )
+
+    @descrever_filtro()
+    def desvio_padrao(self, raio=2):
+        """
+        Substitui cada pixel pelo desvio padrão da vizinhança.
+        """
+        def calcular(canal, raio):
+            variancia = self._variancia(canal, raio)
+            return numpy.rint(numpy.sqrt(variancia, out=variancia))
+        self._aplicar(calcular, raio)
+
+    @descrever_filtro(separavel=True)
+    def minimo_local(self, raio=2):
+        """
+        Substitui cada pixel pelo menor tom da vizinhança (erosão).
+        """
+        self._aplicar(
+            lambda canal, raio: self._extremo(canal, raio, numpy.minimum, 255),
+            raio
+        )
+
+    @descrever_filtro(separavel=True)
+    def maximo_local(self, raio=2):
+        """
+        Substitui cada pixel pelo maior tom da vizinhança (dilatação).
+        """
+        self._aplicar(
+            lambda canal, raio: self._extremo(canal, raio, numpy.maximum, 0),
+            raio
+        )
+
+
+@registrar_filtros
+class Pontuais(Filtros):
+    """
+    Filtros pontuais: cada tom t é trocado por tabela[t], com a tabela de
+    256 tons informada por get_tabela. Como dependem só do próprio pixel,
+    são fundidos com as demais operações pontuais no modo preguiçoso e
+    gravados sobre os pixels de entrada.
+    """
+
+    @classmethod
+    def get_margem(cls, nome_filtro, **kwargs):
+        """
+        Os filtros pontuais não usam vizinhos.
+        """
+        return 0
+
+    @classmethod
+    def get_matrizes(cls, nome_filtro, **kwargs):
+        """
+        Os filtros pontuais não usam matrizes.
+        """
+        return []
+
+    @classmethod
+    def get_tabela(cls, nome_filtro, gama=1.0, **kwargs):
+        """
+        Retorna a tabela de 256 tons do filtro para os parâmetros.
+        """
+        if gama <= 0:
+            raise ValueError(u'Gama deve ser positivo: %s' % gama)
+        tons = numpy.arange(256) / 255.0
+        return numpy.rint(255 * tons ** gama).astype(numpy.uint8)
+
+    def _aplicar_tabela(self, nome_filtro, **parametros):
+        """
+        Aplica a tabela do filtro. Nos filtros registrados como no_lugar, os
+        tons de uma imagem no modo "L" são trocados no próprio array dos
+        pixels, sem buffer de saída.
+        """
+        tabela = self.get_tabela(nome_filtro, **parametros)
+        canal = self._get_canal()
+        if (registro_filtros.obter(nome_filtro).no_lugar and
+                self.imagem.modo == "L" and canal.flags.writeable):
+            numpy.take(tabela, canal, out=canal)
+            self.imagem._descartar_contagens()
+        else:
+            self.imagem._gravar_canal_cinza(tabela[canal])
+        self.imagem._progredir(1, 1)
+
+    @descrever_filtro(pontual=True, no_lugar=True)
+    def gama(self, gama=1.0):
+        """
+        Correção gama: cada tom t passa a 255 * (t / 255) ** gama,
+        arredondado. Gamas menores que 1 clareiam a imagem.
+        """
+        self._aplicar_tabela('gama', gama=gama)
@@ -0,0 +1,432 @@
+#-*- coding: utf-8 -*-
+"""
+Processamento em faixas horizontais, para imagens maiores que a memória.
+
+A imagem de entrada é lida algumas linhas por vez e o resultado é gravado
+conforme cada faixa fica pronta, de modo que só uma faixa (mais a margem
+dos filtros) fica na memória.
+"""
+import os
+import tempfile
+
+from PIL import Image
+import numpy
+
+from bruto import EXTENSOES_BRUTAS, get_cabecalho
+from core import Imagem, OPERACOES_PONTUAIS, eh_pontual, registro_filtros
+
+
+# Formato bruto de cada linha no arquivo: (bytes por pixel, modo, inverter
+# a ordem dos canais).
+FORMATOS_BRUTOS = {
+    'L': (1, 'L', False),
+    'RGB': (3, 'RGB', False),
+    'BGR': (3, 'RGB', True),
+}
+
+# Operações que não dependem dos vizinhos e podem ser aplicadas em cada
+# faixa isoladamente.
+OPERACOES_FAIXA = OPERACOES_PONTUAIS + ('converter_rgb',)
+
+def _abrir(caminho_imagem):
+    """
+    Abre a imagem sem decodificá-la e sem o limite de tamanho do PIL.
+    """
+    limite = Image.MAX_IMAGE_PIXELS
+    Image.MAX_IMAGE_PIXELS = None
+    try:
+        return Image.open(caminho_imagem)
+    finally:
+        Image.MAX_IMAGE_PIXELS = limite
+
+
+class LeitorFaixas(object):
+    """
+    Lê faixas de linhas de uma imagem.
+
+    Em formatos sem compressão (PPM/PGM, BMP e TIFF sem compressão) as
+    linhas são lidas diretamente do arquivo, sem carregar a imagem inteira.
+    Nos demais formatos a imagem é decodificada por completo uma única vez.
+    """
+
+    def __init__(self, caminho_imagem, modo=None):
+        """
+        Inicialização da classe. O modo segue a mesma regra de Imagem.
+        """
+        imagem = _abrir(caminho_imagem)
+        self.caminho_imagem = caminho_imagem
+        self.largura, self.altura = imagem.size
+        if modo is None:
+            modo = "L" if imagem.mode in ("1", "L") else "RGB"
+        self.modo = modo
+        self._arquivo = None
+        self._pixels = None
+        self._blocos = self._get_blocos(imagem)
+        if self._blocos is None:
+            self._pixels = numpy.asarray(imagem.convert(modo), dtype=numpy.uint8)
+        else:
+            self._arquivo = open(caminho_imagem, 'rb')
+        imagem.close()
+
+    def _get_blocos(self, imagem):
+        """
+        :return: [(y_inicial, y_final, posicao, bytes_linha, formato,
+                   de_baixo_para_cima), ...] ou None
+
+        Descreve onde estão as linhas de cada bloco no arquivo, quando elas
+        estão gravadas sem compressão em um formato conhecido.
+        """
+        if imagem.mode not in ('L', 'RGB'):
+            return None
+
+        blocos = []
+        for bloco in imagem.tile:
+            decodificador, (x0, y0, x1, y1), posicao, argumentos = bloco[:4]
+            if isinstance(argumentos, str):
+                argumentos = (argumentos, 0, 1)
+            formato, bytes_linha, orientacao = (tuple(argumentos) + (0, 1))[:3]
+            if (decodificador != 'raw' or formato not in FORMATOS_BRUTOS or
+                    x0 != 0 or x1 != self.largura):
+                return None
+            bytes_pixel, modo, _ = FORMATOS_BRUTOS[formato]
+            if modo != imagem.mode:
+                return None
+            bytes_linha = bytes_linha or self.largura * bytes_pixel
+            blocos.append(
+                (y0, y1, posicao, bytes_linha, formato, orientacao < 0)
+            )
+        return blocos
+
+    def _ler_bloco(self, bloco, inicio, fim):
+        """
+        Lê as linhas [inicio, fim) de um bloco do arquivo.
+        """
+        y0, y1, posicao, bytes_linha, formato, invertido = bloco
+        bytes_pixel, _, inverter_canais = FORMATOS_BRUTOS[formato]
+        primeira = y1 - fim if invertido else inicio - y0
+        linhas = numpy.empty((fim - inicio, bytes_linha), dtype=numpy.uint8)
+        self._arquivo.seek(posicao + primeira * bytes_linha)
+        self._arquivo.readinto(linhas)
+
+        if invertido:
+            linhas = linhas[::-1]
+        linhas = linhas[:, :self.largura * bytes_pixel]
+        if bytes_pixel == 3:
+            linhas = linhas.reshape(fim - inicio, self.largura, 3)
+            if inverter_canais:
+                linhas = linhas[..., ::-1]
+        return linhas
+
+    def ler(self, inicio, fim):
+        """
+        Retorna as linhas [inicio, fim) como um array (linhas, largura) ou
+        (linhas, largura, 3), no modo do leitor.
+        """
+        if self._pixels is not None:
+            return self._pixels[inicio:fim]
+
+        fim = min(fim, self.altura)
+        if fim <= inicio:
+            forma = (0, self.largura) if self.modo == "L" else (0, self.largura, 3)
+            return numpy.empty(forma, dtype=numpy.uint8)
+
+        partes = []
+        for bloco in self._blocos:
+            y0, y1 = bloco[:2]
+            if y0 < fim and y1 > inicio:
+                partes.append(
+                    self._ler_bloco(bloco, max(inicio, y0), min(fim, y1))
+                )
+        linhas = numpy.concatenate(partes) if len(partes) > 1 else partes[0]
+
+        modo = "L" if linhas.ndim == 2 else "RGB"
+        if modo != self.modo:
+            linhas = numpy.asarray(
+                Image.fromarray(linhas).convert(self.modo), dtype=numpy.uint8
+            )
+        return numpy.ascontiguousarray(linhas)
+
+    def fechar(self):
+        """
+        Fecha o arquivo de entrada.
+        """
+        if self._arquivo is not None:
+            self._arquivo.close()
+            self._arquivo = None
+        self._pixels = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.fechar()
+
+
+def _verificar_linhas(linhas, forma_linha):
+    """
+    Recusa linhas com largura ou modo diferentes dos da imagem de saída.
+    """
+    if linhas.shape[1:] != forma_linha:
+        raise ValueError(
+            u'Faixa com linhas de forma %s; a imagem de saída espera %s'
+            % (linhas.shape[1:], forma_linha)
+        )
+
+
+class EscritorPNM(object):
+    """
+    Grava uma imagem PGM (modo "L") ou PPM (modo "RGB") linha a linha.
+    """
+
+    def __init__(self, caminho_imagem, largura, altura, modo):
+        """
+        Inicialização da classe. O cabeçalho é gravado imediatamente.
+        """
+        self.altura = altura
+        self.forma_linha = (largura,) if modo == "L" else (largura, 3)
+        self.linhas_gravadas = 0
+        self._arquivo = open(caminho_imagem, 'wb')
+        self._arquivo.write(get_cabecalho(largura, altura, modo))
+
+    def escrever(self, linhas):
+        """
+        Acrescenta as linhas ao final da imagem.
+        """
+        _verificar_linhas(linhas, self.forma_linha)
+        self._arquivo.write(numpy.ascontiguousarray(linhas).data)
+        self.linhas_gravadas += len(linhas)
+
+    def fechar(self):
+        """
+        Fecha o arquivo, verificando se todas as linhas foram gravadas.
+        """
+        self._arquivo.close()
+        if self.linhas_gravadas != self.altura:
+            raise ValueError(
+                u'Foram gravadas %d de %d linhas'
+                % (self.linhas_gravadas, self.altura)
+            )
+
+    def descartar(self):
+        """
+        Fecha e remove o arquivo incompleto.
+        """
+        self._arquivo.close()
+        os.unlink(self._arquivo.name)
+
+
+class EscritorCompleto(object):
+    """
+    Monta a imagem inteira na memória e a salva com o PIL ao fechar, para
+    formatos de saída que não podem ser gravados por faixas.
+    """
+
+    def __init__(self, caminho_imagem, largura, altura, modo):
+        """
+        Inicialização da classe.
+        """
+        self.caminho_imagem = caminho_imagem
+        self.forma_linha = (largura,) if modo == "L" else (largura, 3)
+        self.pixels = numpy.empty(
+            (altura,) + self.forma_linha, dtype=numpy.uint8
+        )
+        self.linhas_gravadas = 0
+
+    def escrever(self, linhas):
+        """
+        Copia as linhas para a imagem.
+        """
+        _verificar_linhas(linhas, self.forma_linha)
+        inicio = self.linhas_gravadas
+        self.pixels[inicio:inicio + len(linhas)] = linhas
+        self.linhas_gravadas += len(linhas)
+
+    def fechar(self):
+        """
+        Salva a imagem.
+        """
+        Image.fromarray(self.pixels).save(self.caminho_imagem)
+
+    def descartar(self):
+        """
+        Descarta a imagem sem salvá-la.
+        """
+        self.pixels = None
+
+
+def _criar_escritor(caminho_imagem, largura, altura, modo):
+    """
+    Escolhe o escritor conforme a extensão do arquivo de saída.
+    """
+    if caminho_imagem.lower().endswith(EXTENSOES_BRUTAS):
+        return EscritorPNM(caminho_imagem, largura, altura, modo)
+    return EscritorCompleto(caminho_imagem, largura, altura, modo)
+
+
+def _get_margem(operacoes):
+    """
+    Soma das margens dos filtros: quantas linhas vizinhas de cada lado
+    influenciam um pixel do resultado final.
+    """
+    margem = 0
+    for nome, args, kwargs in operacoes:
+        if nome == 'aplicar_filtro':
+            descricao, parametros = registro_filtros.vincular(args, kwargs)
+            if descricao is not None:
+                margem += descricao.get_margem(**parametros)
+        elif nome not in OPERACOES_FAIXA:
+            raise ValueError(
+                u'Operação não suportada no processamento em faixas: %s' % nome
+            )
+    return margem
+
+
+def _dividir_etapas(operacoes):
+    """
+    Divide as operações em etapas. A equalização precisa do histograma da
+    imagem inteira, então uma equalização que vem depois de um filtro de
+    vizinhança começa uma nova etapa; os filtros pontuais são aplicados
+    faixa a faixa no cálculo do histograma, como as demais operações
+    pontuais.
+    """
+    etapas = [[]]
+    for operacao in operacoes:
+        if operacao[0] == 'equalizar_imagem' and any(
+            nome not in OPERACOES_FAIXA and not eh_pontual(nome, args, kwargs)
+            for nome, args, kwargs in etapas[-1]
+        ):
+            etapas.append([])
+        etapas[-1].append(operacao)
+    return etapas
+
+
+def _aplicar(faixa, linhas, operacoes):
+    """
+    Aplica as operações em uma cópia das linhas e retorna a Imagem usada.
+
+    A mesma Imagem é reaproveitada entre as faixas (passe None na primeira)
+    para que seus buffers de rascunho sejam reutilizados em vez de
+    realocados a cada faixa.
+    """
+    if faixa is None:
+        faixa = Imagem.de_array(linhas)
+    else:
+        faixa.pixels = numpy.array(linhas, dtype=numpy.uint8)
+    for nome, args, kwargs in operacoes:
+        getattr(faixa, nome)(*args, **kwargs)
+    return faixa
+
+
+def _resolver_equalizacoes(leitor, operacoes, linhas_faixa):
+    """
+    Troca cada equalização pela tabela equivalente, calculada a partir do
+    histograma da imagem após as operações (pontuais) anteriores a ela,
+    percorrendo a imagem por faixas.
+    """
+    operacoes = list(operacoes)
+    for indice, (nome, _, _) in enumerate(operacoes):
+        if nome != 'equalizar_imagem':
+            continue
+        contagens = numpy.zeros(256, dtype=numpy.int64)
+        faixa = None
+        for inicio in range(0, leitor.altura, linhas_faixa):
+            faixa = _aplicar(
+                faixa, leitor.ler(inicio, inicio + linhas_faixa),
+                operacoes[:indice]
+            )
+            contagens += faixa.get_contagens()
+        tabela = Imagem._get_tabela_equalizacao(contagens)
+        operacoes[indice] = ('aplicar_tabela', (tabela,), {})
+    return operacoes
+
+
+def _processar_etapa(leitor, caminho_saida, operacoes, linhas_faixa,
+                     progredir=None):
+    """
+    Aplica as operações faixa a faixa e grava o resultado.
+
+    Cada faixa é lida com a margem dos filtros acima e abaixo; as linhas da
+    margem inferior são reaproveitadas como margem superior da faixa
+    seguinte, sem reler o arquivo.
+    """
+    operacoes = _resolver_equalizacoes(leitor, operacoes, linhas_faixa)
+    margem = _get_margem(operacoes)
+    altura = leitor.altura
+    escritor = None
+    faixa = None
+    anteriores = None
+    inicio_anteriores = 0
+    try:
+        for inicio in range(0, altura, linhas_faixa):
+            fim = min(inicio + linhas_faixa, altura)
+            inicio_halo = max(inicio - margem, 0)
+            fim_halo = min(fim + margem, altura)
+
+            if anteriores is None:
+                linhas = leitor.ler(inicio_halo, fim_halo)
+            else:
+                fim_anteriores = inicio_anteriores + len(anteriores)
+                linhas = numpy.concatenate((
+                    anteriores[inicio_halo - inicio_anteriores:],
+                    leitor.ler(fim_anteriores, fim_halo)
+                ))
+            anteriores, inicio_anteriores = linhas, inicio_halo
+
+            faixa = _aplicar(faixa, linhas, operacoes)
+            resultado = faixa.pixels[inicio - inicio_halo:fim - inicio_halo]
+
+            if escritor is None:
+                escritor = _criar_escritor(
+                    caminho_saida, leitor.largura, altura, faixa.modo
+                )
+            escritor.escrever(resultado)
+            if progredir is not None:
+                progredir(fim, altura)
+
+        if escritor is not None:
+            escritor.fechar()
+    except BaseException:
+        if escritor is not None:
+            escritor.descartar()
+        raise
+
+
+def processar_em_faixas(caminho_entrada, caminho_saida, operacoes,
+                        linhas_faixa=256, modo=None,
+                        diretorio_temporario=None, progredir=None):
+    """
+    Aplica as operações (no formato de lote.interpretar_pipeline) em uma
+    imagem, lendo e gravando por faixas de `linhas_faixa` linhas.
+
+    Apenas operações pontuais e filtros podem ser usados. Cada equalização
+    exige uma leitura extra da imagem para o histograma; quando ela vem
+    depois de um filtro, o resultado parcial é gravado em
+    um arquivo PGM/PPM temporário (em `diretorio_temporario`, que pode ser
+    /dev/shm) para que seu histograma seja calculado. Saídas PGM/PPM são
+    gravadas por faixas; os demais formatos são montados na memória.
+    `progredir(linhas_feitas, total)` é chamada a cada faixa de cada etapa.
+    """
+    etapas = _dividir_etapas(operacoes)
+    for etapa in etapas:
+        _get_margem(etapa)
+
+    entrada = caminho_entrada
+    temporarios = []
+    try:
+        for indice, etapa in enumerate(etapas):
+            if indice == len(etapas) - 1:
+                saida = caminho_saida
+            else:
+                descritor, saida = tempfile.mkstemp(
+                    suffix='.pnm', dir=diretorio_temporario
+                )
+                os.close(descritor)
+                temporarios.append(saida)
+
+            with LeitorFaixas(entrada, modo if indice == 0 else None) as leitor:
+                _processar_etapa(leitor, saida, etapa, linhas_faixa, progredir)
+            entrada = saida
+    finally:
+        for temporario in temporarios:
+            os.unlink(temporario)
+    return caminho_saida
@@ -0,0 +1,228 @@
+#-*- coding: utf-8 -*-
+from collections import OrderedDict
+import zlib
+
+import numpy
+
+
+class Ladrilho(object):
+    """
+    Bloco retangular dos pixels de um estado.
+
+    Um mesmo ladrilho é compartilhado por todos os estados em que aquele
+    bloco não mudou. Ele pode ficar descomprimido (array) ou comprimido
+    (zlib) quando a memória do histórico passa do limite.
+    """
+
+    def __init__(self, dados):
+        """
+        Inicialização da classe.
+        """
+        self.forma = dados.shape
+        self.dados = dados
+        self.comprimido = None
+
+    @property
+    def tamanho_bytes(self):
+        """
+        Memória ocupada pelo ladrilho.
+        """
+        if self.dados is not None:
+            return self.dados.nbytes
+        return len(self.comprimido)
+
+    def comprimir(self):
+        """
+        Troca o array pela sua versão comprimida.
+        """
+        if self.dados is not None:
+            self.comprimido = zlib.compress(self.dados.tobytes(), 1)
+            self.dados = None
+
+    def get_dados(self):
+        """
+        Retorna o array do ladrilho, descomprimindo-o se necessário.
+        """
+        if self.dados is None:
+            self.dados = numpy.frombuffer(
+                zlib.decompress(self.comprimido), dtype=numpy.uint8
+            ).reshape(self.forma)
+            self.comprimido = None
+        return self.dados
+
+
+class Estado(object):
+    """
+    Uma versão dos pixels da imagem, dividida em ladrilhos.
+    """
+
+    def __init__(self, forma, ladrilhos):
+        """
+        Inicialização da classe.
+        """
+        self.forma = forma
+        self.ladrilhos = ladrilhos
+
+    def montar(self):
+        """
+        Retorna um novo array com os pixels do estado.
+        """
+        pixels = numpy.empty(self.forma, dtype=numpy.uint8)
+        for (y, x), ladrilho in self.ladrilhos.items():
+            dados = ladrilho.get_dados()
+            pixels[y:y + dados.shape[0], x:x + dados.shape[1]] = dados
+        return pixels
+
+
+class Historico(object):
+    """
+    Histórico de estados de uma Imagem para desfazer e refazer operações.
+
+    Cada estado guarda os pixels divididos em ladrilhos de
+    `lado_ladrilho` x `lado_ladrilho`. Ao registrar um estado, apenas os
+    ladrilhos que mudaram em relação ao estado anterior são copiados; os
+    demais são compartilhados. Quando a memória ocupada passa de
+    `limite_bytes`, os estados usados há mais tempo são comprimidos e, se
+    ainda assim não couberem, os mais antigos são descartados.
+    """
+
+    def __init__(self, imagem, limite_bytes=256 * 2 ** 20, lado_ladrilho=256):
+        """
+        Inicialização da classe. O estado atual da imagem é o primeiro do
+        histórico.
+        """
+        self.imagem = imagem
+        self.limite_bytes = limite_bytes
+        self.lado_ladrilho = lado_ladrilho
+        self.estados = []
+        self.posicao = -1
+        # Estados em ordem de uso, do menos para o mais recente.
+        self._usos = OrderedDict()
+        self.registrar()
+
+    def _criar_estado(self, pixels, anterior):
+        """
+        Divide os pixels em ladrilhos, reaproveitando os do estado anterior
+        que não mudaram.
+        """
+        if anterior is not None and anterior.forma != pixels.shape:
+            anterior = None
+
+        lado = self.lado_ladrilho
+        ladrilhos = {}
+        for y in range(0, pixels.shape[0], lado):
+            for x in range(0, pixels.shape[1], lado):
+                bloco = pixels[y:y + lado, x:x + lado]
+                if anterior is not None:
+                    ladrilho = anterior.ladrilhos[(y, x)]
+                    if numpy.array_equal(ladrilho.get_dados(), bloco):
+                        ladrilhos[(y, x)] = ladrilho
+                        continue
+                ladrilhos[(y, x)] = Ladrilho(bloco.copy())
+        return Estado(pixels.shape, ladrilhos)
+
+    def _usar(self, estado):
+        """
+        Marca o estado como o usado mais recentemente.
+        """
+        self._usos.pop(id(estado), None)
+        self._usos[id(estado)] = estado
+
+    def _get_ladrilhos(self):
+        """
+        Retorna os ladrilhos distintos de todos os estados.
+        """
+        ladrilhos = {}
+        for estado in self.estados:
+            for ladrilho in estado.ladrilhos.values():
+                ladrilhos[id(ladrilho)] = ladrilho
+        return ladrilhos.values()
+
+    @property
+    def tamanho_bytes(self):
+        """
+        Memória ocupada pelos ladrilhos do histórico.
+        """
+        return sum(ladrilho.tamanho_bytes for ladrilho in self._get_ladrilhos())
+
+    def _aplicar_limite(self):
+        """
+        Comprime os estados menos usados e, se necessário, descarta os mais
+        antigos até que o histórico caiba no limite de memória.
+        """
+        atual = self.estados[self.posicao]
+        # Os ladrilhos do estado atual continuam descomprimidos, pois são
+        # comparados no próximo registro.
+        ladrilhos_atuais = set(
+            id(ladrilho) for ladrilho in atual.ladrilhos.values()
+        )
+        for estado in list(self._usos.values()):
+            if self.tamanho_bytes <= self.limite_bytes:
+                return
+            for ladrilho in estado.ladrilhos.values():
+                if id(ladrilho) not in ladrilhos_atuais:
+                    ladrilho.comprimir()
+
+        while self.tamanho_bytes > self.limite_bytes and self.posicao > 0:
+            descartado = self.estados.pop(0)
+            self._usos.pop(id(descartado), None)
+            self.posicao -= 1
+
+    def registrar(self):
+        """
+        Registra o estado atual da imagem, descartando os estados que
+        poderiam ser refeitos.
+        """
+        self.imagem.computar()
+        anterior = self.estados[self.posicao] if self.estados else None
+        for descartado in self.estados[self.posicao + 1:]:
+            self._usos.pop(id(descartado), None)
+        del self.estados[self.posicao + 1:]
+
+        estado = self._criar_estado(self.imagem.pixels, anterior)
+        self.estados.append(estado)
+        self.posicao += 1
+        self._usar(estado)
+        self._aplicar_limite()
+
+    @property
+    def pode_desfazer(self):
+        """
+        Indica se há um estado anterior.
+        """
+        return self.posicao > 0
+
+    @property
+    def pode_refazer(self):
+        """
+        Indica se há um estado seguinte (desfeito).
+        """
+        return self.posicao < len(self.estados) - 1
+
+    def _restaurar(self, posicao):
+        """
+        Substitui os pixels da imagem pelos do estado na posição.
+        """
+        self.posicao = posicao
+        estado = self.estados[posicao]
+        self.imagem.pixels = estado.montar()
+        self._usar(estado)
+        self._aplicar_limite()
+
+    def desfazer(self):
+        """
+        Volta ao estado anterior. Retorna False se não houver.
+        """
+        if not self.pode_desfazer:
+            return False
+        self._restaurar(self.posicao - 1)
+        return True
+
+    def refazer(self):
+        """
+        Avança para o estado seguinte. Retorna False se não houver.
+        """
+        if not self.pode_refazer:
+            return False
+        self._restaurar(self.posicao + 1)
+        return True
@@ -0,0 +1,279 @@
+#-*- coding: utf-8 -*-
+"""
+Medição do tempo e da memória de cada operação de Imagem.
+
+A medição fica desligada até que `instrumentacao.ativar()` seja chamada e
+pode ser ligada e desligada a qualquer momento. Cada operação medida gera
+um dicionário com:
+
+    operacao       nome da operação (por exemplo "aplicar_filtro:mediana")
+    segundos       tempo decorrido
+    pixels         quantidade de pixels da imagem
+    mp_s           vazão em megapixels por segundo
+    alocado_mb     pico de memória alocada durante a operação (tracemalloc)
+    rss_pico_mb    pico de memória residente do processo até ali
+
+que é entregue a cada destino registrado (log, JSON lines ou Prometheus).
+Operações chamadas de dentro de outra operação medida não são medidas
+separadamente.
+"""
+from contextlib import contextmanager
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    # Windows: o pico de memória residente não é informado.
+    resource = None
+
+from bruto import criar_temporario
+
+
+def get_rss_pico_mb():
+    """
+    Pico de memória residente do processo em MB, ou None se indisponível.
+    """
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # O Linux informa em KB e o macOS, em bytes.
+    if os.uname().sysname == 'Darwin':
+        return pico / 2 ** 20
+    return pico / 2 ** 10
+
+
+class DestinoLog(object):
+    """
+    Escreve cada medição em um logger.
+    """
+
+    def __init__(self, logger=None, nivel=logging.INFO):
+        """
+        Inicialização da classe.
+        """
+        self.logger = logger or logging.getLogger('pdi')
+        self.nivel = nivel
+
+    def registrar(self, medicao):
+        """
+        Escreve a medição.
+        """
+        self.logger.log(
+            self.nivel, '%s: %.4f s, %.2f MP/s, %s MB alocados, %s MB RSS',
+            medicao['operacao'], medicao['segundos'], medicao['mp_s'],
+            _formatar(medicao['alocado_mb']), _formatar(medicao['rss_pico_mb'])
+        )
+
+
+class DestinoJSONLinhas(object):
+    """
+    Acrescenta cada medição como uma linha JSON em um arquivo, que pode ser
+    compartilhado por vários processos.
+    """
+
+    def __init__(self, caminho):
+        """
+        Inicialização da classe.
+        """
+        self.caminho = caminho
+        self._trava = threading.Lock()
+
+    def registrar(self, medicao):
+        """
+        Grava a medição em uma única escrita.
+        """
+        medicao = dict(medicao, processo=os.getpid(), momento=time.time())
+        linha = json.dumps(medicao, sort_keys=True) + '\n'
+        with self._trava, open(self.caminho, 'a') as arquivo:
+            arquivo.write(linha)
+
+
+class DestinoPrometheus(object):
+    """
+    Acumula as medições por operação e as exporta no formato de texto do
+    Prometheus. Com `caminho`, o arquivo é reescrito a cada medição (para o
+    textfile collector do node_exporter).
+    """
+
+    def __init__(self, caminho=None, prefixo='pdi'):
+        """
+        Inicialização da classe.
+        """
+        self.caminho = caminho
+        self.prefixo = prefixo
+        self.operacoes = {}
+        self.rss_pico_mb = None
+        self._trava = threading.Lock()
+
+    def registrar(self, medicao):
+        """
+        Acumula a medição.
+        """
+        with self._trava:
+            totais = self.operacoes.setdefault(
+                medicao['operacao'],
+                {'quantidade': 0, 'segundos': 0.0, 'pixels': 0,
+                 'alocado_mb': 0.0}
+            )
+            totais['quantidade'] += 1
+            totais['segundos'] += medicao['segundos']
+            totais['pixels'] += medicao['pixels']
+            totais['alocado_mb'] = max(
+                totais['alocado_mb'], medicao['alocado_mb'] or 0.0
+            )
+            if medicao['rss_pico_mb'] is not None:
+                self.rss_pico_mb = medicao['rss_pico_mb']
+            texto = self.texto()
+
+        if self.caminho is not None:
+            diretorio = os.path.dirname(os.path.abspath(self.caminho))
+            # Legível pelo node_exporter, que costuma rodar com outro
+            # usuário (ver criar_temporario).
+            descritor, temporario = criar_temporario(diretorio)
+            with os.fdopen(descritor, 'w') as arquivo:
+                arquivo.write(texto)
+            os.replace(temporario, self.caminho)
+
+    def texto(self):
+        """
+        Métricas acumuladas no formato de texto do Prometheus.
+        """
+        metricas = [
+            ('operacao_segundos', 'summary',
+             u'Tempo das operações de Imagem.', None),
+            ('operacao_pixels_total', 'counter',
+             u'Pixels processados por operação.', 'pixels'),
+            ('operacao_alocado_pico_bytes', 'gauge',
+             u'Maior pico de memória alocada em uma operação.', 'alocado_mb'),
+        ]
+        linhas = []
+        for nome, tipo, descricao, campo in metricas:
+            nome = '%s_%s' % (self.prefixo, nome)
+            linhas.append('# HELP %s %s' % (nome, descricao))
+            linhas.append('# TYPE %s %s' % (nome, tipo))
+            for operacao, totais in sorted(self.operacoes.items()):
+                rotulo = '{operacao="%s"}' % operacao.replace('"', '\\"')
+                if campo is None:
+                    linhas.append('%s_count%s %d' % (
+                        nome, rotulo, totais['quantidade']
+                    ))
+                    linhas.append('%s_sum%s %r' % (
+                        nome, rotulo, totais['segundos']
+                    ))
+                elif campo == 'alocado_mb':
+                    linhas.append('%s%s %d' % (
+                        nome, rotulo, totais[campo] * 2 ** 20
+                    ))
+                else:
+                    linhas.append('%s%s %d' % (nome, rotulo, totais[campo]))
+
+        if self.rss_pico_mb is not None:
+            nome = '%s_rss_pico_bytes' % self.prefixo
+            linhas.append('# HELP %s %s' % (
+                nome, u'Pico de memória residente do processo.'
+            ))
+            linhas.append('# TYPE %s gauge' % nome)
+            linhas.append('%s %d' % (nome, self.rss_pico_mb * 2 ** 20))
+        return '\n'.join(linhas) + '\n'
+
+
+def _formatar(valor):
+    """
+    Formata um valor em MB que pode estar ausente.
+    """
+    return '-' if valor is None else '%.1f' % valor
+
+
+class Instrumentacao(object):
+    """
+    Liga, desliga e distribui as medições das operações.
+    """
+
+    def __init__(self):
+        """
+        Inicialização da classe.
+        """
+        self.ativa = False
+        self.alocacoes = False
+        self.destinos = []
+        self._local = threading.local()
+        self._iniciou_tracemalloc = False
+
+    def ativar(self, *destinos, alocacoes=True):
+        """
+        Liga a medição, acrescentando os destinos informados. Com
+        `alocacoes`, a memória alocada é medida pelo tracemalloc, o que
+        deixa as operações com muitos objetos Python mais lentas.
+        """
+        self.destinos.extend(destinos)
+        self.alocacoes = alocacoes
+        if alocacoes and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._iniciou_tracemalloc = True
+        self.ativa = True
+
+    def desativar(self):
+        """
+        Desliga a medição (os destinos são mantidos).
+        """
+        self.ativa = False
+        if self._iniciou_tracemalloc:
+            tracemalloc.stop()
+            self._iniciou_tracemalloc = False
+
+    def registrar(self, medicao):
+        """
+        Entrega a medição a todos os destinos.
+        """
+        for destino in self.destinos:
+            destino.registrar(medicao)
+
+    @contextmanager
+    def medir(self, operacao, obter_pixels):
+        """
+        Mede o bloco como a operação `operacao`. `obter_pixels()` é chamada
+        ao final e retorna a quantidade de pixels processados.
+        """
+        profundidade = getattr(self._local, 'profundidade', 0)
+        if not self.ativa or profundidade:
+            self._local.profundidade = profundidade + 1
+            try:
+                yield
+            finally:
+                self._local.profundidade = profundidade
+            return
+
+        alocacoes = self.alocacoes and tracemalloc.is_tracing()
+        if alocacoes:
+            inicio_alocado = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        self._local.profundidade = 1
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            segundos = time.perf_counter() - inicio
+            self._local.profundidade = 0
+
+        alocado_mb = None
+        if alocacoes:
+            pico = tracemalloc.get_traced_memory()[1]
+            alocado_mb = max(pico - inicio_alocado, 0) / 2 ** 20
+        pixels = obter_pixels()
+        self.registrar({
+            'operacao': operacao,
+            'segundos': segundos,
+            'pixels': pixels,
+            'mp_s': pixels / 1e6 / segundos if segundos else 0.0,
+            'alocado_mb': alocado_mb,
+            'rss_pico_mb': get_rss_pico_mb(),
+        })
+
+
+# Instância usada por core.Imagem.
+instrumentacao = Instrumentacao()
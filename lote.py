@@ -0,0 +1,358 @@
+#-*- coding: utf-8 -*-
+"""
+Processamento de imagens em lote, sem interface gráfica.
+
+Uso:
+    python lote.py 'imagens/*.jpg' -p cinza,equalizar,mediana:5,sobel -s saida
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import argparse
+import glob
+import os
+import sys
+
+from cache import CacheResultados
+from core import Imagem, OPERADORES_GRADIENTE, PADROES_CINZA
+from fluxo import processar_em_faixas
+from instrumentacao import DestinoJSONLinhas, instrumentacao
+
+
+def _padrao_cinza(valor):
+    """
+    Valida o padrão de conversão para cinza (ver core.PADROES_CINZA).
+    """
+    if valor not in PADROES_CINZA:
+        raise ValueError(
+            u'Padrão de cinza inválido: %s (use %s)'
+            % (valor, ', '.join(PADROES_CINZA))
+        )
+    return valor
+
+
+def _operador_gradiente(valor):
+    """
+    Valida o operador do gradiente (ver core.OPERADORES_GRADIENTE).
+    """
+    if valor not in OPERADORES_GRADIENTE:
+        raise ValueError(
+            u'Operador de gradiente inválido: %s (use %s)'
+            % (valor, ', '.join(OPERADORES_GRADIENTE))
+        )
+    return valor
+
+
+# Nome usado no pipeline: (método de Imagem, argumentos fixos).
+# O valor após ":" no pipeline é passado como argumento adicional.
+OPERACOES = {
+    'cinza': ('converter_escala_cinza', ()),
+    'rgb': ('converter_rgb', ()),
+    'equalizar': ('equalizar_imagem', ()),
+    'limiar': ('limiarizar', ()),
+    'media': ('aplicar_filtro', ('convolucao',)),
+    'passa_alta': ('aplicar_filtro', ('passa_alta',)),
+    'mediana': ('aplicar_filtro', ('mediana',)),
+    'moda': ('aplicar_filtro', ('moda',)),
+    'robert': ('aplicar_filtro', ('robert_convolucao',)),
+    'sobel': ('aplicar_filtro', ('sobel_convolucao',)),
+    'prewitt': ('aplicar_filtro', ('prewitt_convolucao',)),
+    'media_janela': ('aplicar_filtro', ('media_janela',)),
+    'variancia': ('aplicar_filtro', ('variancia',)),
+    'desvio_padrao': ('aplicar_filtro', ('desvio_padrao',)),
+    'minimo': ('aplicar_filtro', ('minimo_local',)),
+    'maximo': ('aplicar_filtro', ('maximo_local',)),
+    'gradiente': ('aplicar_filtro', ('gradiente',)),
+    'gama': ('aplicar_filtro', ('gama',)),
+}
+
+# Parâmetro que recebe o valor após ":" em cada operação e a função que
+# converte o texto.
+PARAMETROS = {
+    'cinza': ('padrao', _padrao_cinza),
+    'limiar': ('limiar', int),
+    'mediana': ('raio', int),
+    'moda': ('raio', int),
+    'media_janela': ('raio', int),
+    'variancia': ('raio', int),
+    'desvio_padrao': ('raio', int),
+    'minimo': ('raio', int),
+    'maximo': ('raio', int),
+    'gradiente': ('operador', _operador_gradiente),
+    'gama': ('gama', float),
+}
+
+EXTENSOES = (
+    '.bmp', '.gif', '.jpeg', '.jpg', '.pgm', '.png', '.pnm', '.ppm', '.tif',
+    '.tiff'
+)
+
+# Cache de cada diretório, mantido entre as tarefas de um mesmo processo.
+_caches = {}
+
+
+def _get_cache(diretorio_cache):
+    """
+    Retorna o cache de resultados gravado no diretório.
+    """
+    if diretorio_cache not in _caches:
+        _caches[diretorio_cache] = CacheResultados(diretorio=diretorio_cache)
+    return _caches[diretorio_cache]
+
+
+def _ativar_metricas(caminho_metricas):
+    """
+    Liga a medição das operações neste processo, gravando-as no arquivo.
+    """
+    if not any(
+        getattr(destino, 'caminho', None) == caminho_metricas
+        for destino in instrumentacao.destinos
+    ):
+        instrumentacao.ativar(DestinoJSONLinhas(caminho_metricas))
+
+
+def interpretar_pipeline(especificacao):
+    """
+    :return: [(metodo, args, kwargs), ...]
+
+    Converte uma especificação como "cinza,equalizar,mediana:5,sobel" na
+    lista de chamadas feitas sobre a Imagem. Em "mediana:5" e "moda:5" o
+    valor é o raio da janela (o mesmo vale para media_janela, variancia,
+    desvio_padrao, minimo e maximo); em "limiar:128", o limiar; em
+    "cinza:bt709", o padrão de conversão; em "gradiente:prewitt", o
+    operador.
+    """
+    operacoes = []
+    for item in especificacao.split(','):
+        nome, _, valor = item.strip().partition(':')
+        if nome not in OPERACOES:
+            raise ValueError(u'Operação desconhecida: %s' % nome)
+
+        metodo, args = OPERACOES[nome]
+        kwargs = {}
+        if valor:
+            if nome not in PARAMETROS:
+                raise ValueError(u'A operação %s não recebe valor' % nome)
+            parametro, converter = PARAMETROS[nome]
+            kwargs[parametro] = converter(valor)
+        operacoes.append((metodo, args, kwargs))
+    return operacoes
+
+
+def listar_entradas(entradas):
+    """
+    Expande diretórios e padrões glob na lista ordenada de imagens.
+    """
+    caminhos = []
+    for entrada in entradas:
+        if os.path.isdir(entrada):
+            candidatos = [
+                os.path.join(entrada, nome) for nome in os.listdir(entrada)
+            ]
+        else:
+            candidatos = glob.glob(entrada) or [entrada]
+
+        caminhos.extend(
+            caminho for caminho in candidatos
+            if caminho.lower().endswith(EXTENSOES)
+        )
+    return sorted(set(caminhos))
+
+
+def get_caminho_saida(caminho_imagem, diretorio_saida, formato=None):
+    """
+    Caminho da imagem gerada: o nome da entrada no diretório de saída, com
+    a extensão do formato, se informado.
+    """
+    nome, extensao = os.path.splitext(os.path.basename(caminho_imagem))
+    if formato:
+        extensao = '.' + formato.lstrip('.')
+    return os.path.join(diretorio_saida, nome + extensao)
+
+
+def _normalizar(caminho):
+    """
+    Forma canônica do caminho, para comparar arquivos.
+    """
+    return os.path.normcase(os.path.realpath(caminho))
+
+
+def verificar_saidas(caminhos, diretorio_saida, formato=None):
+    """
+    Levanta ValueError se a saída de uma imagem sobrescrever a própria
+    entrada ou se duas imagens gerarem o mesmo arquivo (nomes iguais em
+    diretórios diferentes, ou a.png e a.jpg com um formato de saída).
+    """
+    origens = {}
+    for caminho in caminhos:
+        saida = get_caminho_saida(caminho, diretorio_saida, formato)
+        chave = _normalizar(saida)
+        if chave == _normalizar(caminho):
+            raise ValueError(
+                u'A saída de %s sobrescreveria a própria entrada; escolha '
+                u'outro diretório de saída ou formato' % caminho
+            )
+        if chave in origens:
+            raise ValueError(
+                u'%s e %s gerariam o mesmo arquivo %s'
+                % (origens[chave], caminho, saida)
+            )
+        origens[chave] = caminho
+
+
+def _verificar_opcoes(diretorio_cache, linhas_faixa):
+    """
+    O processamento por faixas não consulta o cache de resultados.
+    """
+    if diretorio_cache is not None and linhas_faixa:
+        raise ValueError(
+            u'O cache de resultados não pode ser usado no processamento '
+            u'por faixas'
+        )
+
+
+def processar_arquivo(caminho_imagem, operacoes, diretorio_saida,
+                      formato=None, diretorio_cache=None, linhas_faixa=None,
+                      caminho_metricas=None):
+    """
+    Aplica as operações em uma imagem e a salva no diretório de saída,
+    com o mesmo nome (e, opcionalmente, outra extensão).
+
+    Com `linhas_faixa`, a imagem é processada por faixas (ver
+    fluxo.processar_em_faixas) sem ser carregada inteira na memória; nesse
+    caso o cache não pode ser usado. Com `caminho_metricas`, o tempo e a
+    memória de cada operação são gravados nesse arquivo (JSON lines, ver
+    instrumentacao.py). A entrada nunca é sobrescrita (ver
+    verificar_saidas).
+    """
+    _verificar_opcoes(diretorio_cache, linhas_faixa)
+    verificar_saidas([caminho_imagem], diretorio_saida, formato)
+    if caminho_metricas is not None:
+        _ativar_metricas(caminho_metricas)
+
+    caminho_saida = get_caminho_saida(caminho_imagem, diretorio_saida, formato)
+
+    if linhas_faixa:
+        return processar_em_faixas(
+            caminho_imagem, caminho_saida, operacoes, linhas_faixa
+        )
+
+    imagem = Imagem(caminho_imagem, preguicosa=True)
+    if diretorio_cache is not None:
+        imagem.cache = _get_cache(diretorio_cache)
+    for metodo, args, kwargs in operacoes:
+        getattr(imagem, metodo)(*args, **kwargs)
+    imagem.salvar(caminho_saida)
+    return caminho_saida
+
+
+def processar_lote(entradas, pipeline, diretorio_saida, processos=None,
+                   formato=None, diretorio_cache=None, linhas_faixa=None,
+                   caminho_metricas=None):
+    """
+    Processa as imagens em paralelo, uma por tarefa, gerando
+    (caminho_entrada, caminho_saida, erro) conforme cada uma termina.
+
+    `pipeline` pode ser uma especificação em texto ou a lista devolvida por
+    interpretar_pipeline. Com `diretorio_cache`, os resultados dos filtros
+    ficam gravados ali e são reaproveitados ao reprocessar as mesmas
+    imagens. Antes de processar qualquer imagem, levanta ValueError se as
+    opções forem incompatíveis ou as saídas colidirem (ver
+    verificar_saidas).
+    """
+    if not isinstance(pipeline, list):
+        pipeline = interpretar_pipeline(pipeline)
+    _verificar_opcoes(diretorio_cache, linhas_faixa)
+    caminhos = listar_entradas(entradas)
+    verificar_saidas(caminhos, diretorio_saida, formato)
+    if not os.path.isdir(diretorio_saida):
+        os.makedirs(diretorio_saida)
+
+    with ProcessPoolExecutor(max_workers=processos) as executor:
+        tarefas = {
+            executor.submit(
+                processar_arquivo, caminho, pipeline, diretorio_saida, formato,
+                diretorio_cache, linhas_faixa, caminho_metricas
+            ): caminho
+            for caminho in caminhos
+        }
+        for tarefa in as_completed(tarefas):
+            try:
+                yield tarefas[tarefa], tarefa.result(), None
+            except Exception as erro:
+                yield tarefas[tarefa], None, erro
+
+
+def main(argumentos=None):
+    """
+    Ponto de entrada da linha de comando.
+    """
+    parser = argparse.ArgumentParser(
+        description=u'Aplica um pipeline de operações em várias imagens.'
+    )
+    parser.add_argument(
+        'entradas', nargs='+',
+        help=u'Imagens, diretórios ou padrões glob (entre aspas).'
+    )
+    parser.add_argument(
+        '-p', '--pipeline', required=True,
+        help=u'Operações separadas por vírgula, por exemplo '
+             u'"cinza,equalizar,mediana:5,sobel". Disponíveis: %s.'
+             % ', '.join(sorted(OPERACOES))
+    )
+    parser.add_argument(
+        '-s', '--saida', required=True, help=u'Diretório de saída.'
+    )
+    parser.add_argument(
+        '-n', '--processos', type=int, default=None,
+        help=u'Quantidade de processos (padrão: um por núcleo).'
+    )
+    parser.add_argument(
+        '-f', '--formato', default=None,
+        help=u'Extensão das imagens geradas (padrão: a da entrada).'
+    )
+    parser.add_argument(
+        '-c', '--cache', default=None,
+        help=u'Diretório do cache de resultados, reaproveitado entre '
+             u'execuções.'
+    )
+    parser.add_argument(
+        '-l', '--linhas-faixa', type=int, default=None,
+        help=u'Processa cada imagem por faixas com esta quantidade de '
+             u'linhas, para imagens maiores que a memória.'
+    )
+    parser.add_argument(
+        '-m', '--metricas', default=None,
+        help=u'Arquivo JSON lines onde o tempo e a memória de cada operação '
+             u'são gravados.'
+    )
+    argumentos = parser.parse_args(argumentos)
+
+    if argumentos.cache is not None and argumentos.linhas_faixa:
+        parser.error(u'-c/--cache não pode ser usado com -l/--linhas-faixa')
+    try:
+        pipeline = interpretar_pipeline(argumentos.pipeline)
+        verificar_saidas(
+            listar_entradas(argumentos.entradas), argumentos.saida,
+            argumentos.formato
+        )
+    except ValueError as erro:
+        parser.error(erro)
+
+    falhas = 0
+    resultados = processar_lote(
+        argumentos.entradas, pipeline, argumentos.saida,
+        processos=argumentos.processos, formato=argumentos.formato,
+        diretorio_cache=argumentos.cache,
+        linhas_faixa=argumentos.linhas_faixa,
+        caminho_metricas=argumentos.metricas
+    )
+    for entrada, saida, erro in resultados:
+        if erro is None:
+            print(u'%s -> %s' % (entrada, saida))
+        else:
+            falhas += 1
+            print(u'%s: erro: %s' % (entrada, erro), file=sys.stderr)
+    return 1 if falhas else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,14 +1,23 @@
 #-*- coding: utf-8 -*-
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
 import kivy
 # kivy.require('1.9.0') # replace with your current kivy version !
 
 from kivy.app import App
+from kivy.clock import Clock
 from kivy.uix.image import Image
 from kivy.garden.graph import Graph, MeshLinePlot
+from kivy.graphics.texture import Texture
 from kivy.uix.boxlayout import BoxLayout
-from kivy.properties import ObjectProperty
+from kivy.uix.label import Label
+from kivy.uix.popup import Popup
+from kivy.properties import BooleanProperty, ObjectProperty
 
-from core import Imagem
+from cache import CacheResultados
+from core import Imagem, OperacaoCancelada
+from historico import Historico
 from menus import (
     MenuImagemDropDown,
     MenuArquivoDropDown,
@@ -19,14 +28,24 @@ from menus import (
 )
 
 
+# Cor da curva de cada canal do histograma, por modo da imagem.
+CORES_HISTOGRAMA = {
+    "L": [(1, 1, 1, 1)],
+    "RGB": [(1, 0, 0, 1), (0, 1, 0, 1), (0, 0, 1, 1)],
+}
+
+
 class MainLayout(BoxLayout):
     """
     Layout principal da aplicação.
     """
 
-    caminho_temp = 'imagens/temp.jpg'
     imagem = ObjectProperty()
     imagem_secundaria = ObjectProperty()
+    progresso = ObjectProperty()
+    # Há uma operação em andamento: as ações que alteram, trocam ou gravam
+    # a imagem ficam desabilitadas até a conclusão.
+    ocupado = BooleanProperty(False)
 
     def __init__(self, *args, **kwargs):
         """
@@ -45,37 +64,239 @@ class MainLayout(BoxLayout):
 
         self.imagem_core = None
         self.imagem_core_secundaria = None
+        self.historico = None
+        # Alternar entre variantes de um filtro reaproveita os resultados.
+        self.cache = CacheResultados()
         self.widgets_dinamicos = []
+        # O gráfico do histograma é criado uma vez e atualizado no lugar.
+        self.grafico = Graph(
+            xlabel='Tom',
+            ylabel='Quantidade de pixels',
+            padding=5,
+            xmin=0,
+            xmax=255,
+            ymin=0,
+            ymax=1
+        )
+        self.curvas = []
+        self.modo_histograma = None
+
+        # As operações rodam fora da thread principal, uma por vez, para que
+        # a janela continue respondendo.
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.tarefa = None
+        self.previa = None
+        self.percentual = None
         self.carregar_imagem(u'imagens/circle.png')
         self.carregar_imagem_secundaria(u'imagens/square.png')
 
+    def exibir(self, widget, imagem_core):
+        """
+        Copia os pixels da imagem diretamente para a textura do widget, sem
+        codificar a imagem nem passar pelo disco.
+
+        A textura é reaproveitada enquanto o tamanho e o modo não mudam.
+        """
+        formato = 'luminance' if imagem_core.modo == 'L' else 'rgb'
+        tamanho = (imagem_core.largura, imagem_core.altura)
+
+        textura = widget.texture
+        if (textura is None or tuple(textura.size) != tamanho or
+                textura.colorfmt != formato):
+            textura = Texture.create(size=tamanho, colorfmt=formato)
+            # O numpy guarda as linhas de cima para baixo e o OpenGL, de
+            # baixo para cima.
+            textura.flip_vertical()
+
+        textura.blit_buffer(
+            imagem_core.pixels.tobytes(), colorfmt=formato, bufferfmt='ubyte'
+        )
+        widget.texture = textura
+        widget.canvas.ask_update()
+
+    def executar(self, nome_operacao, *args, **kwargs):
+        """
+        Executa o método `nome_operacao` de imagem_core em segundo plano,
+        mostrando o andamento na barra de progresso. A imagem é recarregada
+        em tela ao final. Enquanto uma operação estiver em andamento (até
+        _concluir), novas chamadas são ignoradas.
+
+        Quando a imagem é maior que o widget, a mesma operação é aplicada
+        antes em uma cópia reduzida ao tamanho do widget, exibida assim que
+        fica pronta, até que o resultado em resolução total a substitua.
+        """
+        if self.ocupado:
+            return
+        self.ocupado = True
+        try:
+            escala = min(
+                1.0,
+                float(self.imagem.width) / self.imagem_core.largura,
+                float(self.imagem.height) / self.imagem_core.altura
+            )
+            self.previa = None
+            if escala < 1:
+                self.previa = self.imagem_core.get_reduzida(escala)
+                kwargs_previa = dict(kwargs)
+                if kwargs.get('imagem_secundaria') is not None:
+                    kwargs_previa['imagem_secundaria'] = (
+                        kwargs['imagem_secundaria'].get_reduzida(escala)
+                    )
+                tarefa_previa = self.executor.submit(
+                    getattr(self.previa, nome_operacao), *args,
+                    **kwargs_previa
+                )
+                tarefa_previa.add_done_callback(
+                    lambda tarefa, previa=self.previa: Clock.schedule_once(
+                        partial(self._mostrar_previa, tarefa, previa)
+                    )
+                )
+
+            self.imagem_core.cancelada = False
+            self.imagem_core.ao_progredir = self._ao_progredir
+            self.percentual = None
+            self.tarefa = self.executor.submit(
+                self._executar_e_registrar, self.historico,
+                getattr(self.imagem_core, nome_operacao), *args, **kwargs
+            )
+            self.tarefa.add_done_callback(
+                lambda tarefa: Clock.schedule_once(
+                    partial(self._concluir, tarefa)
+                )
+            )
+        except Exception as erro:
+            # Sem a tarefa, _concluir não será chamada: a janela é liberada
+            # aqui, e a prévia já submetida é interrompida e descartada.
+            if self.previa is not None:
+                self.previa.cancelar()
+            self.imagem_core.ao_progredir = None
+            self.progresso.value = 0
+            self.previa = None
+            self.ocupado = False
+            self._mostrar_erro(erro)
+
+    @staticmethod
+    def _executar_e_registrar(historico, operacao, *args, **kwargs):
+        """
+        Executa a operação e registra o resultado no histórico ainda na
+        thread de trabalho, onde a compressão das faixas não trava a janela.
+        """
+        operacao(*args, **kwargs)
+        historico.registrar()
+
+    def cancelar(self):
+        """
+        Cancela a operação em andamento.
+        """
+        if self.tarefa is not None and not self.tarefa.done():
+            if self.previa is not None:
+                self.previa.cancelar()
+            if not self.tarefa.cancel():
+                self.imagem_core.cancelar()
+
+    def _ao_progredir(self, feitas, total):
+        """
+        Recebe o andamento da thread de trabalho e agenda a atualização da
+        barra na thread principal (apenas quando o percentual muda).
+        """
+        percentual = 100 * feitas // total
+        if percentual != self.percentual:
+            self.percentual = percentual
+            Clock.schedule_once(partial(self._mostrar_progresso, percentual))
+
+    def _mostrar_progresso(self, percentual, *args):
+        """
+        Atualiza a barra de progresso.
+        """
+        self.progresso.value = percentual
+
+    def _mostrar_previa(self, tarefa, previa, *args):
+        """
+        Exibe a prévia reduzida, se o resultado final ainda não chegou.
+        """
+        if (previa is not self.previa or tarefa.cancelled() or
+                tarefa.exception() is not None or self.tarefa.done()):
+            return
+        self.exibir(self.imagem, previa)
+
+    def _concluir(self, tarefa, *args):
+        """
+        Finaliza uma operação em segundo plano, na thread principal. Erros
+        da operação são mostrados em uma janela.
+        """
+        try:
+            if not tarefa.cancelled():
+                tarefa.result()
+        except OperacaoCancelada:
+            pass
+        except Exception as erro:
+            self._mostrar_erro(erro)
+        finally:
+            self.progresso.value = 0
+            self.previa = None
+            self.ocupado = False
+            # Se a operação foi cancelada ou falhou, a imagem original volta
+            # a ocupar o lugar da prévia.
+            self.recarregar_imagem()
+
+    def _mostrar_erro(self, erro):
+        """
+        Mostra o erro de uma operação em uma janela.
+        """
+        Popup(
+            title=u'Erro',
+            content=Label(text=u'%s' % erro),
+            size_hint=(0.6, 0.3)
+        ).open()
+
     def recarregar_imagem(self):
         """
         Recarrega a imagem em tela.
         """
-        self.salvar_imagem(caminho_imagem=self.caminho_temp)
-        self.carregar_imagem(caminho_imagem=self.caminho_temp)
+        self.exibir(self.imagem, self.imagem_core)
+        if self.grafico.parent is not None:
+            self.atualizar_histograma()
 
     def carregar_imagem(self, caminho_imagem):
         """
         Carrega uma imagem.
         """
-        self.imagem.source = caminho_imagem
+        if self.ocupado:
+            return
         self.imagem_core = Imagem(caminho_imagem)
-        self.imagem.reload()
+        self.imagem_core.cache = self.cache
+        self.historico = Historico(self.imagem_core)
+        self.recarregar_imagem()
+
+    def desfazer(self):
+        """
+        Desfaz a última operação.
+        """
+        if not self.ocupado and self.historico.desfazer():
+            self.recarregar_imagem()
+
+    def refazer(self):
+        """
+        Refaz a última operação desfeita.
+        """
+        if not self.ocupado and self.historico.refazer():
+            self.recarregar_imagem()
 
     def carregar_imagem_secundaria(self, caminho_imagem):
         """
         Carrega uma imagem.
         """
-        self.imagem_secundaria.source = caminho_imagem
+        if self.ocupado:
+            return
         self.imagem_core_secundaria = Imagem(caminho_imagem)
-        self.imagem_secundaria.reload()
+        self.exibir(self.imagem_secundaria, self.imagem_core_secundaria)
 
     def salvar_imagem(self, caminho_imagem):
         """
         Salva a imagem.
         """
+        if self.ocupado:
+            return
         self.imagem_core.salvar(novo_caminho_imagem=caminho_imagem)
 
     def limpar(self):
@@ -84,53 +305,70 @@ class MainLayout(BoxLayout):
         """
         for widget in self.widgets_dinamicos:
             self.remove_widget(widget)
+        self.widgets_dinamicos = []
 
     def mostrar_imagem_cinza(self):
         """
         Mostra a imagem em escala de cinza.
         """
-        self.imagem_core.converter_escala_cinza()
-        self.recarregar_imagem()
+        self.executar('converter_escala_cinza')
 
     def mostrar_imagem_equalizada(self):
         """
         Mostra a imagem equalizada.
         """
-        self.imagem_core.equalizar_imagem()
-        self.recarregar_imagem()
+        self.executar('equalizar_imagem')
 
     def mostrar_histograma(self):
         """
         Mostra o histograma da imagem.
         """
-        histograma = self.imagem_core.get_histograma()
+        if self.ocupado:
+            return
+        self.atualizar_histograma()
+        if self.grafico.parent is None:
+            self.widgets_dinamicos.append(self.grafico)
+            self.add_widget(self.grafico)
 
-        graph = Graph(
-            xlabel='Tom de Cinza',
-            ylabel='Quantidade de tons',
-            padding=5,
-            xmin=0,
-            xmax=max(histograma.keys()),
-            ymin=0,
-            ymax=max(histograma.values())
-        )
-        plot = MeshLinePlot()
-        plot.points = histograma.items()
-        graph.add_plot(plot)
-        self.widgets_dinamicos.append(graph)
-        self.add_widget(graph)
+    def atualizar_histograma(self):
+        """
+        Atualiza as curvas do gráfico com o histograma da imagem, uma por
+        canal. As contagens ficam guardadas na imagem até os pixels mudarem.
+        """
+        contagens = self.imagem_core.get_contagens_canais()
+        modo = self.imagem_core.modo
+        if modo != self.modo_histograma:
+            for curva in self.curvas:
+                self.grafico.remove_plot(curva)
+            self.curvas = [
+                MeshLinePlot(color=cor) for cor in CORES_HISTOGRAMA[modo]
+            ]
+            for curva in self.curvas:
+                self.grafico.add_plot(curva)
+            self.grafico.xlabel = 'Tom de Cinza' if modo == "L" else 'Tom'
+            self.modo_histograma = modo
+
+        for curva, contagens_canal in zip(self.curvas, contagens):
+            curva.points = list(enumerate(contagens_canal.tolist()))
+        self.grafico.ymax = max(int(contagens.max()), 1)
 
     def aplicar_filtro(self, nome_filtro):
         """
         Aplica um filtro na imagem.
         """
-        self.imagem_core.aplicar_filtro(nome_filtro=nome_filtro)
-        self.recarregar_imagem()
+        self.executar('aplicar_filtro', nome_filtro=nome_filtro)
 
     def aplicar_operador_logico(self, nome_operador):
-        self.imagem_core.aplicar_logico(nome_operador, imagem_secundaria=self.imagem_core_secundaria)
-        # self.imagem_core.operador_and(self.imagem_core_secundaria)
-        self.recarregar_imagem()
+        self.executar(
+            'aplicar_logico', nome_operador,
+            imagem_secundaria=self.imagem_core_secundaria
+        )
+
+    def aplicar_operador_aritmetico(self, nome_operador):
+        """
+        Aplica um operador aritmético entre a imagem e a imagem secundária.
+        """
+        self.aplicar_operador_logico(nome_operador)
 
 class MainApp(App):
     """
@@ -0,0 +1,40 @@
+#-*- coding: utf-8 -*-
+import os
+import sys
+
+import numpy
+import pytest
+
+# Os módulos ficam na raiz do repositório, sem pacote.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def pixels():
+    """
+    Imagem em escala de cinza pequena, com tons aleatórios.
+    """
+    return numpy.random.default_rng(0).integers(
+        0, 256, (23, 31), dtype=numpy.uint8
+    )
+
+
+@pytest.fixture
+def pixels_rgb():
+    """
+    Imagem colorida pequena, com tons aleatórios.
+    """
+    return numpy.random.default_rng(1).integers(
+        0, 256, (23, 31, 3), dtype=numpy.uint8
+    )
+
+
+@pytest.fixture(params=[0o022, 0o027])
+def permissoes(request):
+    """
+    Troca a umask do processo durante o teste e retorna as permissões
+    esperadas dos arquivos gravados.
+    """
+    anterior = os.umask(request.param)
+    yield 0o666 & ~request.param
+    os.umask(anterior)
@@ -0,0 +1,64 @@
+#-*- coding: utf-8 -*-
+"""
+Formato bruto PGM/PPM (bruto.py).
+"""
+import os
+import stat
+
+import numpy
+import pytest
+
+from bruto import gravar_bruto, mapear_bruto
+from core import Imagem
+
+
+@pytest.mark.parametrize('nome', ['pixels', 'pixels_rgb'])
+def test_gravar_e_mapear(request, tmp_path, nome):
+    pixels = request.getfixturevalue(nome)
+    caminho = str(tmp_path / 'imagem.pnm')
+    gravar_bruto(caminho, pixels)
+    numpy.testing.assert_array_equal(mapear_bruto(caminho), pixels)
+    numpy.testing.assert_array_equal(Imagem(caminho).pixels, pixels)
+
+
+def test_mapeamento_copia_na_escrita_nao_altera_o_arquivo(tmp_path, pixels):
+    caminho = str(tmp_path / 'imagem.pgm')
+    gravar_bruto(caminho, pixels)
+    mapeados = mapear_bruto(caminho)
+    mapeados[...] = 0
+    numpy.testing.assert_array_equal(mapear_bruto(caminho), pixels)
+
+
+def test_arquivo_gravado_respeita_a_umask(tmp_path, pixels, permissoes):
+    caminho = str(tmp_path / 'imagem.pgm')
+    gravar_bruto(caminho, pixels)
+    assert stat.S_IMODE(os.stat(caminho).st_mode) == permissoes
+    assert os.listdir(str(tmp_path)) == ['imagem.pgm']
+
+
+def test_arquivo_truncado(tmp_path, pixels):
+    caminho = str(tmp_path / 'imagem.pgm')
+    gravar_bruto(caminho, pixels)
+    with open(caminho, 'r+b') as arquivo:
+        arquivo.truncate(os.path.getsize(caminho) - 1)
+    with pytest.raises(ValueError, match='truncado'):
+        mapear_bruto(caminho)
+
+
+def test_cabecalho_com_comentario(tmp_path):
+    caminho = str(tmp_path / 'imagem.pgm')
+    with open(caminho, 'wb') as arquivo:
+        arquivo.write(b'P5\n# comentario\n3 2\n255\n' + bytes(range(6)))
+    numpy.testing.assert_array_equal(
+        mapear_bruto(caminho), numpy.arange(6).reshape(2, 3)
+    )
+
+
+@pytest.mark.parametrize('conteudo', [
+    b'P2\n3 2\n255\n0 1 2 3 4 5\n', b'P5\n3 2\n65535\n' + bytes(12),
+])
+def test_formatos_nao_suportados(tmp_path, conteudo):
+    caminho = str(tmp_path / 'imagem.pgm')
+    with open(caminho, 'wb') as arquivo:
+        arquivo.write(conteudo)
+    assert mapear_bruto(caminho) is None
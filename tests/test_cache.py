@@ -0,0 +1,92 @@
+#-*- coding: utf-8 -*-
+"""
+Cache de resultados (cache.CacheResultados e Imagem.cache).
+"""
+import os
+import stat
+
+import numpy
+import pytest
+
+from cache import CacheResultados
+from core import Imagem, Sobel
+
+
+def _imagem(pixels, cache):
+    imagem = Imagem.de_array(pixels)
+    imagem.cache = cache
+    return imagem
+
+
+def test_filtro_pelo_nome_nomeado_usa_o_cache(pixels):
+    cache = CacheResultados()
+    _imagem(pixels, cache).aplicar_filtro(nome_filtro='mediana')
+    imagem = _imagem(pixels, cache)
+    imagem.aplicar_filtro(nome_filtro='mediana')
+    assert (cache.acertos, cache.falhas) == (1, 1)
+
+    esperado = Imagem.de_array(pixels)
+    esperado.aplicar_filtro('mediana')
+    numpy.testing.assert_array_equal(imagem.pixels, esperado.pixels)
+
+
+@pytest.mark.parametrize('args, kwargs', [
+    (('mediana',), {}),
+    (('mediana',), {'raio': 2}),
+    ((), {'nome_filtro': 'mediana', 'raio': 2}),
+    (('mediana', 2), {'processos': 2}),
+])
+def test_chamadas_equivalentes_tem_a_mesma_chave(pixels, args, kwargs):
+    cache = CacheResultados()
+    _imagem(pixels, cache).aplicar_filtro('mediana', 2)
+    _imagem(pixels, cache).aplicar_filtro(*args, **kwargs)
+    assert (cache.acertos, cache.falhas) == (1, 1)
+    assert len(cache._memoria) == 1
+
+
+def test_parametros_diferentes_tem_chaves_diferentes(pixels):
+    cache = CacheResultados()
+    _imagem(pixels, cache).aplicar_filtro('mediana', 2)
+    _imagem(pixels, cache).aplicar_filtro('mediana', 3)
+    _imagem(pixels, cache).aplicar_filtro('gradiente', 'sobel')
+    _imagem(pixels, cache).aplicar_filtro('gradiente', 'prewitt')
+    assert cache.acertos == 0
+
+
+def test_chave_depende_das_matrizes_aplicadas(monkeypatch, pixels):
+    cache = CacheResultados()
+    _imagem(pixels, cache).aplicar_filtro('sobel_convolucao')
+    monkeypatch.setattr(Sobel, 'matriz_x', [
+        [1, 0, -1],
+        [1, 0, -1],
+        [1, 0, -1]
+    ])
+    imagem = _imagem(pixels, cache)
+    imagem.aplicar_filtro('sobel_convolucao')
+    assert cache.acertos == 0
+
+    esperado = Imagem.de_array(pixels)
+    esperado.aplicar_filtro('sobel_convolucao')
+    numpy.testing.assert_array_equal(imagem.pixels, esperado.pixels)
+
+
+def test_limite_de_memoria_descarta_os_mais_antigos():
+    cache = CacheResultados(limite_memoria=250)
+    for tom in range(3):
+        cache.guardar(str(tom), numpy.full(100, tom, dtype=numpy.uint8))
+    assert cache.obter('0') is None
+    assert cache.obter('2')[0] == 2
+    assert cache.tamanho_bytes == 200
+
+
+def test_disco_compartilhado_entre_caches(tmp_path, pixels):
+    CacheResultados(diretorio=str(tmp_path)).guardar('chave', pixels)
+    outro = CacheResultados(diretorio=str(tmp_path))
+    numpy.testing.assert_array_equal(outro.obter('chave'), pixels)
+
+
+def test_arquivo_do_disco_respeita_a_umask(tmp_path, pixels, permissoes):
+    cache = CacheResultados(diretorio=str(tmp_path))
+    cache.guardar('chave', pixels)
+    modo = os.stat(cache._get_caminho('chave')).st_mode
+    assert stat.S_IMODE(modo) == permissoes
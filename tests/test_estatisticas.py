@@ -0,0 +1,83 @@
+#-*- coding: utf-8 -*-
+"""
+Estatísticas locais (media_janela, variancia, desvio_padrao, minimo_local e
+maximo_local) comparadas com a varredura direta das janelas.
+"""
+import numpy
+import pytest
+
+from core import Imagem
+
+
+ESTATISTICAS = {
+    'media_janela': lambda janela: round(janela.mean()),
+    'variancia': lambda janela: min(round(janela.var()), 255),
+    'desvio_padrao': lambda janela: round(janela.std()),
+    'minimo_local': lambda janela: janela.min(),
+    'maximo_local': lambda janela: janela.max(),
+}
+
+
+def estatistica_direta(canal, raio, estatistica):
+    """
+    Aplica a estatística em cada janela (2 * raio + 1) x (2 * raio + 1) que
+    cabe inteira no canal; as bordas ficam inalteradas.
+    """
+    esperado = canal.copy()
+    altura, largura = canal.shape
+    for y in range(raio, altura - raio):
+        for x in range(raio, largura - raio):
+            janela = canal[y - raio:y + raio + 1, x - raio:x + raio + 1]
+            esperado[y, x] = estatistica(janela.astype(numpy.float64))
+    return esperado
+
+
+def _aplicar(pixels, nome_filtro, raio):
+    imagem = Imagem.de_array(pixels)
+    imagem.aplicar_filtro(nome_filtro, raio=raio)
+    return imagem
+
+
+# A imagem tem 23 x 31 pixels: com raio 3 (janela 7) e 4 (janela 9) os
+# blocos de van Herk e Gil-Werman não dividem a largura nem a altura; com
+# raio 11 a janela tem a altura da imagem.
+@pytest.mark.parametrize('nome_filtro', sorted(ESTATISTICAS))
+@pytest.mark.parametrize('raio', [1, 2, 3, 4, 11])
+def test_igual_varredura_direta(pixels, nome_filtro, raio):
+    numpy.testing.assert_array_equal(
+        _aplicar(pixels, nome_filtro, raio).pixels,
+        estatistica_direta(pixels, raio, ESTATISTICAS[nome_filtro])
+    )
+
+
+@pytest.mark.parametrize('nome_filtro', sorted(ESTATISTICAS))
+def test_rgb_usa_o_plano_de_cinza(pixels_rgb, nome_filtro):
+    imagem = _aplicar(pixels_rgb, nome_filtro, 3)
+    assert imagem.modo == 'L'
+    numpy.testing.assert_array_equal(
+        imagem.pixels,
+        estatistica_direta(
+            Imagem.de_array(pixels_rgb).get_canal_cinza(), 3,
+            ESTATISTICAS[nome_filtro]
+        )
+    )
+
+
+@pytest.mark.parametrize('nome_filtro', sorted(ESTATISTICAS))
+def test_raio_maior_que_a_imagem(pixels, pixels_rgb, nome_filtro):
+    numpy.testing.assert_array_equal(
+        _aplicar(pixels, nome_filtro, 12).pixels, pixels
+    )
+    imagem = _aplicar(pixels_rgb, nome_filtro, 40)
+    assert imagem.modo == 'L'
+    numpy.testing.assert_array_equal(
+        imagem.pixels, Imagem.de_array(pixels_rgb).get_canal_cinza()
+    )
+
+
+def test_variancia_limitada_a_255():
+    # Tabuleiro de 0 e 255: variância perto de 255² / 4 em toda janela.
+    pixels = (numpy.indices((9, 9)).sum(axis=0) % 2 * 255).astype(numpy.uint8)
+    resultado = _aplicar(pixels, 'variancia', 1).pixels
+    assert (resultado[1:-1, 1:-1] == 255).all()
+    assert _aplicar(pixels, 'desvio_padrao', 1).pixels[4, 4] == 127
@@ -0,0 +1,92 @@
+#-*- coding: utf-8 -*-
+"""
+Processamento em faixas: paralelo (Imagem.aplicar_filtro com processos) e
+por arquivo (fluxo.processar_em_faixas) devem dar o resultado da imagem
+inteira.
+"""
+import numpy
+import pytest
+from PIL import Image
+
+from core import Imagem
+from fluxo import EscritorCompleto, EscritorPNM, processar_em_faixas
+
+
+@pytest.fixture
+def pixels_altos():
+    return numpy.random.default_rng(2).integers(
+        0, 256, (97, 41), dtype=numpy.uint8
+    )
+
+
+def _aplicar(pixels, nome_filtro, *args, **kwargs):
+    imagem = Imagem.de_array(pixels)
+    imagem.aplicar_filtro(nome_filtro, *args, **kwargs)
+    return imagem.pixels
+
+
+@pytest.mark.parametrize('args, kwargs', [
+    (('mediana', 6), {}),
+    (('mediana',), {'raio': 6}),
+    (('moda', 4), {}),
+    (('gradiente', 'robert', 'l1'), {}),
+])
+def test_processos_igual_imagem_inteira(pixels_altos, args, kwargs):
+    esperado = _aplicar(pixels_altos, *args, **kwargs)
+    numpy.testing.assert_array_equal(
+        _aplicar(pixels_altos, *args, processos=4, **kwargs), esperado
+    )
+
+
+@pytest.mark.parametrize('operacoes', [
+    [('aplicar_filtro', ('mediana', 6), {})],
+    [('aplicar_filtro', ('sobel_convolucao',), {}),
+     ('aplicar_filtro', ('moda', 3), {})],
+])
+def test_faixas_igual_imagem_inteira(tmp_path, pixels_altos, operacoes):
+    entrada = str(tmp_path / 'entrada.png')
+    saida = str(tmp_path / 'saida.pgm')
+    Image.fromarray(pixels_altos).save(entrada)
+
+    imagem = Imagem.de_array(pixels_altos)
+    for nome, args, kwargs in operacoes:
+        getattr(imagem, nome)(*args, **kwargs)
+
+    processar_em_faixas(entrada, saida, operacoes, linhas_faixa=16)
+    numpy.testing.assert_array_equal(
+        numpy.asarray(Image.open(saida)), imagem.pixels
+    )
+
+
+@pytest.mark.parametrize('operacoes, linhas_faixa, extensao', [
+    ([('aplicar_filtro', ('media_janela', 50), {})], 32, 'ppm'),
+    ([('aplicar_filtro', ('mediana', 20), {})], 16, 'png'),
+    ([('aplicar_filtro', ('gradiente',), {})], 1, 'ppm'),
+])
+def test_faixas_rgb_com_janela_maior_que_a_faixa(
+        tmp_path, pixels_altos, operacoes, linhas_faixa, extensao):
+    # As primeiras faixas são menores que a janela e ficam inalteradas,
+    # mas devem sair no modo "L", como as demais.
+    pixels = numpy.stack([pixels_altos, pixels_altos[::-1], pixels_altos], -1)
+    entrada = str(tmp_path / 'entrada.png')
+    saida = str(tmp_path / ('saida.' + extensao))
+    Image.fromarray(pixels).save(entrada)
+
+    imagem = Imagem.de_array(pixels)
+    for nome, args, kwargs in operacoes:
+        getattr(imagem, nome)(*args, **kwargs)
+
+    processar_em_faixas(entrada, saida, operacoes, linhas_faixa=linhas_faixa)
+    resultado = Image.open(saida)
+    assert resultado.mode == 'L'
+    numpy.testing.assert_array_equal(numpy.asarray(resultado), imagem.pixels)
+
+
+@pytest.mark.parametrize('classe', [EscritorPNM, EscritorCompleto])
+@pytest.mark.parametrize('forma', [(4, 10, 3), (4, 9)])
+def test_escritor_recusa_faixa_incompativel(tmp_path, classe, forma):
+    escritor = classe(str(tmp_path / 'saida.pgm'), 10, 8, 'L')
+    escritor.escrever(numpy.zeros((4, 10), dtype=numpy.uint8))
+    with pytest.raises(ValueError):
+        escritor.escrever(numpy.zeros(forma, dtype=numpy.uint8))
+    escritor.descartar()
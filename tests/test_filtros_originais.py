@@ -0,0 +1,208 @@
+#-*- coding: utf-8 -*-
+"""
+Compara os filtros com as implementações originais (pixel a pixel, com
+pixels[x, y]), transcritas aqui sobre arrays indexados por [y, x].
+"""
+from fractions import Fraction
+
+import numpy
+import pytest
+
+from core import Filtros, Imagem, PassaAlta, Prewitt, Robert, Sobel
+
+
+def _saturar(valores):
+    return numpy.clip(valores, 0, 255).astype(numpy.uint8)
+
+
+def _bordas_originais(auxiliar, fonte):
+    """
+    Bordas da matriz auxiliar, copiadas da imagem como no original.
+    """
+    auxiliar[0, :] = fonte[0, :]
+    auxiliar[-1, :] = fonte[-1, :]
+    auxiliar[:, 0] = fonte[:, 0]
+    auxiliar[:, -1] = fonte[:, -1]
+
+
+def correlacao_original(pixels, matriz, rotacionar_matriz_180=False):
+    """
+    Filtros.correlacao original, lendo sempre da imagem de entrada (o
+    original gravava na própria imagem durante a varredura). As somas são
+    exatas: em float, o original truncava para baixo algumas somas inteiras
+    conforme a ordem das parcelas.
+    """
+    matriz = [
+        [Fraction(valor).limit_denominator(1000) for valor in linha]
+        for linha in matriz
+    ]
+    fonte = pixels.astype(numpy.int64)
+    saida = pixels.copy()
+    altura, largura = pixels.shape
+    j = (2, 1, 0) if rotacionar_matriz_180 else (0, 1, 2)
+    for x in range(1, largura - 1):
+        for y in range(1, altura - 1):
+            soma = 0
+            for i in range(0, 3):
+                soma += fonte[y - 1, x - 1 + i] * matriz[i][j[0]]
+                soma += fonte[y, x - 1 + i] * matriz[i][j[1]]
+                soma += fonte[y + 1, x - 1 + i] * matriz[i][j[2]]
+            saida[y, x] = _saturar(int(soma))
+    return saida
+
+
+def passa_alta_original(pixels, matriz):
+    fonte = pixels.astype(numpy.int64)
+    altura, largura = pixels.shape
+    auxiliar = numpy.zeros((altura, largura), dtype=numpy.int64)
+    for x in range(1, largura - 1):
+        for y in range(1, altura - 1):
+            soma = 0
+            for i in range(0, 3):
+                for j in range(0, 3):
+                    soma += fonte[y - 1 + j, x - 1 + i] * matriz[i][j]
+            auxiliar[y, x] = max(int(soma), 0)
+    _bordas_originais(auxiliar, fonte)
+
+    saida = pixels.copy()
+    for x in range(1, largura - 1):
+        for y in range(1, altura - 1):
+            soma = 0
+            for i in range(0, 3):
+                for j in range(0, 3):
+                    soma += auxiliar[y - 1 + j, x - 1 + i] * matriz[i][j]
+            saida[y, x] = _saturar(max(int(soma), 0))
+    return saida
+
+
+def bordas_original(pixels, matriz_x, matriz_y, realcar=False):
+    """
+    Robert, Sobel e Prewitt originais: a matriz y é aplicada sobre o
+    resultado da matriz x. Em Robert (matrizes 2x2) a janela termina no
+    próprio pixel.
+    """
+    lado = len(matriz_x)
+    fonte = pixels.astype(numpy.int64)
+    altura, largura = pixels.shape
+
+    def aplicar(origem, matriz, x, y):
+        soma = 0
+        for i in range(lado):
+            for j in range(lado):
+                soma += origem[y - 1 + j, x - 1 + i] * matriz[i][j]
+        if realcar and soma > 25:
+            soma *= 2
+        return soma
+
+    auxiliar = numpy.zeros((altura, largura), dtype=numpy.int64)
+    for x in range(1, largura - 1):
+        for y in range(1, altura - 1):
+            auxiliar[y, x] = aplicar(fonte, matriz_x, x, y)
+    _bordas_originais(auxiliar, fonte)
+
+    saida = pixels.copy()
+    for x in range(1, largura - 1):
+        for y in range(1, altura - 1):
+            saida[y, x] = _saturar(aplicar(auxiliar, matriz_y, x, y))
+    return saida
+
+
+def _aplicar(pixels, nome_filtro):
+    imagem = Imagem.de_array(pixels)
+    imagem.aplicar_filtro(nome_filtro)
+    return imagem.pixels
+
+
+@pytest.mark.parametrize('nome_filtro, rotacionar', [
+    ('correlacao', False), ('convolucao', True)
+])
+def test_correlacao_igual_original(pixels, nome_filtro, rotacionar):
+    esperado = correlacao_original(
+        pixels, Filtros.matriz_filtro, rotacionar
+    )
+    numpy.testing.assert_array_equal(_aplicar(pixels, nome_filtro), esperado)
+
+
+def test_matriz_assimetrica_nao_transposta(monkeypatch):
+    # Uma matriz que só olha o vizinho da direita (i = x + 1).
+    pixels = numpy.arange(25, dtype=numpy.uint8).reshape(5, 5) * 10
+    matriz = [[0, 0, 0], [0, 0, 0], [0, 1, 0]]
+    monkeypatch.setattr(Filtros, 'matriz_filtro', matriz)
+    resultado = _aplicar(pixels, 'correlacao')
+    numpy.testing.assert_array_equal(
+        resultado, correlacao_original(pixels, matriz)
+    )
+    assert resultado[2, 2] == pixels[2, 3]
+
+
+def test_passa_alta_igual_original(pixels):
+    numpy.testing.assert_array_equal(
+        _aplicar(pixels, 'passa_alta'),
+        passa_alta_original(pixels, PassaAlta.matriz_filtro)
+    )
+
+
+@pytest.mark.parametrize('nome_filtro, classe, realcar', [
+    ('robert_convolucao', Robert, True),
+    ('sobel_convolucao', Sobel, False),
+    ('prewitt_convolucao', Prewitt, False),
+])
+def test_bordas_iguais_original(pixels, nome_filtro, classe, realcar):
+    numpy.testing.assert_array_equal(
+        _aplicar(pixels, nome_filtro),
+        bordas_original(pixels, classe.matriz_x, classe.matriz_y, realcar)
+    )
+
+
+def test_moda_igual_original(pixels):
+    # Poucos tons para que haja repetições nas janelas.
+    pixels = pixels // 64 * 64
+    esperado = pixels.copy()
+    altura, largura = pixels.shape
+    for x in range(2, largura - 2):
+        for y in range(2, altura - 2):
+            vizinhos = sorted(pixels[y - 2:y + 3, x - 2:x + 3].ravel())
+            incidencias = {}
+            for tom in vizinhos:
+                incidencias[tom] = incidencias.get(tom, 0) + 1
+            esperado[y, x] = sorted(
+                incidencias.items(), key=lambda item: item[1], reverse=True
+            )[0][0]
+    numpy.testing.assert_array_equal(_aplicar(pixels, 'moda'), esperado)
+
+
+def test_mediana_usa_elemento_central(pixels):
+    # O original tomava o 14º de 25 tons ordenados (índice 13); a mediana
+    # é o 13º (índice 12).
+    esperado = pixels.copy()
+    altura, largura = pixels.shape
+    for x in range(2, largura - 2):
+        for y in range(2, altura - 2):
+            esperado[y, x] = sorted(
+                pixels[y - 2:y + 3, x - 2:x + 3].ravel()
+            )[12]
+    numpy.testing.assert_array_equal(_aplicar(pixels, 'mediana'), esperado)
+
+
+@pytest.mark.parametrize('nome_filtro', [
+    'correlacao', 'convolucao', 'passa_alta', 'robert_convolucao',
+    'sobel_convolucao', 'prewitt_convolucao', 'moda', 'mediana',
+])
+@pytest.mark.parametrize('forma', [(1, 1), (1, 5), (2, 2), (5, 2)])
+def test_imagem_menor_que_a_matriz_fica_inalterada(nome_filtro, forma):
+    pixels = numpy.arange(numpy.prod(forma), dtype=numpy.uint8).reshape(forma)
+    numpy.testing.assert_array_equal(_aplicar(pixels, nome_filtro), pixels)
+
+
+@pytest.mark.parametrize('nome_filtro', [
+    'correlacao', 'passa_alta', 'robert_convolucao', 'sobel_convolucao',
+    'moda', 'mediana', 'gradiente', 'media_janela',
+])
+def test_imagem_rgb_menor_que_a_janela_passa_para_cinza(nome_filtro):
+    pixels = numpy.full((2, 2, 3), (10, 200, 30), dtype=numpy.uint8)
+    imagem = Imagem.de_array(pixels)
+    imagem.aplicar_filtro(nome_filtro)
+    assert imagem.modo == 'L'
+    numpy.testing.assert_array_equal(
+        imagem.pixels, Imagem.de_array(pixels).get_canal_cinza()
+    )
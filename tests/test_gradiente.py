@@ -0,0 +1,88 @@
+#-*- coding: utf-8 -*-
+"""
+Filtro gradiente e Imagem.get_gradiente, comparados com o cálculo direto.
+"""
+import numpy
+import pytest
+
+from core import Gradiente, Imagem
+
+
+def _correlacao_direta(canal, matriz):
+    matriz = numpy.asarray(matriz)
+    lado = len(matriz)
+    altura, largura = canal.shape[0] - lado + 1, canal.shape[1] - lado + 1
+    resultado = numpy.zeros((altura, largura), dtype=numpy.int64)
+    for i in range(lado):
+        for j in range(lado):
+            resultado += matriz[i, j] * canal[i:i + altura, j:j + largura]
+    return resultado
+
+
+def _gradiente_direto(pixels, operador):
+    matriz_x, matriz_y, rotacao = Gradiente.operadores[operador]
+    canal = pixels.astype(numpy.int64)
+    return (
+        _correlacao_direta(canal, matriz_x),
+        _correlacao_direta(canal, matriz_y),
+        rotacao, len(matriz_x) // 2
+    )
+
+
+@pytest.mark.parametrize('operador', ['sobel', 'prewitt', 'robert'])
+@pytest.mark.parametrize('norma', ['l1', 'l2'])
+def test_get_gradiente(pixels, operador, norma):
+    gx, gy, rotacao, deslocamento = _gradiente_direto(pixels, operador)
+    magnitude, orientacao = Imagem.de_array(pixels).get_gradiente(
+        operador, norma
+    )
+    assert magnitude.shape == orientacao.shape == pixels.shape
+
+    if norma == 'l1':
+        esperado = numpy.abs(gx) + numpy.abs(gy)
+    else:
+        esperado = numpy.sqrt(gx ** 2 + gy ** 2)
+    altura, largura = gx.shape
+    regiao = (
+        slice(deslocamento, deslocamento + altura),
+        slice(deslocamento, deslocamento + largura)
+    )
+    numpy.testing.assert_allclose(magnitude[regiao], esperado, rtol=1e-6)
+    interior = numpy.zeros(pixels.shape, dtype=bool)
+    interior[regiao] = True
+    assert not magnitude[~interior].any()
+
+    angulo = numpy.arctan2(gy, gx) * 4 / numpy.pi + rotacao / 45.0
+    numpy.testing.assert_array_equal(
+        orientacao[regiao], numpy.mod(numpy.rint(angulo), 4)
+    )
+
+
+def test_orientacao_em_mais_setores(pixels):
+    gx, gy, _, _ = _gradiente_direto(pixels, 'sobel')
+    _, orientacao = Imagem.de_array(pixels).get_gradiente(direcoes=8)
+    angulo = numpy.arctan2(gy, gx) * 8 / numpy.pi
+    numpy.testing.assert_array_equal(
+        orientacao[1:-1, 1:-1], numpy.mod(numpy.rint(angulo), 8)
+    )
+
+
+@pytest.mark.parametrize('escala', [1.0, 0.25])
+def test_filtro_gradiente(pixels_rgb, escala):
+    imagem = Imagem.de_array(pixels_rgb)
+    cinza = imagem.get_canal_cinza().copy()
+    gx, gy, _, _ = _gradiente_direto(cinza, 'sobel')
+
+    imagem.aplicar_filtro('gradiente', escala=escala)
+    assert imagem.modo == 'L'
+    esperado = cinza.copy()
+    esperado[1:-1, 1:-1] = numpy.clip(
+        numpy.rint(numpy.sqrt(gx ** 2 + gy ** 2) * escala), 0, 255
+    )
+    numpy.testing.assert_array_equal(imagem.pixels, esperado)
+
+
+@pytest.mark.parametrize('kwargs', [{'operador': 'canny'}, {'norma': 'l3'}])
+def test_parametros_invalidos(pixels, kwargs):
+    with pytest.raises(ValueError):
+        Imagem.de_array(pixels).aplicar_filtro('gradiente', **kwargs)
@@ -0,0 +1,113 @@
+#-*- coding: utf-8 -*-
+"""
+Mediana e moda com janelas grandes, calculadas pelos histogramas
+deslizantes, comparadas com a varredura direta das janelas.
+"""
+import numpy
+import pytest
+
+from core import Imagem, Mediana, Moda
+
+
+@pytest.fixture
+def pixels_grandes():
+    return numpy.random.default_rng(4).integers(
+        0, 256, (41, 53), dtype=numpy.uint8
+    )
+
+
+def varrer_janelas(canal, raio, estatistica):
+    """
+    Aplica a estatística em cada janela (2 * raio + 1) x (2 * raio + 1) que
+    cabe inteira no canal; as bordas ficam inalteradas.
+    """
+    esperado = canal.copy()
+    altura, largura = canal.shape
+    for y in range(raio, altura - raio):
+        for x in range(raio, largura - raio):
+            esperado[y, x] = estatistica(
+                canal[y - raio:y + raio + 1, x - raio:x + raio + 1].ravel()
+            )
+    return esperado
+
+
+def _aplicar(pixels, nome_filtro, raio):
+    imagem = Imagem.de_array(pixels)
+    imagem.aplicar_filtro(nome_filtro, raio=raio)
+    return imagem
+
+
+def mediana_direta(tons):
+    return numpy.sort(tons)[len(tons) // 2]
+
+
+@pytest.fixture
+def so_histograma(monkeypatch):
+    """
+    Garante que as janelas não sejam ordenadas nem contadas diretamente.
+    """
+    def falhar(*args):
+        raise AssertionError(u'caminho direto usado')
+    monkeypatch.setattr(Mediana, '_mediana_ordenando', falhar)
+    monkeypatch.setattr(Moda, '_moda_contando', falhar)
+
+
+@pytest.mark.parametrize('raio', [7, 12])
+def test_mediana_igual_varredura_direta(pixels_grandes, so_histograma, raio):
+    numpy.testing.assert_array_equal(
+        _aplicar(pixels_grandes, 'mediana', raio).pixels,
+        varrer_janelas(pixels_grandes, raio, mediana_direta)
+    )
+
+
+def test_mediana_poucos_tons(pixels_grandes, so_histograma):
+    # Muitos tons repetidos e a mediana no limite entre faixas de 16 tons.
+    pixels = (pixels_grandes // 85 * 16 + 15).astype(numpy.uint8)
+    numpy.testing.assert_array_equal(
+        _aplicar(pixels, 'mediana', 7).pixels,
+        varrer_janelas(pixels, 7, mediana_direta)
+    )
+
+
+def test_mediana_rgb(so_histograma):
+    pixels = numpy.random.default_rng(5).integers(
+        0, 256, (30, 34, 3), dtype=numpy.uint8
+    )
+    imagem = _aplicar(pixels, 'mediana', 7)
+    assert imagem.modo == 'L'
+    numpy.testing.assert_array_equal(
+        imagem.pixels, varrer_janelas(pixels[..., 0], 7, mediana_direta)
+    )
+
+
+def moda_direta(tons):
+    # argmax devolve o primeiro máximo: em caso de empate, o menor tom.
+    return numpy.bincount(tons, minlength=256).argmax()
+
+
+@pytest.mark.parametrize('raio', [7, 12])
+def test_moda_igual_varredura_direta(pixels_grandes, so_histograma, raio):
+    # Poucos tons, para que as janelas tenham modas e empates de fato.
+    pixels = (pixels_grandes // 32 * 32).astype(numpy.uint8)
+    numpy.testing.assert_array_equal(
+        _aplicar(pixels, 'moda', raio).pixels,
+        varrer_janelas(pixels, raio, moda_direta)
+    )
+
+
+def test_moda_empate_fica_com_o_menor_tom(so_histograma):
+    # Uma única janela 15 x 15 com 75 pixels de cada um dos três tons.
+    tons = numpy.repeat(numpy.array([200, 50, 120], dtype=numpy.uint8), 75)
+    pixels = numpy.random.default_rng(6).permutation(tons).reshape(15, 15)
+    assert _aplicar(pixels, 'moda', 7).pixels[7, 7] == 50
+
+
+def test_moda_rgb(so_histograma):
+    pixels = numpy.random.default_rng(7).integers(
+        0, 8, (30, 34, 3), dtype=numpy.uint8
+    ) * 30
+    imagem = _aplicar(pixels, 'moda', 7)
+    assert imagem.modo == 'L'
+    numpy.testing.assert_array_equal(
+        imagem.pixels, varrer_janelas(pixels[..., 0], 7, moda_direta)
+    )
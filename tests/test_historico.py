@@ -0,0 +1,104 @@
+#-*- coding: utf-8 -*-
+"""
+Histórico para desfazer e refazer (historico.py).
+"""
+import numpy
+
+from core import Imagem
+from historico import Historico
+
+
+def _imagem(altura=40, largura=50):
+    pixels = numpy.random.default_rng(4).integers(
+        0, 256, (altura, largura), dtype=numpy.uint8
+    )
+    return Imagem.de_array(pixels)
+
+
+def test_desfazer_e_refazer():
+    imagem = _imagem()
+    original = imagem.pixels.copy()
+    historico = Historico(imagem, lado_ladrilho=16)
+    assert not historico.pode_desfazer
+
+    imagem.aplicar_filtro('mediana')
+    filtrada = imagem.pixels.copy()
+    historico.registrar()
+    imagem.equalizar_imagem()
+    historico.registrar()
+
+    assert historico.desfazer()
+    numpy.testing.assert_array_equal(imagem.pixels, filtrada)
+    assert historico.desfazer()
+    numpy.testing.assert_array_equal(imagem.pixels, original)
+    assert not historico.desfazer()
+
+    assert historico.refazer()
+    numpy.testing.assert_array_equal(imagem.pixels, filtrada)
+    # Registrar depois de desfazer descarta o que poderia ser refeito.
+    imagem.limiarizar()
+    historico.registrar()
+    assert not historico.pode_refazer
+    assert len(historico.estados) == 3
+
+
+def test_ladrilhos_iguais_sao_compartilhados():
+    imagem = _imagem()
+    historico = Historico(imagem, lado_ladrilho=16)
+    pixels = imagem.pixels.copy()
+    pixels[0, 0] ^= 1
+    imagem.pixels = pixels
+    historico.registrar()
+
+    anterior, atual = historico.estados
+    assert len(atual.ladrilhos) == 3 * 4
+    diferentes = [
+        posicao for posicao, ladrilho in atual.ladrilhos.items()
+        if ladrilho is not anterior.ladrilhos[posicao]
+    ]
+    assert diferentes == [(0, 0)]
+
+
+def test_troca_de_modo_cria_estado_independente():
+    imagem = _imagem()
+    historico = Historico(imagem)
+    imagem.converter_rgb()
+    historico.registrar()
+    assert historico.desfazer()
+    assert imagem.modo == 'L'
+    assert historico.refazer()
+    assert imagem.modo == 'RGB'
+
+
+def test_limite_comprime_e_descarta_estados():
+    imagem = _imagem(64, 64)
+    estados = [imagem.pixels.copy()]
+    historico = Historico(imagem, limite_bytes=3 * 64 * 64, lado_ladrilho=32)
+    for _ in range(6):
+        imagem.pixels = numpy.random.default_rng(len(estados)).integers(
+            0, 256, (64, 64), dtype=numpy.uint8
+        )
+        estados.append(imagem.pixels.copy())
+        historico.registrar()
+        assert historico.tamanho_bytes <= historico.limite_bytes
+
+    # Tons aleatórios quase não comprimem: os estados mais antigos saem.
+    assert len(historico.estados) < len(estados)
+    restantes = estados[-len(historico.estados):]
+    for esperado in reversed(restantes[:-1]):
+        assert historico.desfazer()
+        numpy.testing.assert_array_equal(imagem.pixels, esperado)
+    assert not historico.desfazer()
+
+
+def test_estados_comprimidos_sao_restaurados():
+    imagem = Imagem.de_array(numpy.zeros((64, 64), dtype=numpy.uint8))
+    historico = Historico(imagem, limite_bytes=64 * 64 + 1024)
+    for tom in range(1, 5):
+        imagem.pixels = numpy.full((64, 64), tom, dtype=numpy.uint8)
+        historico.registrar()
+    # Imagens constantes comprimem bem: nenhum estado é descartado.
+    assert len(historico.estados) == 5
+    for tom in range(3, -1, -1):
+        assert historico.desfazer()
+        assert (imagem.pixels == tom).all()
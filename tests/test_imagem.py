@@ -0,0 +1,72 @@
+#-*- coding: utf-8 -*-
+"""
+Armazenamento dos pixels e modos "L" e "RGB" de Imagem.
+"""
+import numpy
+import pytest
+from PIL import Image
+
+from core import Imagem
+
+
+@pytest.mark.parametrize('modo_arquivo, modo', [
+    ('L', 'L'), ('1', 'L'), ('RGB', 'RGB'), ('P', 'RGB'), ('RGBA', 'RGB'),
+])
+def test_modo_ao_carregar(tmp_path, pixels_rgb, modo_arquivo, modo):
+    caminho = str(tmp_path / 'imagem.png')
+    Image.fromarray(pixels_rgb).convert(modo_arquivo).save(caminho)
+    imagem = Imagem(caminho)
+    assert imagem.modo == modo
+    assert imagem.pixels.dtype == numpy.uint8
+    assert (imagem.altura, imagem.largura) == pixels_rgb.shape[:2]
+    assert imagem.quantidade_pixels == pixels_rgb.shape[0] * pixels_rgb.shape[1]
+
+
+def test_modo_informado(tmp_path, pixels):
+    caminho = str(tmp_path / 'imagem.png')
+    Image.fromarray(pixels).save(caminho)
+    imagem = Imagem(caminho, modo='RGB')
+    assert imagem.modo == 'RGB'
+    for canal in range(3):
+        numpy.testing.assert_array_equal(imagem.pixels[..., canal], pixels)
+
+
+@pytest.mark.parametrize('extensao', ['png', 'bmp', 'pgm'])
+def test_salvar_e_carregar(tmp_path, pixels, extensao):
+    caminho = str(tmp_path / ('imagem.' + extensao))
+    Imagem.de_array(pixels).salvar(caminho)
+    numpy.testing.assert_array_equal(Imagem(caminho).pixels, pixels)
+
+
+def test_salvar_no_proprio_caminho(tmp_path, pixels):
+    caminho = str(tmp_path / 'imagem.png')
+    Image.fromarray(pixels).save(caminho)
+    imagem = Imagem(caminho)
+    imagem.limiarizar()
+    imagem.salvar()
+    numpy.testing.assert_array_equal(Imagem(caminho).pixels, imagem.pixels)
+
+
+def test_canal_cinza(pixels, pixels_rgb):
+    numpy.testing.assert_array_equal(
+        Imagem.de_array(pixels).get_canal_cinza(), pixels
+    )
+    # No modo "RGB", como na versão original, o primeiro canal.
+    numpy.testing.assert_array_equal(
+        Imagem.de_array(pixels_rgb).get_canal_cinza(), pixels_rgb[..., 0]
+    )
+
+
+def test_converter_rgb(pixels):
+    imagem = Imagem.de_array(pixels)
+    imagem.converter_rgb()
+    assert imagem.modo == 'RGB'
+    numpy.testing.assert_array_equal(imagem.pixels[..., 2], pixels)
+
+
+@pytest.mark.parametrize('escala, forma', [
+    (0.5, (12, 16)), (0.01, (1, 1)), (1, (23, 31)),
+])
+def test_reduzida(pixels_rgb, escala, forma):
+    reduzida = Imagem.de_array(pixels_rgb).get_reduzida(escala)
+    assert reduzida.pixels.shape == forma + (3,)
@@ -0,0 +1,114 @@
+#-*- coding: utf-8 -*-
+"""
+Medição das operações (instrumentacao.py).
+"""
+import json
+import os
+import stat
+
+import pytest
+
+from core import Imagem
+from instrumentacao import (
+    DestinoJSONLinhas, DestinoPrometheus, instrumentacao,
+)
+
+
+class DestinoLista(object):
+
+    def __init__(self):
+        self.medicoes = []
+
+    def registrar(self, medicao):
+        self.medicoes.append(medicao)
+
+
+@pytest.fixture
+def destino():
+    destino = DestinoLista()
+    instrumentacao.ativar(destino, alocacoes=False)
+    yield destino
+    instrumentacao.desativar()
+    del instrumentacao.destinos[:]
+
+
+def test_desligada_nao_mede(pixels):
+    destino = DestinoLista()
+    instrumentacao.destinos.append(destino)
+    try:
+        Imagem.de_array(pixels).aplicar_filtro('mediana')
+    finally:
+        del instrumentacao.destinos[:]
+    assert destino.medicoes == []
+
+
+def test_mede_operacoes_com_detalhe(destino, pixels):
+    imagem = Imagem.de_array(pixels)
+    imagem.aplicar_filtro('mediana', raio=1)
+    imagem.aplicar_filtro(nome_filtro='moda')
+    imagem.equalizar_imagem()
+
+    operacoes = [medicao['operacao'] for medicao in destino.medicoes]
+    assert operacoes[:2] == ['aplicar_filtro:mediana', 'aplicar_filtro:moda']
+    assert 'equalizar_imagem' in operacoes
+    for medicao in destino.medicoes:
+        assert medicao['pixels'] == pixels.size
+        assert medicao['segundos'] >= 0
+        assert medicao['alocado_mb'] is None
+
+
+def test_operacoes_internas_nao_sao_medidas_separadamente(destino, pixels):
+    # A equalização conta os tons (contar_tons, também medida) por dentro.
+    Imagem.de_array(pixels).equalizar_imagem()
+    assert [m['operacao'] for m in destino.medicoes] == ['equalizar_imagem']
+
+
+def test_alocacoes(pixels):
+    destino = DestinoLista()
+    instrumentacao.ativar(destino)
+    try:
+        Imagem.de_array(pixels).aplicar_filtro('mediana')
+    finally:
+        instrumentacao.desativar()
+        del instrumentacao.destinos[:]
+    assert destino.medicoes[0]['alocado_mb'] >= 0
+
+
+def test_json_linhas(tmp_path, pixels):
+    caminho = str(tmp_path / 'metricas.jsonl')
+    instrumentacao.ativar(DestinoJSONLinhas(caminho), alocacoes=False)
+    try:
+        imagem = Imagem.de_array(pixels)
+        imagem.aplicar_filtro('mediana')
+        imagem.limiarizar()
+    finally:
+        instrumentacao.desativar()
+        del instrumentacao.destinos[:]
+    with open(caminho) as arquivo:
+        linhas = [json.loads(linha) for linha in arquivo]
+    assert [linha['operacao'] for linha in linhas] == [
+        'aplicar_filtro:mediana', 'limiarizar'
+    ]
+    assert all(linha['processo'] == os.getpid() for linha in linhas)
+
+
+def test_prometheus(tmp_path, permissoes):
+    caminho = str(tmp_path / 'pdi.prom')
+    destino = DestinoPrometheus(caminho)
+    for segundos in (0.5, 0.25):
+        destino.registrar({
+            'operacao': 'aplicar_filtro:mediana', 'segundos': segundos,
+            'pixels': 100, 'mp_s': 0.0, 'alocado_mb': 1.0,
+            'rss_pico_mb': 2.0,
+        })
+    with open(caminho) as arquivo:
+        texto = arquivo.read()
+    assert texto == destino.texto()
+    rotulo = '{operacao="aplicar_filtro:mediana"}'
+    assert 'pdi_operacao_segundos_count%s 2\n' % rotulo in texto
+    assert 'pdi_operacao_segundos_sum%s 0.75\n' % rotulo in texto
+    assert 'pdi_operacao_pixels_total%s 200\n' % rotulo in texto
+    assert 'pdi_operacao_alocado_pico_bytes%s %d\n' % (rotulo, 2 ** 20) in texto
+    assert 'pdi_rss_pico_bytes %d\n' % (2 * 2 ** 20) in texto
+    assert stat.S_IMODE(os.stat(caminho).st_mode) == permissoes
+
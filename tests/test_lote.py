@@ -0,0 +1,116 @@
+#-*- coding: utf-8 -*-
+"""
+Processamento em lote (lote.py).
+"""
+import os
+
+import numpy
+import pytest
+from PIL import Image
+
+from core import Imagem
+from lote import interpretar_pipeline, main, processar_arquivo, processar_lote
+
+
+def _salvar(pixels, caminho):
+    caminho.parent.mkdir(parents=True, exist_ok=True)
+    Image.fromarray(pixels).save(str(caminho))
+    return str(caminho)
+
+
+def test_interpretar_pipeline():
+    assert interpretar_pipeline('cinza:bt709,equalizar,mediana:5,gradiente') == [
+        ('converter_escala_cinza', (), {'padrao': 'bt709'}),
+        ('equalizar_imagem', (), {}),
+        ('aplicar_filtro', ('mediana',), {'raio': 5}),
+        ('aplicar_filtro', ('gradiente',), {}),
+    ]
+
+
+@pytest.mark.parametrize('especificacao', [
+    'desconhecida', 'sobel:3', 'mediana:x', 'gradiente:canny',
+])
+def test_interpretar_pipeline_invalido(especificacao):
+    with pytest.raises(ValueError):
+        interpretar_pipeline(especificacao)
+
+
+def test_processar_lote(tmp_path, pixels, pixels_rgb):
+    entradas = [
+        _salvar(pixels, tmp_path / 'entrada' / 'a.png'),
+        _salvar(pixels_rgb, tmp_path / 'entrada' / 'b.png'),
+    ]
+    saida = str(tmp_path / 'saida')
+    resultados = sorted(processar_lote(
+        [str(tmp_path / 'entrada')], 'cinza,mediana:1', saida, processos=2,
+        formato='pgm'
+    ))
+    assert [erro for _, _, erro in resultados] == [None, None]
+    for entrada, caminho_saida, _ in resultados:
+        esperado = Imagem(entrada)
+        esperado.converter_escala_cinza()
+        esperado.aplicar_filtro('mediana', raio=1)
+        assert caminho_saida == os.path.join(
+            saida, os.path.basename(entrada)[:-4] + '.pgm'
+        )
+        numpy.testing.assert_array_equal(
+            Imagem(caminho_saida).pixels, esperado.pixels
+        )
+
+
+@pytest.mark.parametrize('nomes, formato', [
+    (['um/a.png', 'dois/a.png'], None),
+    (['um/a.png', 'um/a.jpg'], 'png'),
+])
+def test_saidas_repetidas_sao_recusadas(tmp_path, pixels, nomes, formato):
+    for nome in nomes:
+        _salvar(pixels, tmp_path / nome)
+    entradas = [str(tmp_path / nome) for nome in nomes]
+    with pytest.raises(ValueError, match='mesmo arquivo'):
+        list(processar_lote(
+            entradas, 'cinza', str(tmp_path / 'saida'), formato=formato
+        ))
+    assert not (tmp_path / 'saida').exists()
+
+
+def test_entrada_nao_e_sobrescrita(tmp_path, pixels):
+    entrada = _salvar(pixels, tmp_path / 'a.png')
+    with pytest.raises(ValueError, match='própria entrada'):
+        list(processar_lote([entrada], 'sobel', str(tmp_path)))
+    with pytest.raises(ValueError, match='própria entrada'):
+        processar_arquivo(entrada, interpretar_pipeline('sobel'), str(tmp_path))
+    numpy.testing.assert_array_equal(Imagem(entrada).pixels, pixels)
+
+    # Com outro formato a saída é outro arquivo.
+    saida = processar_arquivo(
+        entrada, interpretar_pipeline('sobel'), str(tmp_path), formato='pgm'
+    )
+    assert saida == str(tmp_path / 'a.pgm')
+
+
+def test_cache_com_faixas_e_recusado(tmp_path, pixels, capsys):
+    entrada = _salvar(pixels, tmp_path / 'a.png')
+    argumentos = [
+        entrada, '-p', 'sobel', '-s', str(tmp_path / 'saida'),
+        '-c', str(tmp_path / 'cache'), '-l', '16',
+    ]
+    with pytest.raises(SystemExit):
+        main(argumentos)
+    assert '--cache' in capsys.readouterr().err
+    with pytest.raises(ValueError):
+        processar_arquivo(
+            entrada, interpretar_pipeline('sobel'), str(tmp_path / 'saida'),
+            diretorio_cache=str(tmp_path / 'cache'), linhas_faixa=16
+        )
+
+
+def test_main(tmp_path, pixels):
+    entrada = _salvar(pixels, tmp_path / 'a.png')
+    saida = tmp_path / 'saida'
+    assert main([entrada, '-p', 'moda:1', '-s', str(saida), '-l', '8',
+                 '-n', '1']) == 0
+    esperado = Imagem(entrada)
+    esperado.aplicar_filtro('moda', raio=1)
+    numpy.testing.assert_array_equal(
+        Imagem(str(saida / 'a.png')).pixels, esperado.pixels
+    )
@@ -0,0 +1,164 @@
+#-*- coding: utf-8 -*-
+"""
+Operações entre duas imagens (Imagem.operar).
+"""
+import numpy
+import pytest
+
+from core import Imagem
+
+
+@pytest.mark.parametrize('alfa', [0, 0.25, 0.5, 1])
+def test_mistura(pixels, alfa):
+    secundaria = pixels[::-1].copy()
+    imagem = Imagem.de_array(pixels)
+    imagem.operador_mistura(Imagem.de_array(secundaria), alfa=alfa)
+    esperado = (1 - alfa) * pixels + alfa * secundaria.astype(numpy.float64)
+    assert numpy.abs(imagem.pixels - esperado).max() <= 0.5 + 1e-9
+
+
+@pytest.mark.parametrize('alfa', [-0.1, 1.5, float('nan')])
+def test_mistura_recusa_alfa_fora_do_intervalo(pixels, alfa):
+    imagem = Imagem.de_array(pixels)
+    with pytest.raises(ValueError):
+        imagem.operador_mistura(Imagem.de_array(pixels), alfa=alfa)
+    numpy.testing.assert_array_equal(imagem.pixels, pixels)
+
+
+# Todas as combinações de tons: a[y, x] = y e b[y, x] = x, incluindo os
+# casos que estouram o uint8 para cima e para baixo.
+TONS_A, TONS_B = numpy.indices((256, 256), dtype=numpy.int64)
+
+ESPERADOS = {
+    'and': lambda a, b: a & b,
+    'or': lambda a, b: a | b,
+    'xor': lambda a, b: a ^ b,
+    'soma': lambda a, b: numpy.clip(a + b, 0, 255),
+    'subtracao': lambda a, b: numpy.clip(a - b, 0, 255),
+    'diferenca': lambda a, b: numpy.abs(a - b),
+    'multiplicacao': lambda a, b: numpy.rint(a * b / 255.0),
+    'minimo': numpy.minimum,
+    'maximo': numpy.maximum,
+}
+
+
+def _operar(pixels, secundaria, operacao, **kwargs):
+    imagem = Imagem.de_array(pixels)
+    getattr(imagem, 'operador_' + operacao)(
+        Imagem.de_array(secundaria), **kwargs
+    )
+    return imagem
+
+
+@pytest.mark.parametrize('operacao', sorted(ESPERADOS))
+def test_operador_igual_numpy(operacao):
+    resultado = _operar(
+        TONS_A.astype(numpy.uint8), TONS_B.astype(numpy.uint8), operacao
+    ).pixels
+    assert resultado.dtype == numpy.uint8
+    numpy.testing.assert_array_equal(
+        resultado, ESPERADOS[operacao](TONS_A, TONS_B)
+    )
+
+
+def test_saturacao():
+    a = numpy.array([[250, 10, 255, 0]], dtype=numpy.uint8)
+    b = numpy.array([[10, 250, 255, 255]], dtype=numpy.uint8)
+    assert _operar(a, b, 'soma').pixels.tolist() == [[255, 255, 255, 255]]
+    assert _operar(a, b, 'subtracao').pixels.tolist() == [[240, 0, 0, 0]]
+    assert _operar(a, b, 'diferenca').pixels.tolist() == [[240, 240, 0, 255]]
+    assert _operar(a, b, 'multiplicacao').pixels.tolist() == [[10, 10, 255, 0]]
+
+
+def test_operador_not(pixels_rgb):
+    tons = TONS_A.astype(numpy.uint8)
+    imagem = Imagem.de_array(tons)
+    imagem.operador_not()
+    numpy.testing.assert_array_equal(imagem.pixels, 255 - TONS_A)
+
+    imagem = Imagem.de_array(pixels_rgb)
+    imagem.operador_not(Imagem.de_array(pixels_rgb))
+    assert imagem.modo == 'L'
+    numpy.testing.assert_array_equal(imagem.pixels, 255 - pixels_rgb[..., 0])
+
+
+def operar_direto(primaria, secundaria, operacao, x, y):
+    """
+    Posiciona o canto superior esquerdo da secundária em (x, y) da primária
+    e aplica a operação pixel a pixel onde as duas se sobrepõem.
+    """
+    esperado = primaria.astype(numpy.int64)
+    for linha in range(primaria.shape[0]):
+        for coluna in range(primaria.shape[1]):
+            linha_secundaria, coluna_secundaria = linha - y, coluna - x
+            if (0 <= linha_secundaria < secundaria.shape[0] and
+                    0 <= coluna_secundaria < secundaria.shape[1]):
+                esperado[linha, coluna] = ESPERADOS[operacao](
+                    esperado[linha, coluna],
+                    int(secundaria[linha_secundaria, coluna_secundaria])
+                )
+    return esperado
+
+
+def _posicao(primaria, secundaria, alinhamento):
+    """
+    Canto superior esquerdo da secundária sem deslocamento.
+    """
+    sobra_y = primaria.shape[0] - secundaria.shape[0]
+    sobra_x = primaria.shape[1] - secundaria.shape[1]
+    return {
+        'superior_esquerdo': (0, 0),
+        'centro': (sobra_x // 2, sobra_y // 2),
+        'inferior_direito': (sobra_x, sobra_y),
+    }[alinhamento]
+
+
+@pytest.mark.parametrize('forma_secundaria', [(9, 13), (23, 31), (40, 45)])
+@pytest.mark.parametrize('alinhamento', [
+    'superior_esquerdo', 'centro', 'inferior_direito',
+])
+@pytest.mark.parametrize('deslocamento', [(0, 0), (5, -3), (-7, 4)])
+def test_sobreposicao(pixels, forma_secundaria, alinhamento, deslocamento):
+    secundaria = numpy.random.default_rng(3).integers(
+        0, 256, forma_secundaria, dtype=numpy.uint8
+    )
+    x, y = _posicao(pixels, secundaria, alinhamento)
+    esperado = operar_direto(
+        pixels, secundaria, 'soma', x + deslocamento[0], y + deslocamento[1]
+    )
+    resultado = _operar(
+        pixels, secundaria, 'soma', deslocamento=deslocamento,
+        alinhamento=alinhamento
+    ).pixels
+    numpy.testing.assert_array_equal(resultado, esperado)
+
+
+@pytest.mark.parametrize('deslocamento', [(31, 0), (0, -23), (-100, 100)])
+def test_sem_sobreposicao_mantem_a_imagem(pixels, deslocamento):
+    resultado = _operar(
+        pixels, pixels, 'soma', deslocamento=deslocamento
+    ).pixels
+    numpy.testing.assert_array_equal(resultado, pixels)
+
+
+def test_rgb_com_cinza(pixels, pixels_rgb):
+    secundaria = pixels[:11, :17]
+    imagem = _operar(pixels_rgb, secundaria, 'diferenca', alinhamento='centro')
+    assert imagem.modo == 'L'
+    x, y = _posicao(pixels_rgb, secundaria, 'centro')
+    numpy.testing.assert_array_equal(
+        imagem.pixels,
+        operar_direto(pixels_rgb[..., 0], secundaria, 'diferenca', x, y)
+    )
+
+    imagem = _operar(pixels, pixels_rgb[5:, 3:], 'maximo',
+                     alinhamento='inferior_direito')
+    numpy.testing.assert_array_equal(
+        imagem.pixels,
+        operar_direto(pixels, pixels_rgb[5:, 3:, 0], 'maximo', 3, 5)
+    )
+
+
+def test_alinhamento_invalido(pixels):
+    with pytest.raises(ValueError):
+        _operar(pixels, pixels, 'soma', alinhamento='meio')
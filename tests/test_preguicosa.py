@@ -0,0 +1,99 @@
+#-*- coding: utf-8 -*-
+"""
+Testes do modo preguiçoso: as operações ficam pendentes até `computar` e o
+resultado é o mesmo do modo imediato.
+"""
+import numpy
+import pytest
+
+from core import Imagem, OperacaoCancelada
+
+
+def _operar(pixels, operacoes, preguicosa):
+    imagem = Imagem.de_array(pixels)
+    imagem.preguicosa = preguicosa
+    for nome, args in operacoes:
+        getattr(imagem, nome)(*args)
+    if preguicosa:
+        imagem.computar()
+    return imagem.pixels
+
+
+def test_operacoes_ficam_pendentes(pixels_rgb):
+    imagem = Imagem.de_array(pixels_rgb)
+    imagem.preguicosa = True
+    imagem.converter_escala_cinza()
+    imagem.aplicar_filtro('sobel_convolucao')
+    assert imagem.modo == 'RGB'
+    numpy.testing.assert_array_equal(imagem.pixels, pixels_rgb)
+
+    imagem.computar()
+    assert imagem.modo == 'L'
+    assert imagem._pendentes == []
+
+
+@pytest.mark.parametrize('operacoes', [
+    [('converter_escala_cinza', ()), ('equalizar_imagem', ())],
+    [('converter_escala_cinza', ()), ('limiarizar', (100,))],
+    [('equalizar_imagem', ()), ('aplicar_tabela', (
+        numpy.arange(256, dtype=numpy.uint8)[::-1],
+    )), ('limiarizar', (90,))],
+    [('converter_escala_cinza', ()), ('equalizar_imagem', ()),
+     ('aplicar_filtro', ('sobel_convolucao',)), ('limiarizar', (60,))],
+])
+def test_preguicosa_igual_imediata(pixels_rgb, operacoes):
+    numpy.testing.assert_array_equal(
+        _operar(pixels_rgb, operacoes, True),
+        _operar(pixels_rgb, operacoes, False)
+    )
+
+
+
+def test_cancelamento_mantem_as_operacoes_restantes(pixels_rgb):
+    operacoes = [
+        ('converter_escala_cinza', ()),
+        ('aplicar_filtro', ('sobel_convolucao',)),
+        ('aplicar_filtro', ('mediana', 1)),
+    ]
+    imagem = Imagem.de_array(pixels_rgb)
+    imagem.preguicosa = True
+    for nome, args in operacoes:
+        getattr(imagem, nome)(*args)
+
+    def cancelar_no_filtro(feitas, total):
+        # Cancela no primeiro ponto de verificação depois da conversão.
+        if imagem.modo == 'L':
+            imagem.cancelar()
+    imagem.ao_progredir = cancelar_no_filtro
+    with pytest.raises(OperacaoCancelada):
+        imagem.computar()
+
+    numpy.testing.assert_array_equal(
+        imagem.pixels, _operar(pixels_rgb, operacoes[:1], False)
+    )
+    assert [nome for nome, _, _ in imagem._pendentes] == [
+        'aplicar_filtro', 'aplicar_filtro'
+    ]
+
+    imagem.ao_progredir = None
+    imagem.computar()
+    assert imagem._pendentes == []
+    numpy.testing.assert_array_equal(
+        imagem.pixels, _operar(pixels_rgb, operacoes, False)
+    )
+
+
+def test_erro_mantem_a_operacao_e_as_seguintes(pixels):
+    imagem = Imagem.de_array(pixels)
+    imagem.preguicosa = True
+    imagem.limiarizar(100)
+    imagem.aplicar_filtro('mediana', tamanho=3)
+    imagem.aplicar_filtro('moda')
+    with pytest.raises(TypeError):
+        imagem.computar()
+    numpy.testing.assert_array_equal(
+        imagem.pixels, _operar(pixels, [('limiarizar', (100,))], False)
+    )
+    assert [args for _, args, _ in imagem._pendentes] == [
+        ('mediana',), ('moda',)
+    ]
@@ -0,0 +1,54 @@
+#-*- coding: utf-8 -*-
+"""
+Andamento e cancelamento das operações longas.
+"""
+import numpy
+import pytest
+
+import core
+from core import Imagem, OperacaoCancelada
+
+FILTROS_CORRELACAO = [
+    'correlacao', 'passa_alta', 'robert_convolucao', 'sobel_convolucao',
+]
+
+
+@pytest.fixture
+def pixels_grandes():
+    return numpy.random.default_rng(3).integers(
+        0, 256, (200, 700), dtype=numpy.uint8
+    )
+
+
+@pytest.mark.parametrize('nome_filtro', FILTROS_CORRELACAO)
+def test_correlacao_por_blocos_igual_inteira(
+        monkeypatch, pixels_grandes, nome_filtro):
+    por_blocos = Imagem.de_array(pixels_grandes)
+    por_blocos.aplicar_filtro(nome_filtro)
+
+    monkeypatch.setattr(core, 'TAMANHO_BLOCO', 2 ** 40)
+    inteira = Imagem.de_array(pixels_grandes)
+    inteira.aplicar_filtro(nome_filtro)
+    numpy.testing.assert_array_equal(por_blocos.pixels, inteira.pixels)
+
+
+@pytest.mark.parametrize('nome_filtro', FILTROS_CORRELACAO + ['gradiente'])
+def test_filtro_informa_andamento(pixels_grandes, nome_filtro):
+    andamento = []
+    imagem = Imagem.de_array(pixels_grandes)
+    imagem.ao_progredir = lambda feitas, total: andamento.append(
+        float(feitas) / total
+    )
+    imagem.aplicar_filtro(nome_filtro)
+    assert andamento
+    assert andamento == sorted(andamento)
+    assert andamento[-1] == 1
+
+
+@pytest.mark.parametrize('nome_filtro', FILTROS_CORRELACAO + ['gradiente'])
+def test_filtro_pode_ser_cancelado(pixels_grandes, nome_filtro):
+    imagem = Imagem.de_array(pixels_grandes)
+    imagem.cancelar()
+    with pytest.raises(OperacaoCancelada):
+        imagem.aplicar_filtro(nome_filtro)
+    numpy.testing.assert_array_equal(imagem.pixels, pixels_grandes)
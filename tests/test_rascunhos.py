@@ -0,0 +1,30 @@
+#-*- coding: utf-8 -*-
+"""
+Testes dos buffers de rascunho reaproveitados entre as operações.
+"""
+import numpy
+
+from core import Imagem, Rascunhos
+
+
+def test_rascunhos_reaproveitam_buffer():
+    rascunhos = Rascunhos()
+    grande = rascunhos.obter('a', (10, 10))
+    pequeno = rascunhos.obter('a', (4, 5))
+    assert numpy.shares_memory(grande, pequeno)
+    assert rascunhos.tamanho_bytes == 100 * 8
+
+    rascunhos.obter('a', (4, 5), numpy.int32)
+    assert rascunhos.tamanho_bytes == 20 * 4
+
+    rascunhos.liberar()
+    assert rascunhos.tamanho_bytes == 0
+
+
+def test_filtro_reaproveita_rascunhos(pixels):
+    imagem = Imagem.de_array(pixels)
+    imagem.aplicar_filtro('correlacao')
+    tamanho = imagem.rascunhos.tamanho_bytes
+    assert tamanho > 0
+    imagem.aplicar_filtro('correlacao')
+    assert imagem.rascunhos.tamanho_bytes == tamanho
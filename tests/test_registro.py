@@ -0,0 +1,209 @@
+#-*- coding: utf-8 -*-
+"""
+Registro dos filtros (core.registro_filtros).
+"""
+import numpy
+import pytest
+
+import core
+from cache import CacheResultados
+from core import (
+    Filtros, Imagem, Mediana, Pontuais, RegistroFiltros, descrever_filtro,
+    registrar_filtros, registro_filtros,
+)
+from fluxo import _dividir_etapas
+
+
+def test_filtros_registrados():
+    assert registro_filtros.nomes() == sorted([
+        'correlacao', 'convolucao', 'passa_alta', 'moda', 'moda7', 'mediana',
+        'mediana7', 'robert_convolucao', 'sobel_convolucao',
+        'prewitt_convolucao', 'gradiente', 'media_janela', 'variancia',
+        'desvio_padrao', 'minimo_local', 'maximo_local', 'gama',
+    ])
+    assert registro_filtros.obter('mediana').classe is Mediana
+    assert registro_filtros.obter('inexistente') is None
+    assert 'sobel_convolucao' in registro_filtros
+
+
+def test_nome_repetido_e_recusado():
+    registro = RegistroFiltros()
+    registro.registrar(registro_filtros.obter('mediana'))
+    with pytest.raises(ValueError, match='já registrado'):
+        registro.registrar(registro_filtros.obter('mediana'))
+
+
+def test_registrar_filtros_ignora_herdados(monkeypatch):
+    registro = RegistroFiltros()
+    monkeypatch.setattr('core.registro_filtros', registro)
+
+    @registrar_filtros
+    class Negativo(Filtros):
+
+        @descrever_filtro()
+        def negativo(self):
+            self._gravar(255 - self._get_canal(), 0)
+
+    assert registro.nomes() == ['negativo']
+    assert registro.obter('negativo').raio == 1
+
+
+@pytest.mark.parametrize('args, kwargs', [
+    (('mediana',), {'raio': 4}),
+    (('mediana', 4), {}),
+    ((), {'nome_filtro': 'mediana', 'raio': 4, 'processos': 3}),
+])
+def test_vincular(args, kwargs):
+    descricao, parametros = registro_filtros.vincular(args, kwargs)
+    assert descricao.nome == 'mediana'
+    assert parametros == {'raio': 4}
+    assert descricao.get_margem(**parametros) == 4
+
+
+@pytest.mark.parametrize('nome_filtro, margem', [
+    ('correlacao', 1), ('passa_alta', 2), ('moda', 2), ('moda7', 3),
+    ('mediana7', 3), ('robert_convolucao', 2), ('sobel_convolucao', 2),
+    ('gradiente', 1), ('media_janela', 2),
+])
+def test_margens_padrao(nome_filtro, margem):
+    assert registro_filtros.obter(nome_filtro).raio == margem
+
+
+def test_argumentos_invalidos_sao_recusados():
+    with pytest.raises(TypeError):
+        registro_filtros.vincular(('mediana',), {'tamanho': 3})
+
+
+def test_filtro_desconhecido_nao_altera_a_imagem(pixels):
+    imagem = Imagem.de_array(pixels)
+    imagem.aplicar_filtro('inexistente')
+    assert (imagem.pixels == pixels).all()
+
+
+@pytest.mark.parametrize('nome_filtro, pontual, separavel, no_lugar', [
+    ('mediana', False, False, False),
+    ('correlacao', False, False, False),
+    ('sobel_convolucao', False, True, False),
+    ('prewitt_convolucao', False, True, False),
+    ('media_janela', False, True, False),
+    ('gama', True, False, True),
+])
+def test_caracteristicas(nome_filtro, pontual, separavel, no_lugar):
+    descricao = registro_filtros.obter(nome_filtro)
+    assert (descricao.pontual, descricao.separavel, descricao.no_lugar) == (
+        pontual, separavel, no_lugar
+    )
+
+
+def _contar_separacoes(monkeypatch):
+    chamadas = []
+    separar = core._separar
+
+    def contar(matriz):
+        chamadas.append(matriz)
+        return separar(matriz)
+    monkeypatch.setattr(core, '_separar', contar)
+    return chamadas
+
+
+@pytest.mark.parametrize('nome_filtro, separa', [
+    ('correlacao', False), ('passa_alta', False), ('robert_convolucao', False),
+    ('sobel_convolucao', True), ('prewitt_convolucao', True),
+])
+def test_caminho_separavel_so_nos_filtros_separaveis(
+        monkeypatch, pixels, nome_filtro, separa):
+    chamadas = _contar_separacoes(monkeypatch)
+    Imagem.de_array(pixels).aplicar_filtro(nome_filtro)
+    assert bool(chamadas) == separa
+
+
+def test_gama():
+    tons = numpy.arange(256, dtype=numpy.uint8)
+    imagem = Imagem.de_array(tons.reshape(16, 16))
+    imagem.aplicar_filtro('gama', 0.5)
+    esperado = numpy.rint(255 * (tons / 255.0) ** 0.5).astype(numpy.uint8)
+    numpy.testing.assert_array_equal(imagem.pixels.ravel(), esperado)
+    numpy.testing.assert_array_equal(Pontuais.get_tabela('gama'), tons)
+    with pytest.raises(ValueError):
+        Pontuais.get_tabela('gama', gama=0)
+
+
+def test_filtro_no_lugar_nao_aloca_saida(pixels):
+    imagem = Imagem.de_array(pixels)
+    antes = imagem.pixels
+    imagem.aplicar_filtro('gama', gama=2.0)
+    assert imagem.pixels is antes
+    assert not numpy.array_equal(imagem.pixels, pixels)
+
+
+def test_filtro_no_lugar_em_faixas_usa_so_a_entrada(monkeypatch, pixels):
+    criadas = []
+    compartilhada = core.shared_memory.SharedMemory
+
+    def criar(*args, **kwargs):
+        memoria = compartilhada(*args, **kwargs)
+        if kwargs.get('create'):
+            criadas.append(memoria.name)
+        return memoria
+    monkeypatch.setattr(core.shared_memory, 'SharedMemory', criar)
+
+    esperado = Imagem.de_array(pixels)
+    esperado.aplicar_filtro('gama', gama=0.5)
+    for nome_filtro, kwargs, quantidade in [
+        ('gama', {'gama': 0.5}, 1), ('mediana', {'raio': 1}, 2)
+    ]:
+        del criadas[:]
+        imagem = Imagem.de_array(pixels)
+        imagem.aplicar_filtro(nome_filtro, processos=2, **kwargs)
+        assert len(criadas) == quantidade
+    imagem = Imagem.de_array(pixels)
+    imagem.aplicar_filtro('gama', gama=0.5, processos=2)
+    numpy.testing.assert_array_equal(imagem.pixels, esperado.pixels)
+
+
+def test_filtro_pontual_e_fundido(monkeypatch, pixels_rgb):
+    operacoes = [
+        ('converter_escala_cinza', (), {}),
+        ('aplicar_filtro', ('gama', 0.5), {}),
+        ('equalizar_imagem', (), {}),
+        ('aplicar_filtro', ('gama',), {'gama': 1.5}),
+        ('limiarizar', (100,), {}),
+    ]
+    esperado = Imagem.de_array(pixels_rgb)
+    for nome, args, kwargs in operacoes:
+        getattr(esperado, nome)(*args, **kwargs)
+
+    fundidas = []
+    computar_pontuais = Imagem._computar_pontuais
+    monkeypatch.setattr(
+        Imagem, '_computar_pontuais',
+        lambda imagem, lote: fundidas.append(len(lote)) or
+        computar_pontuais(imagem, lote)
+    )
+    monkeypatch.setattr(Pontuais, 'gama', None)
+    imagem = Imagem.de_array(pixels_rgb)
+    imagem.preguicosa = True
+    for nome, args, kwargs in operacoes:
+        getattr(imagem, nome)(*args, **kwargs)
+    imagem.computar()
+    assert fundidas == [len(operacoes)]
+    numpy.testing.assert_array_equal(imagem.pixels, esperado.pixels)
+
+
+def test_filtro_pontual_nao_usa_o_cache(pixels):
+    cache = CacheResultados()
+    imagem = Imagem.de_array(pixels)
+    imagem.cache = cache
+    imagem.aplicar_filtro('gama', gama=0.5)
+    imagem.aplicar_filtro('mediana')
+    assert (cache.acertos, cache.falhas) == (0, 1)
+
+
+def test_filtro_pontual_nao_separa_etapas():
+    equalizar = ('equalizar_imagem', (), {})
+    assert len(_dividir_etapas([
+        ('aplicar_filtro', ('gama', 0.5), {}), equalizar
+    ])) == 1
+    assert len(_dividir_etapas([
+        ('aplicar_filtro', ('sobel_convolucao',), {}), equalizar
+    ])) == 2
@@ -0,0 +1,143 @@
+#-*- coding: utf-8 -*-
+"""
+Operações sobre os tons: equalização, limiarização, conversão para cinza e
+histogramas.
+"""
+from decimal import Decimal
+
+import numpy
+import pytest
+
+from core import Imagem
+
+
+def equalizacao_original(pixels):
+    """
+    Imagem.equalizar_imagem original: probabilidade acumulada dos tons, em
+    ordem, vezes 255, arredondada.
+    """
+    tons, quantidades = numpy.unique(pixels, return_counts=True)
+    novos_tons = {}
+    acumulada = 0
+    for tom, quantidade in zip(tons.tolist(), quantidades.tolist()):
+        acumulada += quantidade / float(pixels.size)
+        novos_tons[tom] = int(Decimal(acumulada * 255).quantize(0))
+    return numpy.vectorize(novos_tons.get)(pixels).astype(numpy.uint8)
+
+
+def test_equalizar_igual_original(pixels):
+    imagem = Imagem.de_array(pixels)
+    imagem.equalizar_imagem()
+    numpy.testing.assert_array_equal(imagem.pixels, equalizacao_original(pixels))
+
+
+def test_equalizar_imagem_constante():
+    imagem = Imagem.de_array(numpy.full((3, 4), 7, dtype=numpy.uint8))
+    imagem.equalizar_imagem()
+    assert (imagem.pixels == 255).all()
+
+
+def test_equalizar_rgb_usa_o_plano_de_cinza(pixels_rgb):
+    imagem = Imagem.de_array(pixels_rgb)
+    imagem.equalizar_imagem()
+    assert imagem.modo == 'L'
+    numpy.testing.assert_array_equal(
+        imagem.pixels, equalizacao_original(pixels_rgb[..., 0])
+    )
+
+
+@pytest.mark.parametrize('limiar', [0, 128, 255])
+def test_limiarizar(pixels, limiar):
+    imagem = Imagem.de_array(pixels)
+    imagem.limiarizar(limiar)
+    numpy.testing.assert_array_equal(
+        imagem.pixels, numpy.where(pixels >= limiar, 255, 0)
+    )
+
+
+def _cinza(pixels_rgb, padrao, **kwargs):
+    imagem = Imagem.de_array(pixels_rgb.copy())
+    imagem.converter_escala_cinza(padrao, **kwargs)
+    assert imagem.modo == 'L'
+    return imagem.pixels.astype(numpy.int64)
+
+
+@pytest.mark.parametrize('no_lugar', [False, True])
+def test_cinza_classico(pixels_rgb, no_lugar):
+    # Pesos 0.3, 0.59 e 0.11 com truncamento, em contas exatas.
+    r, g, b = numpy.moveaxis(pixels_rgb.astype(numpy.int64), -1, 0)
+    numpy.testing.assert_array_equal(
+        _cinza(pixels_rgb, 'classico', no_lugar=no_lugar),
+        (30 * r + 59 * g + 11 * b) // 100
+    )
+
+
+@pytest.mark.parametrize('padrao, pesos', [
+    ('bt601', (0.299, 0.587, 0.114)),
+    ('bt709', (0.2126, 0.7152, 0.0722)),
+    ('media', (1 / 3.0, 1 / 3.0, 1 / 3.0)),
+])
+def test_cinza_ponderado(pixels_rgb, padrao, pesos):
+    esperado = numpy.dot(pixels_rgb.astype(numpy.float64), pesos)
+    assert numpy.abs(_cinza(pixels_rgb, padrao) - esperado).max() <= 0.51
+
+
+def test_cinza_luminosidade(pixels_rgb):
+    maior = pixels_rgb.max(axis=-1).astype(numpy.int64)
+    menor = pixels_rgb.min(axis=-1).astype(numpy.int64)
+    numpy.testing.assert_array_equal(
+        _cinza(pixels_rgb, 'luminosidade'), (maior + menor + 1) // 2
+    )
+
+
+def test_cinza_padrao_invalido(pixels_rgb):
+    with pytest.raises(ValueError):
+        Imagem.de_array(pixels_rgb).converter_escala_cinza('sepia')
+
+
+def test_cinza_de_imagem_cinza(pixels):
+    imagem = Imagem.de_array(pixels)
+    imagem.converter_escala_cinza()
+    numpy.testing.assert_array_equal(imagem.pixels, pixels)
+
+
+def test_contagens_por_canal(pixels, pixels_rgb):
+    contagens = Imagem.de_array(pixels_rgb).get_contagens_canais()
+    assert contagens.shape == (3, 256)
+    for canal in range(3):
+        numpy.testing.assert_array_equal(
+            contagens[canal],
+            numpy.bincount(pixels_rgb[..., canal].ravel(), minlength=256)
+        )
+    numpy.testing.assert_array_equal(
+        Imagem.de_array(pixels).get_contagens(),
+        numpy.bincount(pixels.ravel(), minlength=256)
+    )
+
+
+def test_histograma(pixels_rgb):
+    histograma = Imagem.de_array(pixels_rgb).get_histograma(canal=1)
+    tons, quantidades = numpy.unique(pixels_rgb[..., 1], return_counts=True)
+    assert histograma == dict(zip(tons.tolist(), quantidades.tolist()))
+
+
+@pytest.mark.parametrize('alterar', [
+    lambda imagem: imagem.aplicar_filtro('mediana'),
+    lambda imagem: imagem.aplicar_filtro('sobel_convolucao'),
+    lambda imagem: imagem.equalizar_imagem(),
+    lambda imagem: imagem.limiarizar(),
+    lambda imagem: imagem.converter_rgb(),
+    lambda imagem: setattr(imagem, 'pixels', imagem.pixels[::-1].copy()),
+])
+def test_contagens_sao_refeitas_quando_os_pixels_mudam(pixels, alterar):
+    imagem = Imagem.de_array(pixels)
+    contagens = imagem.get_contagens_canais()
+    assert imagem.get_contagens_canais() is contagens
+    alterar(imagem)
+    esperado = numpy.stack([
+        numpy.bincount(canal.ravel(), minlength=256)
+        for canal in numpy.moveaxis(imagem.pixels.reshape(
+            imagem.altura, imagem.largura, -1
+        ), -1, 0)
+    ])
+    numpy.testing.assert_array_equal(imagem.get_contagens_canais(), esperado)